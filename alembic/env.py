@@ -8,8 +8,9 @@ from src.core.constants import DB_NAME, DB_HOST, DB_PORT, DB_USER, DB_PASS
 from src.core.db import Base
 
 from src.models.email_codes import EmailCode
+from src.models.jobs import Job
 from src.models.users import User, Log, Feedback
-from src.models.logistic import Stop, Tpu, Atp, Route, Section, Chart, Traffic, Timetable
+from src.models.logistic import Stop, Tpu, Atp, Route, Section, Chart, Traffic, Timetable, NetworkRevision
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,33 @@
+"""added jobs owner and key
+
+Revision ID: 2f6c9a4e7b15
+Revises: 8e4b2d6f1a37
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2f6c9a4e7b15'
+down_revision: Union[str, None] = '8e4b2d6f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('jobs', sa.Column('key', sa.String(), nullable=True))
+    op.add_column('jobs', sa.Column('owner', sa.String(), nullable=True))
+    op.add_column('jobs', sa.Column('cancel_requested', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index('ix_jobs_active_key', 'jobs', ['key'], unique=True,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_active_key', table_name='jobs', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.drop_column('jobs', 'cancel_requested')
+    op.drop_column('jobs', 'owner')
+    op.drop_column('jobs', 'key')
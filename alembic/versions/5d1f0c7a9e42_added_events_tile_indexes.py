@@ -0,0 +1,38 @@
+"""added events tile indexes
+
+Revision ID: 5d1f0c7a9e42
+Revises: 3b35b650c1a1
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f0c7a9e42'
+down_revision: Union[str, None] = '3b35b650c1a1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('events', sa.Column('tile', sa.Integer(), nullable=True))
+    # Ключи тайлов существующих событий (масштаб 14, как src.utils.tiles.TILE_ZOOM)
+    op.execute("""
+        UPDATE events SET tile =
+            LEAST(GREATEST(FLOOR((1 - LN(TAN(RADIANS(LEAST(GREATEST(lat, -85.05112878), 85.05112878)))
+                                     + 1 / COS(RADIANS(LEAST(GREATEST(lat, -85.05112878), 85.05112878)))) / PI())
+                                 / 2 * 16384), 0), 16383)::integer * 16384
+            + LEAST(GREATEST(FLOOR((lon + 180) / 360 * 16384), 0), 16383)::integer
+    """)
+    op.create_index(op.f('ix_events_tile'), 'events', ['tile'], unique=False)
+    op.create_index('ix_events_moderated_created_at', 'events', ['moderated', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_events_moderated_created_at', table_name='events')
+    op.drop_index(op.f('ix_events_tile'), table_name='events')
+    op.drop_column('events', 'tile')
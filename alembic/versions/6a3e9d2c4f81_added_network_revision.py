@@ -0,0 +1,30 @@
+"""added network revision
+
+Revision ID: 6a3e9d2c4f81
+Revises: 2f6c9a4e7b15
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6a3e9d2c4f81'
+down_revision: Union[str, None] = '2f6c9a4e7b15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    network_revision = op.create_table('network_revision',
+                                       sa.Column('id', sa.Integer(), nullable=False),
+                                       sa.Column('revision', sa.Integer(), nullable=False),
+                                       sa.PrimaryKeyConstraint('id'))
+    op.bulk_insert(network_revision, [{'id': 1, 'revision': 0}])
+
+
+def downgrade() -> None:
+    op.drop_table('network_revision')
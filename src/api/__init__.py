@@ -5,6 +5,7 @@ from src.api.auth import auth_router
 from src.api.email_verification import email_router
 from src.api.events import events_router
 from src.api.feedback import feedback_router
+from src.api.live import live_router
 from src.api.navigation import navigation_router
 from src.api.stops import stops_router
 from src.api.model_predict import predict_router
@@ -33,7 +34,8 @@ all_routers = [
     email_router,
     feedback_router,
     predict_router,
-    events_router
+    events_router,
+    live_router
 ]
 
 for router in all_routers:
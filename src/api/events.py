@@ -1,6 +1,6 @@
 from typing import Optional
 
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.db import db_async_client
@@ -27,14 +27,26 @@ async def create_event(data: EventWrited, token: str = Header(...), session: Asy
 
 
 @events_router.get("/all")
-async def get_all_stops(token: Optional[str] = Header(None), session: AsyncSession = db_async_client):
+async def get_all_stops(min_lat: Optional[float] = None, min_lon: Optional[float] = None,
+                        max_lat: Optional[float] = None, max_lon: Optional[float] = None,
+                        zoom: Optional[int] = Query(None, ge=0, le=20),
+                        token: Optional[str] = Header(None), session: AsyncSession = db_async_client):
     """
-    Передает список всех дорожных событий
+    Передает список дорожных событий, по умолчанию - во всем городе
+    :param min_lat: южная граница видимой области карты
+    :param min_lon: западная граница видимой области карты
+    :param max_lat: северная граница видимой области карты
+    :param max_lon: восточная граница видимой области карты
+    :param zoom: масштаб карты; если задан, ответ имеет вид {"events": [...], "clusters": [{"lat", "lon", "count"}]}
     :param token: Авторизационный токен пользователя
     :param session: Сессия БД
     :return: Список моделей дорожных событий
     """
-    events = await EventsService.get_all_events(session, token)
+    bounds = (min_lat, min_lon, max_lat, max_lon)
+    if any(bound is None for bound in bounds) and any(bound is not None for bound in bounds):
+        raise HTTPException(400, detail="Область карты задается всеми четырьмя границами")
+    bbox = bounds if min_lat is not None else None
+    events = await EventsService.get_all_events(session, token, bbox, zoom)
     return events
 
 
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import traceback
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from src.core.constants import LIVE_PING_INTERVAL
+from src.services.broadcast import BroadcastService
+from src.services.simulation import SimulationService
+from src.utils.security import decode_token
+
+live_router = APIRouter(
+    prefix="/live",
+    tags=["Живой канал"],
+)
+
+TOPICS = ('events', 'transport')
+
+
+@live_router.get("")
+async def live(request: Request, topics: str = 'events,transport', routes: Optional[str] = None,
+               token: Optional[str] = Header(None)) -> StreamingResponse:
+    """
+    Поток Server-Sent Events вместо периодических запросов /events/all и /codd/transport.
+    События: events - {"op": "upsert", "event": {...}} или {"op": "remove", "id"};
+    transport - {"route_id", "vehicles": [...]} в формате ЦОДД;
+    resync - клиент не успевал читать поток, нужно заново запросить полные данные
+    :param request: запрос
+    :param topics: темы через запятую: events, transport
+    :param routes: айди маршрутов через запятую для позиций транспорта (по умолчанию все)
+    :param token: Авторизационный токен пользователя (для его собственных событий на модерации)
+    :return: поток text/event-stream
+    """
+    wanted = [topic for topic in topics.split(',') if topic]
+    if not wanted or any(topic not in TOPICS for topic in wanted):
+        raise HTTPException(400, detail="Темы: " + ", ".join(TOPICS))
+    try:
+        route_ids = [int(route_id) for route_id in routes.split(',') if route_id] if routes else None
+    except ValueError:
+        raise HTTPException(400, detail="Маршруты задаются айди через запятую")
+
+    user_id = None
+    if token:
+        try:
+            user_id = decode_token(token)["sub"]
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.warning(msg)
+
+    async def stream():
+        subscription = BroadcastService.subscribe(wanted, route_ids, user_id)
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    yield await asyncio.wait_for(subscription.queue.get(), timeout=LIVE_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            BroadcastService.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@live_router.get("/stats", summary="Метрики живого канала")
+def live_stats() -> dict:
+    """
+    Возвращает число подписчиков живого канала, размер их очередей и состояние тактов движения транспорта
+    """
+    return {**BroadcastService.stats(), "simulation": SimulationService.stats()}
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException
-from src.schemas.prediction import PredictionInput
+from src.schemas.prediction import PredictionInput, PredictionBatchInput
 from src.services.model_prediction import MlService
 from typing import Union
 
@@ -60,4 +60,33 @@ def predict_passenger_count(request: PredictionInput) -> dict:
         "predicted_passengers_current": current_pred,
         "accumulated_passengers": round(total_passengers, 2),
         "load_level_0_5": load_level
-    }
\ No newline at end of file
+    }
+
+
+@predict_router.post("/batch", summary="Пакетное предсказание загруженности")
+def predict_passenger_batch(request: PredictionBatchInput) -> dict:
+    """
+    Возвращает предсказания для списка поездок и/или для всех остановок
+    маршрута во временном окне одним запросом.
+
+    Для каждой поездки учитывает вход с предыдущей остановки, как и одиночный запрос.
+
+    ---
+    Пример запроса:
+    {
+      "route_id": 163,
+      "time_from": "07:00:00",
+      "time_to": "09:00:00",
+      "step": 30,
+      "day_of_week": "Пятница"
+    }
+    """
+    return MlService.predict_batch(request)
+
+
+@predict_router.get("/model", summary="Сведения о загруженной модели")
+def model_info() -> dict:
+    """
+    Возвращает время загрузки модели и занимаемую ей память
+    """
+    return MlService.model_info()
@@ -1,12 +1,13 @@
 from datetime import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import APIRouter, Depends, Header, Query, Response
 
-from src.core.db import db_async_client
 from src.schemas.navigation import RouteReport
 from src.services.navigation import NavigationService
+from src.services.navigation_cache import NavigationCacheService
+from src.services.network import NetworkService
+from src.utils.responses import negotiate, render
 
 navigation_router = APIRouter(
     prefix="/navigation",
@@ -19,10 +20,12 @@ def get_current_time() -> int:
     return current_time.hour * 60 + current_time.minute
 
 
-@navigation_router.get("/")
+@navigation_router.get("/", response_model=RouteReport)
 async def create_routes(from_id: int, to_id: int, care: bool, change: bool, priority: int,
-                        time: Optional[int] = None, current_time=Depends(get_current_time),
-                        session: AsyncSession = db_async_client) -> RouteReport:
+                        time: Optional[int] = None, transfers: int = 1,
+                        geometry: Literal['json', 'polyline', 'delta'] = 'json',
+                        accept: Optional[str] = Header(None),
+                        current_time=Depends(get_current_time)) -> Response:
     """
     Обрабатывает запрос на построение маршрута
     :param from_id: начальная остановка
@@ -31,14 +34,79 @@ async def create_routes(from_id: int, to_id: int, care: bool, change: bool, prio
     :param change: делать ли пересадки?
     :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
     :param time: время отправления
+    :param transfers: максимальное число пересадок
+    :param geometry: формат линий маршрутов stops: json - список точек, polyline - строка Google Encoded Polyline,
+    delta - [широта, долгота, Δширота, Δдолгота, ...] в 10^-6 градуса
+    :param accept: application/msgpack - ответ в формате MessagePack
     :param current_time: текущее время
-    :param session: сессия БД
     :return: json-модель маршрута
     """
 
     if time is None:
         time = current_time
 
-    route_report = await NavigationService().create_routes(from_id, to_id, care, change, priority, time,
-                                                           session)
-    return route_report
+    async def compute():
+        route_report = await NavigationService().create_routes(from_id, to_id, care, change, priority, time,
+                                                               transfers)
+        # Геометрия уже сериализована в снимке сети, поэтому ответ не проходит повторную валидацию
+        response = render(route_report, accept, geometry)
+        return response.body, response.media_type
+
+    key = NavigationCacheService.key(from_id, to_id, care, change, priority, time, transfers, geometry,
+                                     negotiate(accept))
+    _, body, media_type = await NavigationCacheService.get_or_compute(key, compute)
+    return Response(content=body, media_type=media_type)
+
+
+@navigation_router.get("/coords", response_model=RouteReport)
+async def create_routes_by_coords(from_lat: float, from_lon: float, to_lat: float, to_lon: float, care: bool,
+                                  change: bool, priority: int, time: Optional[int] = None, transfers: int = 1,
+                                  geometry: Literal['json', 'polyline', 'delta'] = 'json',
+                                  k: int = Query(3, gt=0, le=10), radius: float = Query(1000, gt=0, le=5000),
+                                  accept: Optional[str] = Header(None),
+                                  current_time=Depends(get_current_time)) -> Response:
+    """
+    Обрабатывает запрос на построение маршрута между точками на карте
+    :param from_lat: широта точки отправления
+    :param from_lon: долгота точки отправления
+    :param to_lat: широта точки прибытия
+    :param to_lon: долгота точки прибытия
+    :param care: только низкопольный пс?
+    :param change: делать ли пересадки?
+    :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
+    :param time: время отправления
+    :param transfers: максимальное число пересадок
+    :param geometry: формат линий маршрутов stops, как в основном запросе
+    :param k: число ближайших остановок для каждой точки
+    :param radius: максимальное расстояние от точки до остановки в метрах
+    :param accept: application/msgpack - ответ в формате MessagePack
+    :param current_time: текущее время
+    :return: json-модель маршрута
+    """
+
+    if time is None:
+        time = current_time
+
+    async def compute():
+        route_report = await NavigationService().create_routes_by_coords(from_lat, from_lon, to_lat, to_lon, care,
+                                                                         change, priority, time, transfers, k,
+                                                                         radius)
+        response = render(route_report, accept, geometry)
+        return response.body, response.media_type
+
+    # Точки, привязанные к одним и тем же остановкам, используют общий ответ из кэша
+    network = NetworkService.get()
+    stops_from = NavigationService.snap_stops(from_lat, from_lon, k, radius, network)
+    stops_to = NavigationService.snap_stops(to_lat, to_lon, k, radius, network)
+    key = NavigationCacheService.groups_key(stops_from, stops_to, care, change, priority, time, transfers, geometry,
+                                            negotiate(accept))
+    _, body, media_type = await NavigationCacheService.get_or_compute(key, compute)
+    return Response(content=body, media_type=media_type)
+
+
+@navigation_router.get("/cache", summary="Метрики кэша навигации")
+def cache_stats() -> dict:
+    """
+    Возвращает число попаданий и промахов кэша ответов навигации и его объем
+    """
+    return NavigationCacheService.stats()
@@ -1,10 +1,11 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Header
+from fastapi import APIRouter, Header, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.db import db_async_client
-from src.schemas.stop import StopModel
+from src.schemas.stop import StopModel, StopNearby
+from src.services.stop_catalogue import StopCatalogueService
 from src.services.stops import StopService
 
 stops_router = APIRouter(
@@ -14,14 +15,62 @@ stops_router = APIRouter(
 
 
 @stops_router.get("/all", response_model=List[StopModel])
-async def get_all_stops(token: Optional[str] = Header(None), session: AsyncSession = db_async_client):
+async def get_all_stops(token: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None),
+                        session: AsyncSession = db_async_client) -> Response:
     """
-    Передает список всех остановок города
-    :param token: Авторизационный токен пользователя
+    Передает список всех остановок города.
+    Ответ помечается ETag: если каталог не изменился, возвращается 304 без тела
+    :param token: Авторизационный токен пользователя (избранное лучше получать через /stops/likes)
+    :param if_none_match: ETag каталога, который уже есть у клиента
     :param session: Сессия БД
     :return: Список моделей остановок
     """
-    stops = await StopService.get_all_stops(session, token)
+    etag, body = await StopService.get_all_stops(session, token, if_none_match)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@stops_router.get("/delta")
+async def get_stops_delta(since: str) -> Response:
+    """
+    Передает изменения каталога остановок после ревизии since (ETag без кавычек).
+    Если ревизия неизвестна, full = true и в stops передается весь каталог
+    :param since: ревизия каталога, которая уже есть у клиента
+    :return: {"revision": текущая ревизия, "full": bool, "stops": [модели остановок], "removed": [айди]}
+    """
+    body = StopCatalogueService.delta(since)
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-cache"})
+
+
+@stops_router.get("/likes", response_model=List[int])
+async def get_liked_stops(token: str = Header(...), session: AsyncSession = db_async_client):
+    """
+    Передает айди избранных остановок пользователя
+    :param token: Авторизационный токен пользователя
+    :param session: Сессия БД
+    :return: Список айди остановок
+    """
+    stops = await StopService.get_liked_stops(session, token)
+    return stops
+
+
+@stops_router.get("/nearby", response_model=List[StopNearby])
+async def get_nearby_stops(lat: float, lon: float, radius: float = Query(500, gt=0, le=5000),
+                           limit: int = Query(10, gt=0, le=100), token: Optional[str] = Header(None),
+                           session: AsyncSession = db_async_client):
+    """
+    Передает ближайшие к точке остановки
+    :param lat: широта точки
+    :param lon: долгота точки
+    :param radius: радиус поиска в метрах
+    :param limit: максимальное число остановок
+    :param token: Авторизационный токен пользователя
+    :param session: Сессия БД
+    :return: Список моделей остановок с расстоянием в метрах, от ближней к дальней
+    """
+    stops = await StopService.nearby_stops(session, token, lat, lon, radius, limit)
     return stops
 
 
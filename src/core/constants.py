@@ -10,6 +10,36 @@ PORT = int(os.getenv('PORT'))
 VERSION = os.getenv('VERSION')
 API_KEY = os.getenv('API_KEY')
 
+# Загрузка модели при импорте приложения, до форка воркеров
+MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', '0') == '1'
+
+# Кэш ответов навигации: время жизни (сек), число записей, объем (байт), интервал времени отправления (мин)
+NAVIGATION_CACHE_TTL = int(os.getenv('NAVIGATION_CACHE_TTL', 60))
+NAVIGATION_CACHE_SIZE = int(os.getenv('NAVIGATION_CACHE_SIZE', 2000))
+NAVIGATION_CACHE_BYTES = int(os.getenv('NAVIGATION_CACHE_BYTES', 64 * 1024 * 1024))
+NAVIGATION_CACHE_BUCKET = int(os.getenv('NAVIGATION_CACHE_BUCKET', 1))
+
+# Живой канал: размер очереди соединения, период рассылки позиций транспорта и проверки связи (сек)
+LIVE_QUEUE_SIZE = int(os.getenv('LIVE_QUEUE_SIZE', 64))
+LIVE_TRANSPORT_INTERVAL = int(os.getenv('LIVE_TRANSPORT_INTERVAL', 10))
+LIVE_PING_INTERVAL = int(os.getenv('LIVE_PING_INTERVAL', 15))
+
+# Такт пересчета позиций транспорта, сек
+SIMULATION_TICK = float(os.getenv('SIMULATION_TICK', 1))
+
+# Период проверки изменений сети, внесенных другими процессами сервера, сек (0 - не проверять)
+NETWORK_REVISION_INTERVAL = float(os.getenv('NETWORK_REVISION_INTERVAL', 5))
+
+# Время, в течение которого ETag каталога остановок с избранным пользователя проверяется без запроса к БД, сек
+STOP_LIKES_TTL = float(os.getenv('STOP_LIKES_TTL', 30))
+
+# Радиус транспортно-пересадочного узла по умолчанию, м
+TPU_RADIUS = float(os.getenv('TPU_RADIUS', 200))
+
+# Фоновые задачи: число одновременно выполняемых задач и период записи прогресса в БД (сек)
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_PROGRESS_INTERVAL = float(os.getenv('JOB_PROGRESS_INTERVAL', 1))
+
 DB_NAME = os.getenv('DB_NAME')
 DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
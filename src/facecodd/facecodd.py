@@ -1,106 +1,97 @@
+import asyncio
 import logging
 import traceback
-from datetime import timedelta, datetime
 
-from fastapi import APIRouter, HTTPException
-from geopy.distance import distance
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
+from typing import Optional
 
-from src.core.db import db_async_client
-from src.models.logistic import Route, Section, Stop, Chart, Timetable
+from fastapi import APIRouter, Header, HTTPException
 
-codd_router = APIRouter(prefix="/codd", tags=["CODD"])
+from src.core.constants import LIVE_TRANSPORT_INTERVAL
+from src.services.broadcast import BroadcastService, sse
+from src.services.network import NetworkService
+from src.services.simulation import SimulationService
+from src.utils.responses import render
 
+codd_router = APIRouter(prefix="/codd", tags=["CODD"])
 
-def time_to_timedelta(t):
-    return timedelta(hours=t.hour, minutes=t.minute, seconds=t.second, microseconds=t.microsecond)
+# Фоновые задачи процесса (ссылка нужна, чтобы задача не была собрана сборщиком мусора)
+_tasks = set()
 
 
 @codd_router.get("/transport")
-async def transport(route_id: int, session: AsyncSession = db_async_client):
+async def transport(route_id: int, accept: Optional[str] = Header(None)):
     """
-    передает массив тестовых позиций транспорта
+    передает массив тестовых позиций транспорта из текущего кадра движения
     :param route_id: айди маршрута
-    :param session: сессия БД
+    :param accept: application/msgpack - ответ в формате MessagePack
     :return: JSON-в формате ЦОДД
     """
     try:
-        real_time = datetime.now()
-        fact_time = time_to_timedelta(real_time.time())
-
-        s1 = aliased(Section)
-        t1 = aliased(Timetable)
-        stop_table = aliased(Stop)
-        chart_table = aliased(Chart)
-
-        route = await session.get(Route, route_id)
-        full_length = 0.0
-
-        stmt = (select(s1, stop_table, chart_table)
-                .join(stop_table, stop_table.id == s1.stop_id)
-                .join(chart_table, chart_table.id == s1.chart_id, isouter=True)
-                .where(s1.route_id == route_id)
-                .order_by(s1.order))
-        result = await session.execute(stmt)
-        results = result.fetchall()
-
-        points = []
-        # Массив точек маршрута: [0_Широта, 1_Долгота, 2_Навзвание остановки, 3_Длина участка, 4_Пройденный путь]
-        lat1, lon1 = None, None
-
-        for row in results:
-            section, stop, chart = row
-            lat2, lon2 = stop.lat, stop.lon
-            if lat1 is None:
-                lat1, lon1 = lat2, lon2
-            distation = distance((lat1, lon1), (lat2, lon2)).meters
-            full_length += distation
-            points.append((lat2, lon2, stop.name, distation, full_length))
-            lat1, lon1 = lat2, lon2
-            if chart:
-                for i in range(min(len(chart.lats), len(chart.lons))):
-                    lat2, lon2 = chart.lats[i], chart.lons[i]
-                    distation = distance((lat1, lon1), (lat2, lon2)).meters
-                    full_length += distation
-                    points.append((lat2, lon2, stop.name, distation, full_length))
-                    lat1, lon1 = lat2, lon2
+        network = NetworkService.get()
+        if route_id not in network.routes:
+            raise HTTPException(404, detail="Маршрут не найден")
+        return render((await SimulationService.current()).vehicles([route_id]), accept)
+    except HTTPException:
+        raise
+    except Exception as exc:
+        msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+        logging.error(msg)
+        raise HTTPException(500, str(exc))
 
-        stmt = (select(t1).where(t1.route_id == route_id).order_by(t1.start))
-        result = await session.execute(stmt)
-        results = result.fetchall()
-        vehicles = []
 
-        for row in results:
-            timetable = row[0]
-            if time_to_timedelta(timetable.start) < fact_time < time_to_timedelta(timetable.start) + time_to_timedelta(
-                    timetable.lap):
-                coef = (fact_time - time_to_timedelta(timetable.start)) / time_to_timedelta(timetable.lap)
-                real_length = full_length * coef
-                for i in range(len(points) - 1):
-                    if points[i][4] < real_length < points[i + 1][4]:
-                        coef2 = (real_length - points[i][4]) / points[i + 1][3]
-                        lat = points[i][0] + coef2 * (points[i + 1][0] - points[i][0])
-                        lon = points[i][1] + coef2 * (points[i + 1][1] - points[i][1])
-                        stop = points[i][2]
-                        data = [
-                            lat,
-                            lon,
-                            0,
-                            real_time.isoformat(),
-                            "B236PH236",
-                            0,
-                            0,
-                            route.number,
-                            0,
-                            real_time.isoformat(),
-                            stop,
-                            None
-                        ]
-                        vehicles.append(data)
-        return vehicles
+@codd_router.get("/transport/all")
+async def transport_all(routes: Optional[str] = None, accept: Optional[str] = Header(None)):
+    """
+    передает массив тестовых позиций транспорта всех действующих маршрутов
+    :param routes: айди маршрутов через запятую (по умолчанию все действующие)
+    :param accept: application/msgpack - ответ в формате MessagePack
+    :return: JSON-в формате ЦОДД
+    """
+    try:
+        route_ids = None
+        if routes:
+            try:
+                route_ids = [int(route_id) for route_id in routes.split(',') if route_id]
+            except ValueError:
+                raise HTTPException(400, detail="Маршруты задаются айди через запятую")
+        return render((await SimulationService.current()).vehicles(route_ids), accept)
+    except HTTPException:
+        raise
     except Exception as exc:
         msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
         logging.error(msg)
         raise HTTPException(500, str(exc))
+
+
+async def transport_producer() -> None:
+    """
+    Периодически рассылает позиции транспорта подписчикам живого канала.
+    Позиции берутся из текущего кадра движения и сериализуются один раз для всех соединений
+    """
+    while True:
+        await asyncio.sleep(LIVE_TRANSPORT_INTERVAL)
+        try:
+            wanted = BroadcastService.routes('transport')
+            if wanted is not None and not wanted:
+                continue
+            network = NetworkService.get()
+            if wanted is None:
+                route_ids = sorted(route_id for route_id, route in network.routes.items() if route.stage > 0)
+            else:
+                route_ids = sorted(route_id for route_id in wanted if route_id in network.routes)
+            frame = await SimulationService.current()
+            for route_id in route_ids:
+                data = f'{{"route_id":{route_id},"vehicles":[{frame.text(route_id)}]}}'
+                BroadcastService.publish('transport', sse('transport', data), route_id)
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+
+
+def start_transport_producer() -> None:
+    """
+    Запускает рассылку позиций транспорта в цикле событий приложения
+    """
+    task = asyncio.get_running_loop().create_task(transport_producer())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
@@ -5,13 +5,18 @@ from pathlib import Path
 import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
 from src.api import api_router
-from src.core.constants import LOCALHOST_IP, PORT
-from src.facecodd.facecodd import codd_router
+from src.core.constants import LOCALHOST_IP, MODEL_PRELOAD, PORT
+from src.facecodd.facecodd import codd_router, start_transport_producer
+from src.services.jobs import JobService
+from src.services.model_prediction import MlService
+from src.services.network import NetworkService
+from src.services.simulation import SimulationService
 from src.web import web_router
 
 localhost_ip = LOCALHOST_IP
@@ -31,6 +36,7 @@ except FileNotFoundError:
 app = FastAPI()
 app.mount("/static", StaticFiles(directory="static"), name="static")
 app.add_middleware(SessionMiddleware, secret_key=secret_key)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 app.include_router(api_router)
 app.include_router(web_router)
 app.include_router(codd_router)
@@ -43,6 +49,45 @@ logging.basicConfig(
     encoding='utf-8'
 )
 
+if MODEL_PRELOAD:
+    MlService.preload()
+
+
+@app.on_event("startup")
+def load_network():
+    """
+    Загружает снимок транспортной сети в память процесса
+    """
+    NetworkService.reload(publish=False)
+
+
+@app.on_event("startup")
+async def watch_network():
+    """
+    Запускает проверку изменений сети, сохраненных другими процессами сервера
+    """
+    NetworkService.start()
+
+
+@app.on_event("startup")
+def recover_jobs():
+    """
+    Помечает прерванными фоновые задачи, не завершившиеся до перезапуска
+    """
+    try:
+        JobService.recover()
+    except Exception as exc:
+        logging.error(f"Не удалось проверить фоновые задачи: {exc}")
+
+
+@app.on_event("startup")
+async def start_live_feed():
+    """
+    Запускает такты движения транспорта и рассылку позиций живого канала
+    """
+    SimulationService.start()
+    start_transport_producer()
+
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
@@ -0,0 +1,29 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import Column, UUID, String, Text, DateTime, ForeignKey, Float, Boolean, Index, text
+
+from src.core.db import Base
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+    # Ключ исключительности занят, пока задача не завершена, во всех процессах сервера
+    __table_args__ = (Index('ix_jobs_active_key', 'key', unique=True,
+                            postgresql_where=text("status IN ('queued', 'running')")),)
+
+    id: UUID = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    kind: str = Column(String, nullable=False, index=True)
+    status: str = Column(String, nullable=False, default='queued')
+    key: str = Column(String, nullable=True)
+    owner: str = Column(String, nullable=True)
+    cancel_requested: bool = Column(Boolean, nullable=False, default=False)
+    stage: str = Column(String, nullable=True)
+    progress: float = Column(Float, nullable=False, default=0.0)
+    params: str = Column(Text, nullable=True)
+    result: str = Column(Text, nullable=True)
+    error: str = Column(Text, nullable=True)
+    created_at: datetime = Column(DateTime, default=datetime.now, index=True)
+    started_at: datetime = Column(DateTime, nullable=True)
+    finished_at: datetime = Column(DateTime, nullable=True)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
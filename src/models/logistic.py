@@ -122,3 +122,11 @@ class Traffic(Base):
 
     route_id: Mapped[int] = Column(ForeignKey("routes.id", ondelete="CASCADE"), nullable=True, index=True)
     route: Mapped["Route"] = relationship(back_populates="traffics")
+
+
+class NetworkRevision(Base):
+    __tablename__ = "network_revision"
+    # Единственная строка: номер изменения сети, по которому процессы сервера обновляют свои снимки
+
+    id: int = Column(Integer, primary_key=True)
+    revision: int = Column(Integer, nullable=False, default=0)
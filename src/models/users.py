@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime
 from typing import List
 
-from sqlalchemy import Column, UUID, String, Integer, Text, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import Column, UUID, String, Integer, Text, DateTime, ForeignKey, Boolean, Float, Index
 from sqlalchemy.orm import Mapped, relationship
 
 from src.core.db import Base
@@ -61,6 +61,7 @@ class Feedback(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (Index('ix_events_moderated_created_at', 'moderated', 'created_at'),)
 
     id: UUID = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -68,6 +69,8 @@ class Event(Base):
     line: float = Column(Integer, nullable=False)
     lat: float = Column(Float, nullable=False)
     lon: float = Column(Float, nullable=False)
+    # Ключ тайла веб-Меркатора (src.utils.tiles.tile_key) для выборки по области карты
+    tile: int = Column(Integer, nullable=True, index=True)
 
     moderated: bool = Column(Integer, default=0)
     created_at: datetime = Column(DateTime, default=datetime.now)
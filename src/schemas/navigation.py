@@ -41,9 +41,20 @@ class RouteDouble(BaseModel):
     info2: Optional[str]
 
 
+class RouteLeg(RouteSimple):
+    stop_in: str
+    stop_out: str
+
+
+class RouteMulti(BaseModel):
+    load: int
+    legs: List[RouteLeg]
+
+
 class RouteReport(BaseModel):
     result: int
     count: int
     count_simple: int
     simple_routes: List[RouteSimple]
     double_routes: List[RouteDouble]
+    multi_routes: List[RouteMulti] = []
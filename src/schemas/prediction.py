@@ -1,8 +1,20 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
+
 class PredictionInput(BaseModel):
     route_id: int
     order: int
     stop_id: int
     time: str
-    day_of_week: str
\ No newline at end of file
+    day_of_week: str
+
+
+class PredictionBatchInput(BaseModel):
+    items: List[PredictionInput] = []
+    route_id: Optional[int] = None
+    time_from: Optional[str] = None
+    time_to: Optional[str] = None
+    step: int = 15
+    day_of_week: Optional[str] = None
@@ -24,3 +24,7 @@ class StopInput(BaseModel):
 
 class StopUpd(StopInput):
     id: int
+
+
+class StopNearby(StopModel):
+    distance: int
@@ -10,6 +10,7 @@ from sqlalchemy.orm import Session
 from src.models.logistic import Atp, Route
 from src.models.users import Log
 from src.schemas.atp import AtpInput, AtpModel, AtpReport
+from src.services.network import NetworkService
 
 
 class AtpService:
@@ -115,6 +116,7 @@ class AtpService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -0,0 +1,143 @@
+import asyncio
+import json
+from typing import Callable, Dict, Iterable, Optional, Set, Union
+
+from src.core.constants import LIVE_QUEUE_SIZE
+
+# Кадр сообщения: готовый текст или функция, формирующая текст для пользователя (None - не отправлять)
+Frame = Union[str, Callable[[Optional[str]], Optional[str]]]
+
+_subscribers: Set["Subscription"] = set()
+_state = {"loop": None}
+
+
+def sse(event: str, data) -> str:
+    """
+    Кадр Server-Sent Events
+    :param event: тип события
+    :param data: данные (сериализуются в JSON, если это не строка)
+    :return: текст кадра
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+class Subscription:
+    """
+    Подписка одного соединения: ограниченная очередь кадров и фильтры.
+    Если клиент не успевает читать и очередь переполняется, накопленные кадры сбрасываются
+    и клиенту отправляется resync - он должен заново запросить полные данные
+    """
+    __slots__ = ('queue', 'topics', 'routes', 'user_id', 'dropped')
+
+    def __init__(self, topics: Iterable[str], routes: Optional[Iterable[int]], user_id: Optional[str]):
+        """
+        :param topics: темы подписки (events, transport)
+        :param routes: айди маршрутов для позиций транспорта (None - все маршруты)
+        :param user_id: айди пользователя для его собственных событий
+        """
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        self.topics = frozenset(topics)
+        self.routes = frozenset(routes) if routes is not None else None
+        self.user_id = user_id
+        self.dropped = 0
+
+    def push(self, frame: str) -> None:
+        """
+        Кладет кадр в очередь без ожидания
+        """
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(sse('resync', {"dropped": self.dropped}))
+
+
+class BroadcastService:
+    """
+    Рассылка изменений по открытым соединениям процесса: один производитель - много подписчиков
+    """
+
+    @staticmethod
+    def subscribe(topics: Iterable[str], routes: Optional[Iterable[int]] = None,
+                  user_id: Optional[str] = None) -> Subscription:
+        """
+        Регистрирует подписку (вызывается из цикла событий приложения)
+        :return: подписка
+        """
+        _state["loop"] = asyncio.get_running_loop()
+        subscription = Subscription(topics, routes, user_id)
+        _subscribers.add(subscription)
+        return subscription
+
+    @staticmethod
+    def unsubscribe(subscription: Subscription) -> None:
+        _subscribers.discard(subscription)
+
+    @staticmethod
+    def routes(topic: str) -> Optional[Set[int]]:
+        """
+        Маршруты, позиции которых кому-то нужны
+        :param topic: тема
+        :return: None - нужны все маршруты, иначе множество айди (пустое, если подписчиков нет)
+        """
+        wanted = set()
+        for subscription in list(_subscribers):
+            if topic in subscription.topics:
+                if subscription.routes is None:
+                    return None
+                wanted |= subscription.routes
+        return wanted
+
+    @staticmethod
+    def publish(topic: str, frame: Frame, route_id: Optional[int] = None) -> None:
+        """
+        Отправляет кадр подписчикам темы. Можно вызывать из любого потока
+        :param topic: тема
+        :param frame: текст кадра или функция от айди пользователя
+        :param route_id: маршрут, к которому относится кадр
+        """
+        loop = _state["loop"]
+        if loop is None or not _subscribers:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            BroadcastService.deliver(topic, frame, route_id)
+        elif not loop.is_closed():
+            loop.call_soon_threadsafe(BroadcastService.deliver, topic, frame, route_id)
+
+    @staticmethod
+    def deliver(topic: str, frame: Frame, route_id: Optional[int]) -> None:
+        """
+        Раскладывает кадр по очередям подписчиков (в цикле событий приложения)
+        """
+        rendered: Dict[Optional[str], Optional[str]] = {}
+        for subscription in list(_subscribers):
+            if topic not in subscription.topics:
+                continue
+            if route_id is not None and subscription.routes is not None and route_id not in subscription.routes:
+                continue
+            if callable(frame):
+                if subscription.user_id not in rendered:
+                    rendered[subscription.user_id] = frame(subscription.user_id)
+                text = rendered[subscription.user_id]
+            else:
+                text = frame
+            if text is not None:
+                subscription.push(text)
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Число подписчиков и сброшенных из-за переполнения кадров
+        """
+        subscribers = list(_subscribers)
+        return {"subscribers": len(subscribers),
+                "queued": sum(subscription.queue.qsize() for subscription in subscribers),
+                "dropped": sum(subscription.dropped for subscription in subscribers)}
@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from src.models.logistic import Chart
 from src.models.users import Log
 from src.schemas.charts import ChartInput, ChartUpd
+from src.services.network import NetworkService
 
 
 class ChartService:
@@ -44,6 +45,7 @@ class ChartService:
 
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -84,6 +86,7 @@ class ChartService:
 
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -112,6 +115,7 @@ class ChartService:
             db_session.add(log)
 
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
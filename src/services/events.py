@@ -1,17 +1,24 @@
 import logging
 import traceback
-from datetime import date
-from typing import Optional
+from datetime import date, datetime, time, timedelta
+from typing import Optional, Tuple
 
 from fastapi import HTTPException
-from sqlalchemy import insert, select, func, desc
+from sqlalchemy import insert, select, func, desc, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from src.models.users import Event, Log
 from src.schemas.event import EventUpd, EventInput
 from src.schemas.eventwrited import EventWrited
+from src.services.broadcast import BroadcastService, sse
 from src.utils.security import decode_token
+from src.utils.tiles import tile_key, tile_ranges, tile_xy
+
+# Ячейка кластеризации: тайл на CLUSTER_SHIFT уровней мельче масштаба карты (1/8 тайла экрана)
+CLUSTER_SHIFT = 3
+# Минимальное число событий в ячейке, которые объединяются в кластер
+CLUSTER_MIN = 5
 
 
 class EventsService:
@@ -39,10 +46,12 @@ class EventsService:
                 type=data.type,
                 line=data.line,
                 lat=data.lat,
-                lon=data.lon).returning(Event.lat, Event.lon, Event.type, Event.line, Event.moderated, Event.user_id,
-                                        Event.id))
+                lon=data.lon,
+                tile=tile_key(data.lat, data.lon)).returning(Event.lat, Event.lon, Event.type, Event.line, Event.moderated, Event.user_id,
+                                        Event.id, Event.created_at))
             await session.commit()
             event = result.one()
+            EventsService.broadcast(event)
             # print(event)
             return {'lat': event[0], 'lon': event[1], 'type': event[2], 'line': event[3],
                     'moderated': event[4], 'my': bool(str(event[5]) == user_id), 'id': event[6]}
@@ -81,6 +90,7 @@ class EventsService:
             event.line = data.line
             event.lat = data.lat
             event.lon = data.lon
+            event.tile = tile_key(data.lat, data.lon)
             event.moderated = data.moderated
             log = Log(created_ip=ip,
                       level=5,
@@ -89,6 +99,7 @@ class EventsService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            EventsService.broadcast(event)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -117,6 +128,7 @@ class EventsService:
             db_session.add(log)
 
             db_session.commit()
+            BroadcastService.publish('events', sse('events', {"op": "remove", "id": str(id)}))
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -137,6 +149,7 @@ class EventsService:
                           line=data.line,
                           lat=data.lat,
                           lon=data.lon,
+                          tile=tile_key(data.lat, data.lon),
                           moderated=data.moderated)
             log = Log(created_ip=ip,
                       level=5,
@@ -146,6 +159,7 @@ class EventsService:
             db_session.add(log)
             db_session.add(event)
             db_session.commit()
+            EventsService.broadcast(event)
             return {"id": str(event.id), "type": event.type, "line": event.line, "lat": event.lat, "lon": event.lon}
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -153,12 +167,16 @@ class EventsService:
             raise HTTPException(500, str(exc))
 
     @staticmethod
-    async def get_all_events(session: AsyncSession, token: Optional[str]):
+    async def get_all_events(session: AsyncSession, token: Optional[str],
+                             bbox: Optional[Tuple[float, float, float, float]] = None,
+                             zoom: Optional[int] = None):
         """
-        Выбирает из БД все дорожные события в виде JSON-схем
+        Выбирает из БД дорожные события в виде JSON-схем
         :param token: авторизационный токен пользователя
         :param session: сессия БД
-        :return: список остановок
+        :param bbox: видимая область карты (южная широта, западная долгота, северная широта, восточная долгота)
+        :param zoom: масштаб карты; если задан, плотные скопления событий объединяются в кластеры
+        :return: список событий или {"events": [...], "clusters": [...]} при заданном масштабе
         """
         try:
             user_id = None
@@ -168,38 +186,106 @@ class EventsService:
                     user_id = payload["sub"]
                 except Exception as exc:
                     msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-                    print(msg)
+                    logging.warning(msg)
 
-            events = []
-            today = date.today()
+            # Диапазон по created_at вместо func.date(), чтобы работал индекс (moderated, created_at)
+            day_start = datetime.combine(date.today(), time.min)
+            today = (Event.created_at >= day_start) & (Event.created_at < day_start + timedelta(days=1))
+            visible = [Event.moderated == 4, Event.moderated.in_((1, 5)) & today]
             if user_id:
-                result = await session.execute(
-                    select(Event).filter(
-                        (Event.moderated == 4)
-                        | ((Event.moderated == 0) & (func.date(Event.created_at) == today) & (Event.user_id == user_id))
-                        | ((Event.moderated == 2) & (func.date(Event.created_at) == today) & (Event.user_id == user_id))
-                        | ((Event.moderated == 1) & (func.date(Event.created_at) == today))
-                        | ((Event.moderated == 5) & (func.date(Event.created_at) == today))))
-                for event in result.scalars().all():
-                    events.append(
-                        {'id': event.id, 'lat': event.lat, 'lon': event.lon, 'type': event.type, 'line': event.line,
-                         'moderated': event.moderated, 'my': bool(str(event.user_id) == user_id)})
-            else:
-                result = await session.execute(
-                    select(Event).filter(
-                        (Event.moderated == 4)
-                        | ((Event.moderated == 1) & (func.date(Event.created_at) == today))
-                        | ((Event.moderated == 5) & (func.date(Event.created_at) == today))))
-                for event in result.scalars().all():
-                    events.append(
-                        {'id': event.id, 'lat': event.lat, 'lon': event.lon, 'type': event.type, 'line': event.line,
-                         'moderated': event.moderated, 'my': False})
-            return events
+                visible.append(Event.moderated.in_((0, 2)) & today & (Event.user_id == user_id))
+            stmt = select(Event.id, Event.lat, Event.lon, Event.type, Event.line, Event.moderated,
+                          Event.user_id).where(or_(*visible))
+
+            if bbox is not None:
+                min_lat, min_lon, max_lat, max_lon = bbox
+                stmt = stmt.where(Event.lat.between(min_lat, max_lat), Event.lon.between(min_lon, max_lon))
+                ranges = tile_ranges(min_lat, min_lon, max_lat, max_lon)
+                # События без ключа тайла (например, загруженные через COPY) отбираются только по координатам
+                if ranges is not None:
+                    stmt = stmt.where(or_(Event.tile.is_(None),
+                                          *(Event.tile.between(first, last) for first, last in ranges)))
+
+            result = await session.execute(stmt)
+            events = [{'id': row.id, 'lat': row.lat, 'lon': row.lon, 'type': row.type, 'line': row.line,
+                       'moderated': row.moderated, 'my': bool(user_id) and str(row.user_id) == user_id}
+                      for row in result.all()]
+            if zoom is None:
+                return events
+            return EventsService.cluster_events(events, zoom)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
             raise HTTPException(500, str(exc))
 
+    @staticmethod
+    def cluster_events(events: list, zoom: int) -> dict:
+        """
+        Объединяет плотные скопления событий в кластеры по ячейкам сетки тайлов.
+        Собственные события пользователя всегда передаются отдельно
+        :param events: список событий
+        :param zoom: масштаб карты
+        :return: {"events": [...], "clusters": [{"lat", "lon", "count"}]}
+        """
+        cells = {}
+        single = []
+        for event in events:
+            if event['my']:
+                single.append(event)
+            else:
+                cells.setdefault(tile_xy(event['lat'], event['lon'], zoom + CLUSTER_SHIFT), []).append(event)
+
+        clusters = []
+        for cell in cells.values():
+            if len(cell) < CLUSTER_MIN:
+                single.extend(cell)
+                continue
+            clusters.append({'lat': sum(event['lat'] for event in cell) / len(cell),
+                             'lon': sum(event['lon'] for event in cell) / len(cell),
+                             'count': len(cell)})
+        return {'events': single, 'clusters': clusters}
+
+    @staticmethod
+    def is_visible(moderated: int, created_at: Optional[datetime], owner_id, user_id: Optional[str]) -> bool:
+        """
+        Видно ли событие пользователю (те же правила, что в get_all_events)
+        :param moderated: статус модерации
+        :param created_at: время создания
+        :param owner_id: айди автора события
+        :param user_id: айди пользователя или None
+        :return: видно ли событие
+        """
+        today = created_at is not None and created_at.date() == date.today()
+        if moderated == 4:
+            return True
+        if moderated in (1, 5):
+            return today
+        if moderated in (0, 2):
+            return today and bool(user_id) and str(owner_id) == user_id
+        return False
+
+    @staticmethod
+    def broadcast(event) -> None:
+        """
+        Рассылает изменение события подписчикам живого канала:
+        тем, кому оно видно, - новое состояние, остальным - удаление с карты
+        :param event: модель или строка БД с полями id, lat, lon, type, line, moderated, user_id, created_at
+        """
+        data = {'id': str(event.id), 'lat': event.lat, 'lon': event.lon, 'type': event.type, 'line': event.line,
+                'moderated': event.moderated}
+        owner_id, moderated, created_at = event.user_id, event.moderated, event.created_at
+
+        def frame(user_id: Optional[str]) -> Optional[str]:
+            if EventsService.is_visible(moderated, created_at, owner_id, user_id):
+                return sse('events', {"op": "upsert",
+                                      "event": {**data, 'my': bool(user_id) and str(owner_id) == user_id}})
+            if moderated == 0:
+                # Новое событие на модерации видно только автору
+                return None
+            return sse('events', {"op": "remove", "id": data['id']})
+
+        BroadcastService.publish('events', frame)
+
     @staticmethod
     async def clear_event(session: AsyncSession, token: str, event_id: str):
         """
@@ -216,6 +302,7 @@ class EventsService:
             if (str(event.user_id) == user_id and event.moderated < 2):
                 event.moderated = 3
             await session.commit()
+            EventsService.broadcast(event)
             return {'id': event.id, 'lat': event.lat, 'lon': event.lon, 'type': event.type, 'line': event.line,
                     'moderated': event.moderated, 'my': bool(str(event.user_id) == user_id)}
         except Exception as exc:
@@ -239,6 +326,7 @@ class EventsService:
             if (str(event.user_id) == user_id and event.moderated == 1):
                 event.moderated = 5
             await session.commit()
+            EventsService.broadcast(event)
             return {'id': event.id, 'lat': event.lat, 'lon': event.lon, 'type': event.type, 'line': event.line,
                     'moderated': event.moderated, 'my': bool(str(event.user_id) == user_id)}
         except Exception as exc:
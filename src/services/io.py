@@ -1,15 +1,159 @@
+import csv
 import io
 import logging
+import os
+import queue
+import shutil
+import threading
 import traceback
 import uuid
+import zlib
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
 
-import pandas as pd
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
-from sqlalchemy import text
+from sqlalchemy import ARRAY, Integer, Sequence, Table, text
 from sqlalchemy.orm import Session
 
+from src.core.db import Base, SessionLocal, engine_sync
 from src.models.users import Log
+from src.services.jobs import JobCancelled, JobContext
+from src.services.network import NetworkService, NETWORK_TABLES
+
+# Разделитель полей ксв-файлов импорта и экспорта
+CSV_DELIMITER = ';'
+
+# Объем порции данных COPY FROM STDIN и COPY TO STDOUT
+COPY_CHUNK = 1 << 16
+
+# Число порций экспорта, ожидающих отправки клиенту
+EXPORT_QUEUE = 8
+
+# Формат zlib для потока gzip
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Режимы загрузки таблиц и их записи в журнале
+IMPORT_MODES = {'replace': 'Загрузил таблицу', 'upsert': 'Обновил таблицу'}
+
+# Перевод массивов из записи JSON в запись PostgreSQL
+ARRAY_BRACKETS = str.maketrans('[]', '{}')
+
+
+def to_array(value: str) -> str:
+    """
+    Массив в формате PostgreSQL: [1.0, 2.0] -> {1.0, 2.0}
+    """
+    return value.translate(ARRAY_BRACKETS)
+
+
+def to_integer(value: str) -> str:
+    """
+    Целое число из выгрузок, где целые столбцы с пропусками были записаны дробями: 5.0 -> 5
+    """
+    return value[:-2] if value.endswith('.0') else value
+
+
+class CopyStream:
+    """
+    Файл для COPY FROM STDIN: строки ксв-файла читаются по мере запроса драйвером,
+    приводятся к формату PostgreSQL и отдаются порциями, поэтому в памяти не хранится весь файл
+    """
+
+    def __init__(self, rows: Iterator[List[str]], converters: List[Optional[Callable[[str], str]]],
+                 progress: Optional[Callable[[], None]] = None):
+        """
+        :param rows: строки ксв-файла без заголовка
+        :param converters: преобразования значений по столбцам (None - без преобразования)
+        :param progress: функция, вызываемая перед чтением каждой порции
+        """
+        self.rows = rows
+        self.progress = progress
+        self.converters = [(index, converter) for index, converter in enumerate(converters) if converter]
+        self.count = 0
+        self._parts: List[str] = []
+        self._size = 0
+        self._writer = csv.writer(self, delimiter=CSV_DELIMITER, lineterminator='\n')
+
+    def write(self, part: str) -> None:
+        self._parts.append(part)
+        self._size += len(part)
+
+    def read(self, size: int = -1) -> str:
+        size = size if size and size > 0 else COPY_CHUNK
+        if self.progress is not None:
+            self.progress()
+        while self._size < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            if not any(row):
+                continue
+            for index, converter in self.converters:
+                if row[index]:
+                    row[index] = converter(row[index])
+            self._writer.writerow(row)
+            self.count += 1
+        chunk = ''.join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        return chunk
+
+
+class CopyPipe:
+    """
+    Файл для COPY TO STDOUT: драйвер пишет в него строки таблицы, они собираются в порции
+    и передаются читателю через ограниченную очередь. Если читатель отключился, запись прерывает COPY
+    """
+    _done = object()
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE)
+        self.cancelled = False
+        self._parts: List[bytes] = []
+        self._size = 0
+
+    def write(self, data) -> None:
+        if isinstance(data, str):
+            data = data.encode()
+        self._parts.append(data)
+        self._size += len(data)
+        if self._size >= COPY_CHUNK:
+            self._put(b''.join(self._parts))
+            self._parts.clear()
+            self._size = 0
+
+    def _put(self, item) -> None:
+        while True:
+            if self.cancelled:
+                raise ConnectionAbortedError("Выгрузка прервана клиентом")
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def finish(self, error: Optional[Exception] = None) -> None:
+        """
+        Передает остаток данных и признак конца (или ошибку)
+        """
+        try:
+            if error is None and self._parts:
+                self._put(b''.join(self._parts))
+            self._put(error if error is not None else self._done)
+        except ConnectionAbortedError:
+            pass
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            item = self.queue.get()
+            if item is self._done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
 
 
 class IOService:
@@ -17,54 +161,287 @@ class IOService:
     Сервис обработки импорта и экспорта данных
     """
     @staticmethod
-    def upload_table(contents: bytes, source: str, db_session: Session, ip: str, user_id: str) -> int:
+    def table(source: str) -> Table:
         """
-        Записывает загруженный ксв-файл в базу данных
-        :param contents: биты загруженного файла
+        Таблица БД по названию
+        :param source: название таблицы
+        :return: таблица
+        """
+        table = Base.metadata.tables.get(source)
+        if table is None:
+            raise HTTPException(404, detail=f"Таблица {source} не найдена")
+        return table
+
+    @staticmethod
+    def sequence(table: Table) -> Optional[str]:
+        """
+        Название последовательности первичного ключа id, если она есть
+        """
+        column = table.columns.get('id')
+        if column is not None and isinstance(column.default, Sequence):
+            return column.default.name
+        return None
+
+    @staticmethod
+    def read_header(stream: io.TextIOWrapper, table: Table) -> Tuple[Iterator[List[str]], List[str]]:
+        """
+        Читает заголовок ксв-файла и проверяет, что все столбцы есть в таблице
+        :param stream: текст файла
+        :param table: таблица
+        :return: итератор по строкам файла после заголовка и названия столбцов
+        """
+        reader = csv.reader(stream, delimiter=CSV_DELIMITER)
+        header = next(reader, None)
+        if not header:
+            raise HTTPException(400, detail="Файл пуст")
+        header = [column.strip() for column in header]
+        unknown = [column for column in header if column not in table.columns]
+        if unknown:
+            raise HTTPException(400, detail=f"В таблице {table.name} нет столбцов: {', '.join(unknown)}")
+        return reader, header
+
+    @staticmethod
+    def converters(table: Table, header: List[str]) -> List[Optional[Callable[[str], str]]]:
+        """
+        Преобразования значений столбцов файла перед COPY
+        """
+        converters = []
+        for column in header:
+            column_type = table.columns[column].type
+            if isinstance(column_type, ARRAY):
+                converters.append(to_array)
+            elif isinstance(column_type, Integer):
+                converters.append(to_integer)
+            else:
+                converters.append(None)
+        return converters
+
+    @staticmethod
+    def copy_from(db_session: Session, target: str, header: List[str], copy_stream: CopyStream) -> None:
+        """
+        Передает строки файла в таблицу командой COPY FROM STDIN в транзакции сессии
+        :param db_session: сессия БД
+        :param target: таблица, в которую пишутся строки
+        :param header: столбцы файла
+        :param copy_stream: строки файла
+        """
+        columns = ', '.join(f'"{column}"' for column in header)
+        cursor = db_session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(f'COPY "{target}" ({columns}) FROM STDIN '
+                               f"WITH (FORMAT csv, DELIMITER '{CSV_DELIMITER}')", copy_stream)
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def replace_rows(db_session: Session, table: Table, header: List[str], copy_stream: CopyStream) -> dict:
+        """
+        Полная замена: очистка таблицы (с зависимыми таблицами) и запись всех строк файла
+        :return: сводка {"mode", "count"}
+        """
+        db_session.execute(text(f'TRUNCATE TABLE "{table.name}" RESTART IDENTITY CASCADE'))
+        IOService.copy_from(db_session, table.name, header, copy_stream)
+        return {"mode": "replace", "count": copy_stream.count}
+
+    @staticmethod
+    def upsert_rows(db_session: Session, table: Table, header: List[str], copy_stream: CopyStream) -> dict:
+        """
+        Обновление по первичному ключу: файл загружается во временную таблицу, затем удаляются строки,
+        которых нет в файле, добавляются новые и изменяются отличающиеся. Совпадающие строки не трогаются,
+        поэтому зависимые таблицы сохраняются, а объем записи пропорционален числу изменений
+        :return: сводка {"mode", "count", "inserted", "updated", "deleted", "unchanged"}
+        """
+        keys = [column.name for column in table.primary_key.columns]
+        missing = [key for key in keys if key not in header]
+        if missing:
+            raise HTTPException(400, detail=f"Для обновления в файле нужны столбцы ключа: {', '.join(missing)}")
+        source, staging = table.name, f'import_{table.name}'
+        columns = ', '.join(f'"{column}"' for column in header)
+        values = [column for column in header if column not in keys]
+
+        db_session.execute(text(f'CREATE TEMP TABLE "{staging}" ON COMMIT DROP AS '
+                                f'SELECT {columns} FROM "{source}" WITH NO DATA'))
+        IOService.copy_from(db_session, staging, header, copy_stream)
+        db_session.execute(text(f'ANALYZE "{staging}"'))
+
+        # Повторяющийся ключ сделал бы итог зависимым от порядка строк, а ON CONFLICT - упал бы
+        conflict = ', '.join(f'"{key}"' for key in keys)
+        duplicates = db_session.execute(text(f'SELECT {conflict} FROM "{staging}" GROUP BY {conflict} '
+                                             f'HAVING COUNT(*) > 1 ORDER BY {conflict} LIMIT 10')).all()
+        if duplicates:
+            shown = ', '.join(str(row[0]) if len(row) == 1 else str(tuple(row)) for row in duplicates)
+            raise HTTPException(400, detail=f"В файле повторяются ключи ({conflict}): {shown}")
+
+        match = ' AND '.join(f's."{key}" = t."{key}"' for key in keys)
+        deleted = db_session.execute(text(f'DELETE FROM "{source}" t WHERE NOT EXISTS '
+                                          f'(SELECT 1 FROM "{staging}" s WHERE {match})')).rowcount
+
+        if values:
+            assignments = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in values)
+            current = ', '.join(f'"{source}"."{column}"' for column in values)
+            excluded = ', '.join(f'EXCLUDED."{column}"' for column in values)
+            action = f'DO UPDATE SET {assignments} WHERE ROW({current}) IS DISTINCT FROM ROW({excluded})'
+        else:
+            action = 'DO NOTHING'
+        inserted, updated = db_session.execute(text(
+            f'WITH upsert AS (INSERT INTO "{source}" ({columns}) SELECT {columns} FROM "{staging}" '
+            f'ON CONFLICT ({conflict}) {action} RETURNING (xmax = 0) AS inserted) '
+            f'SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upsert')).one()
+        return {"mode": "upsert", "count": copy_stream.count, "inserted": inserted, "updated": updated,
+                "deleted": deleted, "unchanged": copy_stream.count - inserted - updated}
+
+    @staticmethod
+    def save_upload(file: BinaryIO, source: str, mode: str) -> str:
+        """
+        Проверяет таблицу и режим загрузки и сохраняет загруженный файл в папку io
+        :param file: поток загруженного файла
+        :param source: название таблицы
+        :param mode: режим загрузки
+        :return: имя сохраненного файла
+        """
+        if mode not in IMPORT_MODES:
+            raise HTTPException(400, detail=f"Неизвестный режим загрузки {mode}")
+        IOService.table(source)
+        try:
+            number = source + str(uuid.uuid4()) + '.csv'
+            with open('io/' + number, 'wb') as copy:
+                shutil.copyfileobj(file, copy)
+            return number
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+
+    @staticmethod
+    def run_upload(job: JobContext, number: str, source: str, mode: str, ip: str, user_id: str) -> dict:
+        """
+        Задача загрузки сохраненного файла в собственной сессии БД
+        :return: сводка изменений
+        """
+        with SessionLocal() as db_session:
+            return IOService.upload_table(number, source, db_session, ip, user_id, mode, job)
+
+    @staticmethod
+    def upload_table(number: str, source: str, db_session: Session, ip: str, user_id: str,
+                     mode: str = 'replace', job: Optional[JobContext] = None) -> dict:
+        """
+        Записывает сохраненный ксв-файл в базу данных.
+        Файл разбирается построчно и передается в COPY FROM STDIN; вся запись выполняется
+        в одной транзакции, поэтому при ошибке или отмене таблица остается прежней
+        :param number: имя файла в папке io
         :param source: название таблицы
         :param db_session: сессия БД
         :param ip: айпи редактора
         :param user_id: айди редактора
-        :return: количество записанных строк
+        :param mode: replace - полная замена таблицы, upsert - обновление по первичному ключу
+        :param job: состояние фоновой задачи для прогресса и отмены
+        :return: сводка изменений (count - количество строк файла)
         """
         try:
-            number = source + str(uuid.uuid4()) + '.csv'
-            df = pd.read_csv(io.StringIO(contents.decode('utf-8')), sep=';')
-            df.to_csv('io/' + number, sep=';', quoting=1, index=False)
-            if source == 'charts':
-                df['lats'] = df['lats'].str.replace('[', '{', regex=False).str.replace(']', '}', regex=False)
-                df['lons'] = df['lons'].str.replace('[', '{', regex=False).str.replace(']', '}', regex=False)
-            log = Log(created_ip=ip,
-                      level=10,
-                      action='Загрузил таблицу',
-                      information=str(number),
-                      user_id=user_id)
-            db_session.add(log)
-            db_session.commit()
-            db_session.execute(text(f'TRUNCATE TABLE {source} RESTART IDENTITY CASCADE'))
-            db_session.commit()
-            with db_session.connection() as conn:
-                df.to_sql(source, conn, if_exists="append", method='multi', chunksize=1000, index=False)
-                if source != 'sections':
-                    conn.execute(text(f"SELECT setval('{source}_seq', (SELECT COALESCE(MAX(id), 0) FROM {source}));"))
-                conn.commit()
-            return len(df)
+            if mode not in IMPORT_MODES:
+                raise HTTPException(400, detail=f"Неизвестный режим загрузки {mode}")
+            table = IOService.table(source)
+            file = open('io/' + number, 'rb')
+            size = max(os.path.getsize('io/' + number), 1)
+            progress = (lambda: job.report("Запись строк", file.tell() / size * 0.9)) if job is not None else None
+
+            stream = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+            try:
+                rows, header = IOService.read_header(stream, table)
+                copy_stream = CopyStream(rows, IOService.converters(table, header), progress)
+
+                log = Log(created_ip=ip,
+                          level=10,
+                          action=IMPORT_MODES[mode],
+                          information=str(number),
+                          user_id=user_id)
+                db_session.add(log)
+                if mode == 'upsert':
+                    summary = IOService.upsert_rows(db_session, table, header, copy_stream)
+                else:
+                    summary = IOService.replace_rows(db_session, table, header, copy_stream)
+                sequence = IOService.sequence(table)
+                if sequence is not None:
+                    db_session.execute(text(f"SELECT setval('{sequence}', "
+                                            f'(SELECT COALESCE(MAX(id), 0) + 1 FROM "{source}"), false)'))
+                db_session.commit()
+            except Exception:
+                db_session.rollback()
+                raise
+            finally:
+                stream.close()
+            changed = summary["mode"] == "replace" or summary["inserted"] or summary["updated"] or summary["deleted"]
+            if source in NETWORK_TABLES and changed:
+                if job is not None:
+                    job.stage, job.progress = "Обновление снимка сети", 0.95
+                NetworkService.reload()
+            return summary
+        except (HTTPException, JobCancelled):
+            raise
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
             raise HTTPException(500, str(exc))
 
     @staticmethod
-    def download_table(source: str, db_session: Session, ip: str, user_id: str) -> StreamingResponse:
+    def export_rows(source: str, compress: bool = False) -> Iterator[bytes]:
+        """
+        Поток ксв-файла таблицы из COPY TO STDOUT.
+        COPY выполняется в отдельном потоке на собственном соединении и передает порции через ограниченную очередь,
+        поэтому расход памяти не зависит от размера таблицы
+        :param source: название таблицы (проверенное)
+        :param compress: сжимать поток gzip
+        :return: итератор порций файла
+        """
+        pipe = CopyPipe()
+        sql = (f'COPY "{source}" TO STDOUT '
+               f"WITH (FORMAT csv, HEADER, DELIMITER '{CSV_DELIMITER}', FORCE_QUOTE *)")
+
+        def produce():
+            try:
+                connection = engine_sync.raw_connection()
+                try:
+                    cursor = connection.cursor()
+                    cursor.copy_expert(sql, pipe)
+                    cursor.close()
+                    connection.commit()
+                finally:
+                    connection.close()
+                pipe.finish()
+            except Exception as exc:
+                if not pipe.cancelled:
+                    msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+                    logging.error(msg)
+                pipe.finish(exc)
+
+        thread = threading.Thread(target=produce, name=f'export-{source}', daemon=True)
+        thread.start()
+        compressor = zlib.compressobj(wbits=GZIP_WBITS) if compress else None
+        try:
+            for chunk in pipe:
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+            if compressor is not None:
+                yield compressor.flush()
+        finally:
+            pipe.cancel()
+
+    @staticmethod
+    def download_table(source: str, db_session: Session, ip: str, user_id: str,
+                       compress: bool = False) -> StreamingResponse:
         """
         Возвращает поток с ксв-файлом из БД
         :param source: название таблицы
         :param db_session: сессия БД
         :param ip: айпи редактора
         :param user_id: айди редактора
+        :param compress: передать файл сжатым gzip (Content-Encoding: gzip, middleware его повторно не сжимает)
         :return: Поток
         """
         try:
+            IOService.table(source)
             log = Log(created_ip=ip,
                       level=3,
                       action='Скачал таблицу',
@@ -72,13 +449,14 @@ class IOService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
-            with db_session.connection() as conn:
-                df = pd.read_sql(source, conn)
-            csv_buffer = io.StringIO()
-            df.to_csv(csv_buffer, sep=';', quoting=1, index=False)
-            csv_buffer.seek(0)
-            return StreamingResponse(io.BytesIO(csv_buffer.getvalue().encode()), media_type="text/csv",
+            if compress:
+                return StreamingResponse(IOService.export_rows(source, True), media_type="text/csv",
+                                         headers={"Content-Encoding": "gzip",
+                                                  "Content-Disposition": f"attachment; filename={source}.csv"})
+            return StreamingResponse(IOService.export_rows(source), media_type="text/csv",
                                      headers={"Content-Disposition": f"attachment; filename={source}.csv"})
+        except HTTPException:
+            raise
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -0,0 +1,379 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from src.core.constants import JOB_PROGRESS_INTERVAL, JOB_WORKERS
+from src.core.db import SessionLocal
+from src.models.jobs import Job
+
+# Статусы задач, которые еще не завершены
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Незавершенные задачи процесса: айди -> состояние
+_jobs: Dict[str, "JobContext"] = {}
+# Ключ исключительности (например, таблица загрузки) -> айди задачи
+_keys: Dict[str, str] = {}
+_state = {"executor": None}
+_lock = threading.Lock()
+
+
+def process_start(pid: int) -> str:
+    """
+    Момент запуска процесса в тактах после загрузки системы (отличает процесс от позднего с тем же pid)
+    :param pid: айди процесса
+    :return: момент запуска или пустая строка, если процесса нет или /proc недоступен
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "r") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ""
+
+
+def boot_id() -> str:
+    """
+    Идентификатор загрузки системы (меняется при перезагрузке)
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id", "r") as boot:
+            return boot.read().strip()
+    except OSError:
+        return ""
+
+
+# Владелец задач процесса: хост, загрузка системы, pid и момент запуска процесса
+OWNER = '|'.join((socket.gethostname(), boot_id(), str(os.getpid()), process_start(os.getpid())))
+
+
+class JobCancelled(Exception):
+    """
+    Задача отменена администратором
+    """
+
+
+class JobContext:
+    """
+    Состояние выполняемой задачи: через него задача сообщает этап и прогресс и проверяет отмену.
+    Прогресс хранится в памяти и записывается в БД не чаще JOB_PROGRESS_INTERVAL секунд
+    """
+
+    def __init__(self, job_id: str, kind: str, key: Optional[str], params: dict):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.params = params
+        self.status = 'queued'
+        self.stage: Optional[str] = None
+        self.progress = 0.0
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.future: Optional[Future] = None
+        self.cancelled = threading.Event()
+        self._saved_at = 0.0
+
+    def report(self, stage: str, progress: float) -> None:
+        """
+        Обновляет этап и долю выполнения; если задача отменена, прерывает ее
+        :param stage: этап
+        :param progress: доля выполнения от 0 до 1
+        """
+        self.check()
+        self.stage = stage
+        self.progress = round(min(max(progress, 0.0), 1.0), 3)
+        now = time.monotonic()
+        if now - self._saved_at >= JOB_PROGRESS_INTERVAL:
+            self._saved_at = now
+            JobService.sync(self)
+            self.check()
+
+    def check(self) -> None:
+        """
+        Прерывает задачу, если запрошена отмена
+        """
+        if self.cancelled.is_set():
+            raise JobCancelled("Задача отменена")
+
+    def dict(self) -> dict:
+        return {"id": self.id, "kind": self.kind, "status": self.status, "stage": self.stage,
+                "progress": self.progress, "params": self.params, "result": None, "error": None,
+                "created_at": self.created_at.isoformat(),
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "finished_at": None}
+
+
+class JobService:
+    """
+    Фоновые задачи администратора (загрузка таблиц, перераспределение ТПУ).
+    Задачи выполняются ограниченным пулом потоков процесса, состояние хранится в таблице jobs
+    """
+
+    @staticmethod
+    def executor() -> ThreadPoolExecutor:
+        with _lock:
+            if _state["executor"] is None:
+                _state["executor"] = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+            return _state["executor"]
+
+    @staticmethod
+    def save(job_id: str, **values) -> None:
+        """
+        Записывает поля задачи в БД
+        """
+        try:
+            with SessionLocal() as db_session:
+                db_session.execute(update(Job).where(Job.id == uuid.UUID(job_id)).values(**values))
+                db_session.commit()
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+
+    @staticmethod
+    def sync(job: JobContext) -> None:
+        """
+        Записывает этап и прогресс задачи в БД и принимает отмену, запрошенную через БД другим процессом
+        """
+        try:
+            with SessionLocal() as db_session:
+                requested = db_session.execute(
+                    update(Job).where(Job.id == uuid.UUID(job.id))
+                    .values(stage=job.stage, progress=job.progress).returning(Job.cancel_requested)).scalar()
+                db_session.commit()
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            return
+        if requested:
+            job.cancelled.set()
+
+    @staticmethod
+    def submit(kind: str, func: Callable[..., dict], *args, key: Optional[str] = None,
+               params: Optional[dict] = None, user_id: Optional[str] = None) -> Optional[str]:
+        """
+        Ставит задачу в очередь
+        :param kind: вид задачи
+        :param func: функция задачи; первым аргументом получает JobContext, возвращает итог
+        :param args: остальные аргументы функции
+        :param key: ключ исключительности: пока задача с тем же ключом не завершена (в любом процессе),
+                    новая не ставится
+        :param params: параметры для отображения
+        :param user_id: айди администратора
+        :return: айди задачи или None, если задача с тем же ключом уже выполняется
+        """
+        params = params or {}
+        job_id = str(uuid.uuid4())
+        with _lock:
+            if key is not None and key in _keys:
+                return None
+            job = JobContext(job_id, kind, key, params)
+            _jobs[job_id] = job
+            if key is not None:
+                _keys[key] = job_id
+        try:
+            with SessionLocal() as db_session:
+                db_session.add(Job(id=uuid.UUID(job_id), kind=kind, status='queued', key=key, owner=OWNER,
+                                   progress=0.0, params=json.dumps(params, ensure_ascii=False, default=str),
+                                   created_at=job.created_at, user_id=user_id))
+                db_session.commit()
+        except IntegrityError:
+            # Ключ занят незавершенной задачей другого процесса
+            JobService.forget(job)
+            return None
+        except Exception as exc:
+            JobService.forget(job)
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+        try:
+            job.future = JobService.executor().submit(JobService.run, job, func, *args)
+        except Exception as exc:
+            JobService.save(job.id, status='error', error=str(exc), finished_at=datetime.now())
+            JobService.forget(job)
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+        return job_id
+
+    @staticmethod
+    def run(job: JobContext, func: Callable[..., dict], *args) -> None:
+        """
+        Выполняет задачу в потоке пула и записывает итог
+        """
+        JobService.sync(job)
+        if job.cancelled.is_set():
+            JobService.save(job.id, status='cancelled', error="Задача отменена", finished_at=datetime.now())
+            JobService.forget(job)
+            return
+        job.status, job.started_at = 'running', datetime.now()
+        JobService.save(job.id, status='running', started_at=job.started_at)
+        values = {}
+        try:
+            result = func(job, *args)
+            values = dict(status='done', stage='Готово', progress=1.0,
+                          result=json.dumps(result, ensure_ascii=False, default=str))
+        except JobCancelled as exc:
+            values = dict(status='cancelled', error=str(exc))
+        except HTTPException as exc:
+            values = dict(status='error', error=str(exc.detail))
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            values = dict(status='error', error=str(exc))
+        finally:
+            JobService.save(job.id, finished_at=datetime.now(), stage=values.pop('stage', job.stage),
+                            progress=values.pop('progress', job.progress), **values)
+            JobService.forget(job)
+
+    @staticmethod
+    def forget(job: JobContext) -> None:
+        """
+        Убирает завершенную задачу из памяти процесса
+        """
+        with _lock:
+            _jobs.pop(job.id, None)
+            if job.key is not None and _keys.get(job.key) == job.id:
+                del _keys[job.key]
+
+    @staticmethod
+    def cancel(job_id: str) -> bool:
+        """
+        Отменяет задачу: ожидающая задача снимается с очереди, выполняемая прерывается
+        на ближайшей проверке прогресса (изменения в БД при этом откатываются).
+        Задаче другого процесса отмена передается через БД и принимается им при записи прогресса
+        :param job_id: айди задачи
+        :return: была ли задача незавершенной
+        """
+        with _lock:
+            job = _jobs.get(job_id)
+        if job is None:
+            try:
+                job_uuid = uuid.UUID(job_id)
+            except ValueError:
+                return False
+            try:
+                with SessionLocal() as db_session:
+                    requested = db_session.execute(
+                        update(Job).where(Job.id == job_uuid, Job.status.in_(ACTIVE_STATUSES))
+                        .values(cancel_requested=True)).rowcount
+                    db_session.commit()
+            except Exception as exc:
+                msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+                logging.error(msg)
+                raise HTTPException(500, str(exc))
+            return requested > 0
+        job.cancelled.set()
+        if job.future is not None and job.future.cancel():
+            JobService.save(job.id, status='cancelled', error="Задача отменена", finished_at=datetime.now())
+            JobService.forget(job)
+        return True
+
+    @staticmethod
+    def serialize(job: Job) -> dict:
+        return {"id": str(job.id), "kind": job.kind, "status": job.status, "stage": job.stage,
+                "progress": job.progress, "params": json.loads(job.params) if job.params else {},
+                "result": json.loads(job.result) if job.result else None, "error": job.error,
+                "created_at": job.created_at.isoformat() if job.created_at else None,
+                "started_at": job.started_at.isoformat() if job.started_at else None,
+                "finished_at": job.finished_at.isoformat() if job.finished_at else None}
+
+    @staticmethod
+    def get(job_id: str) -> dict:
+        """
+        Состояние задачи: незавершенные задачи процесса читаются из памяти, остальные - из БД
+        :param job_id: айди задачи
+        :return: состояние задачи
+        """
+        with _lock:
+            job = _jobs.get(job_id)
+        if job is not None:
+            return job.dict()
+        try:
+            job_uuid = uuid.UUID(job_id)
+        except ValueError:
+            raise HTTPException(404, detail="Задача не найдена")
+        try:
+            with SessionLocal() as db_session:
+                job = db_session.get(Job, job_uuid)
+                if job is None:
+                    raise HTTPException(404, detail="Задача не найдена")
+                return JobService.serialize(job)
+        except HTTPException:
+            raise
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+
+    @staticmethod
+    def jobs(limit: int = 50) -> List[dict]:
+        """
+        Последние задачи
+        :param limit: число задач
+        :return: состояния задач, новые первыми
+        """
+        try:
+            with SessionLocal() as db_session:
+                jobs = db_session.query(Job).order_by(Job.created_at.desc()).limit(limit).all()
+                result = [JobService.serialize(job) for job in jobs]
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+        with _lock:
+            active = dict(_jobs)
+        return [active[job["id"]].dict() if job["id"] in active else job for job in result]
+
+    @staticmethod
+    def alive(owner: Optional[str]) -> bool:
+        """
+        Работает ли процесс-владелец задачи. О процессах других хостов судить нельзя, они считаются живыми:
+        их задачи восстанавливает следующий процесс того же хоста
+        :param owner: владелец задачи
+        :return: жив ли владелец
+        """
+        if not owner:
+            return False
+        host, boot, pid, started = (owner.split('|') + ['', '', '', ''])[:4]
+        this_host, this_boot = OWNER.split('|')[:2]
+        if host != this_host:
+            return True
+        if boot != this_boot or not pid.isdigit():
+            return False
+        if started:
+            return process_start(int(pid)) == started
+        # Без /proc момент запуска неизвестен - проверяется только существование процесса
+        if int(pid) == os.getpid():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except OSError:
+            return True
+        return True
+
+    @staticmethod
+    def recover() -> None:
+        """
+        Помечает прерванными незавершенные задачи, процесс-владелец которых больше не работает
+        (перезапуск сервера). Задачи работающих воркеров не затрагиваются
+        """
+        with SessionLocal() as db_session:
+            rows = db_session.execute(select(Job.id, Job.owner).where(Job.status.in_(ACTIVE_STATUSES))).all()
+            lost = [job_id for job_id, owner in rows if not JobService.alive(owner)]
+            if lost:
+                db_session.execute(update(Job).where(Job.id.in_(lost), Job.status.in_(ACTIVE_STATUSES))
+                                   .values(status='error', error="Прервано перезапуском сервера",
+                                           finished_at=datetime.now()))
+                db_session.commit()
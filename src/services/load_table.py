@@ -0,0 +1,167 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.services.model_prediction import MlService, MODEL_DIR, MODEL_FILES
+from src.services.network import NetworkService
+
+TABLE_FILE = MODEL_DIR / "load_table.npy"
+INDEX_FILE = MODEL_DIR / "load_table.json"
+
+DAYS_RU = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+
+# Размер пакета строк для одного вызова модели при материализации
+CHUNK = 50000
+
+
+class LoadTable:
+    """
+    Материализованные предсказания модели по сетке (маршрут, участок, день недели, интервал времени).
+    Значения хранятся в отображаемом в память массиве [строки, 7 дней, интервалы, 2]:
+    предсказание на остановке и накопленное число пассажиров.
+    """
+
+    def __init__(self, values: np.ndarray, bucket: int, rows: List[Tuple[int, int, int]]):
+        """
+        :param values: массив предсказаний
+        :param bucket: размер интервала времени в минутах
+        :param rows: строки сетки: (route_id, order, stop_id)
+        """
+        self.values = values
+        self.bucket = bucket
+        self.index: Dict[Tuple[int, int, int], int] = {tuple(row): i for i, row in enumerate(rows)}
+        self.days = {day: i for i, day in enumerate(DAYS_RU)}
+
+    def lookup(self, route_id: int, order: int, stop_id: int, time: int,
+               day_of_week: str) -> Optional[Tuple[float, float]]:
+        """
+        Поиск предсказания в таблице
+        :param route_id: айди маршрута
+        :param order: порядковый номер участка
+        :param stop_id: айди остановки
+        :param time: время в минутах после полуночи
+        :param day_of_week: день недели
+        :return: (предсказание на остановке, накопленное число пассажиров) или None, если строки нет в сетке
+        """
+        row = self.index.get((route_id, order, stop_id))
+        day = self.days.get(day_of_week)
+        if row is None or day is None:
+            return None
+        current, total = self.values[row, day, (time % (24 * 60)) // self.bucket].tolist()
+        return round(current, 2), round(total, 2)
+
+
+_table: Optional[LoadTable] = None
+_table_loaded = False
+_lock = threading.Lock()
+
+
+class LoadTableService:
+    """
+    Сервис материализации и чтения таблицы загруженности
+    """
+
+    @staticmethod
+    def model_signature() -> List[int]:
+        """
+        Подпись файла модели, по которой определяется устаревание таблицы
+        """
+        stat = os.stat(MODEL_DIR / MODEL_FILES["xgb_model"])
+        return [int(stat.st_mtime), stat.st_size]
+
+    @staticmethod
+    def get() -> Optional[LoadTable]:
+        """
+        Возвращает таблицу, отображенную в память, или None, если она не построена или устарела.
+        Страницы файла разделяются всеми процессами через страничный кэш ОС.
+        """
+        global _table, _table_loaded
+        if _table_loaded:
+            return _table
+        with _lock:
+            if not _table_loaded:
+                try:
+                    if TABLE_FILE.exists() and INDEX_FILE.exists():
+                        with INDEX_FILE.open("r", encoding="utf-8") as index_file:
+                            index = json.load(index_file)
+                        if index["model"] == LoadTableService.model_signature():
+                            values = np.load(TABLE_FILE, mmap_mode="r")
+                            _table = LoadTable(values, index["bucket"], index["rows"])
+                        else:
+                            logging.error("Таблица загруженности устарела: модель изменилась после материализации")
+                except Exception as exc:
+                    msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+                    logging.error(f"Ошибка при загрузке таблицы загруженности: \n{msg}")
+                _table_loaded = True
+        return _table
+
+    @staticmethod
+    def reset() -> None:
+        """
+        Сбрасывает прочитанную таблицу; следующее обращение перечитает файлы
+        """
+        global _table, _table_loaded
+        with _lock:
+            _table, _table_loaded = None, False
+
+    @staticmethod
+    def grid_rows() -> List[Tuple[int, int, int]]:
+        """
+        Строки сетки: участки маршрутов, обученных в модели, из снимка сети
+        """
+        network = NetworkService.get()
+        rows = []
+        for route_id in sorted(MlService.model().route_ids):
+            route_sections = network.sections.get(route_id)
+            if route_sections is None:
+                continue
+            for order, stop_id in zip(route_sections.orders.tolist(), route_sections.stop_ids.tolist()):
+                rows.append((route_id, order, stop_id))
+        return rows
+
+    @staticmethod
+    def materialize(bucket: int) -> int:
+        """
+        Вычисляет предсказания модели по всей сетке и сохраняет их на диск
+        :param bucket: размер интервала времени в минутах
+        :return: число строк сетки
+        """
+        rows = LoadTableService.grid_rows()
+        times = list(range(0, 24 * 60, bucket))
+        values = np.zeros((len(rows), len(DAYS_RU), len(times), 2), dtype=np.float32)
+
+        # Ячейки сетки нумеруются подряд в порядке values, индексы порции восстанавливаются из номеров
+        flat = values.reshape(-1, 2)
+        for begin in range(0, len(flat), CHUNK):
+            end = min(begin + CHUNK, len(flat))
+            row_ids, day_ids, slot_ids = np.unravel_index(np.arange(begin, end), values.shape[:3])
+            batch = [rows[row] + (times[slot], DAYS_RU[day])
+                     for row, day, slot in zip(row_ids.tolist(), day_ids.tolist(), slot_ids.tolist())]
+            predictions = MlService.predict_accumulated(batch, use_table=False)
+            flat[begin:end] = [(current or 0.0, total or 0.0) for current, total in predictions]
+
+        # Запись во временные файлы и атомарная подмена
+        table_tmp = TABLE_FILE.with_suffix(".tmp.npy")
+        index_tmp = INDEX_FILE.with_suffix(".tmp.json")
+        np.save(table_tmp, values)
+        with index_tmp.open("w", encoding="utf-8") as index_file:
+            json.dump({"bucket": bucket, "model": LoadTableService.model_signature(), "rows": rows}, index_file)
+        os.replace(table_tmp, TABLE_FILE)
+        os.replace(index_tmp, INDEX_FILE)
+        LoadTableService.reset()
+        return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Материализация таблицы загруженности")
+    parser.add_argument("--bucket", type=int, default=5, help="размер интервала времени в минутах")
+    args = parser.parse_args()
+    NetworkService.reload(publish=False)
+    count = LoadTableService.materialize(args.bucket)
+    print(f"Материализовано строк: {count}, интервал {args.bucket} мин.")
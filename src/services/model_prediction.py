@@ -1,24 +1,78 @@
 import logging
+import os
+import time
 import traceback
+import threading
+from datetime import datetime
 from pathlib import Path
-from typing import Union
+from typing import Dict, List, Optional, Tuple, Union
 
 import joblib
+import numpy as np
 import pandas as pd
 from fastapi import HTTPException
 
+from src.schemas.prediction import PredictionBatchInput
+from src.services.network import NetworkService
+
 
 MODEL_DIR = Path("model_ml")
 
-try:
-    xgb_model = joblib.load(MODEL_DIR / "xgboost_model.pkl")
-    encoder = joblib.load(MODEL_DIR / "target_encoder.pkl")
-    known_route_ids = joblib.load(MODEL_DIR / "unique_route_ids.pkl")
-    avg_passengers_stats = joblib.load(MODEL_DIR / "passenger_avg_by_route_hour.pkl")
-except Exception as exc:
-    msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-    logging.error(f"Ошибка при загрузке модели: \n{msg}")
-    raise
+MODEL_FILES = {
+    "xgb_model": "xgboost_model.pkl",
+    "encoder": "target_encoder.pkl",
+    "route_ids": "unique_route_ids.pkl",
+    "avg_stats": "passenger_avg_by_route_hour.pkl",
+}
+
+# Максимальное число поездок в одном пакетном запросе
+MAX_BATCH = 10000
+
+COLUMN_ORDER = [
+    "route_id", "order", "stop_id", "День недели", "hour",
+    "minute", "time_minutes", "day_part", "route_stop", "avg_passengers_route_hour"
+]
+
+# Переиспользуемая матрица признаков, своя для каждого потока
+_feature_buffers = threading.local()
+
+
+class ModelVersion:
+    """
+    Загруженная версия модели со всеми вспомогательными файлами
+    """
+    __slots__ = ('xgb_model', 'encoder', 'route_ids', 'avg_stats', 'encoding_tables', 'signature',
+                 'loaded_at', 'load_seconds', 'file_bytes', 'rss_bytes')
+
+    def __init__(self, xgb_model, encoder, route_ids, avg_stats, signature: List[int],
+                 loaded_at: datetime, load_seconds: float, file_bytes: int, rss_bytes: Optional[int]):
+        self.xgb_model = xgb_model
+        self.encoder = encoder
+        self.route_ids = frozenset(route_ids)
+        self.avg_stats = avg_stats
+        # Таблицы целевого кодирования категориальных признаков: {колонка: ({значение: код}, код неизвестного)}
+        self.encoding_tables: Optional[Dict[str, Tuple[dict, float]]] = None
+        self.signature = signature
+        self.loaded_at = loaded_at
+        self.load_seconds = load_seconds
+        self.file_bytes = file_bytes
+        self.rss_bytes = rss_bytes
+
+
+_model: Optional[ModelVersion] = None
+_model_lock = threading.Lock()
+
+
+def _reset_model_lock() -> None:
+    """
+    Пересоздает блокировку в дочернем процессе: форк мог произойти, пока она была захвачена
+    """
+    global _model_lock
+    _model_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_model_lock)
+
 
 class MlService:
     @staticmethod
@@ -28,6 +82,95 @@ class MlService:
         elif 17 <= hour < 22: return 'вечер'
         else: return 'ночь'
 
+    @staticmethod
+    def rss_bytes() -> Optional[int]:
+        """
+        Резидентная память процесса в байтах (только Linux)
+        """
+        try:
+            with open("/proc/self/statm", "r") as statm:
+                return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    @staticmethod
+    def load_model() -> ModelVersion:
+        """
+        Читает файлы модели из MODEL_DIR
+        :return: загруженная версия модели
+        """
+        try:
+            started = time.perf_counter()
+            rss_before = MlService.rss_bytes()
+            objects = {name: joblib.load(MODEL_DIR / file) for name, file in MODEL_FILES.items()}
+            rss_after = MlService.rss_bytes()
+            stat = os.stat(MODEL_DIR / MODEL_FILES["xgb_model"])
+            return ModelVersion(
+                **objects,
+                signature=[int(stat.st_mtime), stat.st_size],
+                loaded_at=datetime.now(),
+                load_seconds=round(time.perf_counter() - started, 3),
+                file_bytes=sum(os.path.getsize(MODEL_DIR / file) for file in MODEL_FILES.values()),
+                rss_bytes=None if rss_before is None or rss_after is None else rss_after - rss_before
+            )
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(f"Ошибка при загрузке модели: \n{msg}")
+            raise HTTPException(500, detail="Ошибка загрузки модели")
+
+    @staticmethod
+    def model() -> ModelVersion:
+        """
+        Возвращает текущую версию модели, загружая ее при первом обращении
+        """
+        global _model
+        if _model is None:
+            with _model_lock:
+                if _model is None:
+                    _model = MlService.load_model()
+        return _model
+
+    @staticmethod
+    def preload() -> None:
+        """
+        Загружает модель заранее. Вызов в мастер-процессе до форка воркеров
+        позволяет им разделять страницы модели по copy-on-write
+        """
+        MlService.model()
+
+    @staticmethod
+    def reload_model() -> dict:
+        """
+        Загружает новую версию модели из MODEL_DIR и подменяет текущую без перезапуска.
+        Запросы, начатые на старой версии, дорабатывают на ней
+        :return: сведения о загруженной версии
+        """
+        from src.services.load_table import LoadTableService
+
+        global _model
+        model = MlService.load_model()
+        with _model_lock:
+            _model = model
+        LoadTableService.reset()
+        return MlService.model_info()
+
+    @staticmethod
+    def model_info() -> dict:
+        """
+        Сведения о загруженной модели: время загрузки и занимаемая память
+        """
+        model = _model
+        if model is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "loaded_at": model.loaded_at.isoformat(timespec="seconds"),
+            "load_seconds": model.load_seconds,
+            "file_bytes": model.file_bytes,
+            "rss_bytes": model.rss_bytes,
+            "routes": len(model.route_ids)
+        }
+
     @staticmethod
     def predict_passengers(data: dict) -> Union[float, str]:
         """
@@ -45,42 +188,14 @@ class MlService:
             route_id = data["route_id"]
             stop_id = data["stop_id"]
 
-            if route_id not in known_route_ids:
+            if route_id not in MlService.model().route_ids:
                 return f"route_id {route_id} не обучен в модели"
 
-            time = pd.to_datetime(data["Время"], format="%H:%M:%S")
-            hour = time.hour
-            minute = time.minute
-            time_minutes = hour * 60 + minute
-            day_part = MlService.get_day_part(hour)
-            avg_val = avg_passengers_stats.get((route_id, hour), 0)
-
-            features = {
-                "route_id": route_id,
-                "order": data["order"],
-                "stop_id": stop_id,
-                "День недели": data["День недели"],
-                "hour": hour,
-                "minute": minute,
-                "time_minutes": time_minutes,
-                "day_part": day_part,
-                "route_stop": f"{route_id}_{stop_id}",
-                "avg_passengers_route_hour": avg_val
-            }
-
-            df = pd.DataFrame([features])
-
-            column_order = [
-                "route_id", "order", "stop_id", "День недели", "hour",
-                "minute", "time_minutes", "day_part", "route_stop", "avg_passengers_route_hour"
-            ]
-
-            df = df[column_order]
-            df_encoded = encoder.transform(df)
-
-            prediction = xgb_model.predict(df_encoded)[0]
+            time_minutes = MlService.parse_time(data["Время"])
+            prediction, _ = MlService.predict_accumulated(
+                [(route_id, data["order"], stop_id, time_minutes, data["День недели"])])[0]
 
-            return round(float(prediction), 2)
+            return prediction
 
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -100,4 +215,211 @@ class MlService:
         elif passengers <= 15:
             return 4
         else:
-            return 5
\ No newline at end of file
+            return 5
+
+    @staticmethod
+    def encoding_tables(model: ModelVersion) -> Dict[str, Tuple[dict, float]]:
+        """
+        Разворачивает целевой кодировщик в словари значение -> код.
+        Это позволяет кодировать пакет строк без построения DataFrame.
+        :param model: версия модели
+        """
+        if model.encoding_tables is None:
+            encoder = model.encoder
+            tables = {}
+            ordinal_mappings = {item['col']: item['mapping'] for item in encoder.ordinal_encoder.mapping}
+            for col in encoder.cols:
+                target_mapping = encoder.mapping[col]
+                unknown = float(target_mapping.get(-1, np.nan))
+                table = {}
+                for value, ordinal in ordinal_mappings[col].items():
+                    if pd.isna(value):
+                        continue
+                    table[value] = float(target_mapping.get(ordinal, unknown))
+                tables[col] = (table, unknown)
+            model.encoding_tables = tables
+        return model.encoding_tables
+
+    @staticmethod
+    def parse_time(value: str) -> int:
+        """
+        Переводит время вида "06:42:00" в минуты после полуночи
+        """
+        time = datetime.strptime(value, "%H:%M:%S")
+        return time.hour * 60 + time.minute
+
+    @staticmethod
+    def feature_buffer(rows: int) -> np.ndarray:
+        """
+        Возвращает участок заранее выделенной матрицы признаков нужного размера.
+        Матрица растет только при необходимости и не выделяется заново на каждый запрос.
+        :param rows: число строк
+        :return: представление матрицы размером rows x len(COLUMN_ORDER)
+        """
+        buffer = getattr(_feature_buffers, 'matrix', None)
+        if buffer is None or len(buffer) < rows:
+            capacity = max(rows, 2 * len(buffer) if buffer is not None else 256)
+            buffer = np.empty((capacity, len(COLUMN_ORDER)), dtype=np.float32)
+            _feature_buffers.matrix = buffer
+        return buffer[:rows]
+
+    @staticmethod
+    def build_features(rows: List[Tuple[int, int, int, int, str]], model: ModelVersion) -> np.ndarray:
+        """
+        Строит закодированную матрицу признаков для пакета поездок
+        :param rows: список (route_id, order, stop_id, время в минутах после полуночи, день недели)
+        :param model: версия модели
+        :return: матрица признаков в порядке COLUMN_ORDER (действительна до следующего вызова в потоке)
+        """
+        tables = MlService.encoding_tables(model)
+        day_parts = [MlService.get_day_part(hour) for hour in range(24)]
+
+        def encode(col: str, values) -> List[float]:
+            table, unknown = tables[col]
+            return [table.get(value, unknown) for value in values]
+
+        route_ids = [row[0] for row in rows]
+        stop_ids = [row[2] for row in rows]
+        times = np.array([row[3] for row in rows], dtype=np.int64) % (24 * 60)
+        hours = times // 60
+
+        matrix = MlService.feature_buffer(len(rows))
+        matrix[:, 0] = encode("route_id", route_ids)
+        matrix[:, 1] = [row[1] for row in rows]
+        matrix[:, 2] = encode("stop_id", stop_ids)
+        matrix[:, 3] = encode("День недели", [row[4] for row in rows])
+        matrix[:, 4] = hours
+        matrix[:, 5] = times % 60
+        matrix[:, 6] = times
+        matrix[:, 7] = encode("day_part", [day_parts[hour] for hour in hours.tolist()])
+        matrix[:, 8] = encode("route_stop", [f"{route_id}_{stop_id}" for route_id, stop_id in zip(route_ids, stop_ids)])
+        matrix[:, 9] = [model.avg_stats.get((route_id, hour), 0)
+                        for route_id, hour in zip(route_ids, hours.tolist())]
+        return matrix
+
+    @staticmethod
+    def predict_passengers_batch(rows: List[Tuple[int, int, int, int, str]]) -> List[Optional[float]]:
+        """
+        Предсказывает число пассажиров для пакета поездок одним вызовом модели
+        :param rows: список (route_id, order, stop_id, время в минутах после полуночи, день недели)
+        :return: предсказания; None для маршрутов, не обученных в модели
+        """
+        try:
+            model = MlService.model()
+            indexes = [i for i, row in enumerate(rows) if row[0] in model.route_ids]
+            predictions: List[Optional[float]] = [None] * len(rows)
+            if indexes:
+                matrix = MlService.build_features([rows[i] for i in indexes], model)
+                values = model.xgb_model.predict(matrix)
+                for i, value in zip(indexes, values.tolist()):
+                    predictions[i] = round(float(value), 2)
+            return predictions
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, detail="Ошибка обработки модели")
+
+    @staticmethod
+    def predict_accumulated(rows: List[Tuple[int, int, int, int, str]],
+                            use_table: bool = True) -> List[Tuple[Optional[float], Optional[float]]]:
+        """
+        Предсказывает число пассажиров для пакета поездок.
+        Если order > 0, также учитывает вход с предыдущей остановки.
+        Строки, покрытые материализованной таблицей загруженности, берутся из нее без вызова модели.
+        :param rows: список (route_id, order, stop_id, время в минутах после полуночи, день недели)
+        :param use_table: искать предсказания в материализованной таблице
+        :return: список (предсказание на остановке, накопленное число пассажиров);
+                 None для маршрутов, не обученных в модели
+        """
+        from src.services.load_table import LoadTableService
+
+        results: List[Optional[Tuple[Optional[float], Optional[float]]]] = [None] * len(rows)
+        table = LoadTableService.get() if use_table else None
+        if table is not None:
+            for i, row in enumerate(rows):
+                results[i] = table.lookup(*row)
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+
+        rows_left = [rows[i] for i in missing]
+        previous = [i for i, row in enumerate(rows_left) if row[1] > 0]
+        batch = rows_left + [(rows_left[i][0], rows_left[i][1] - 1) + tuple(rows_left[i][2:]) for i in previous]
+        predictions = MlService.predict_passengers_batch(batch)
+
+        currents = predictions[:len(rows_left)]
+        totals = list(currents)
+        for i, prediction in zip(previous, predictions[len(rows_left):]):
+            if totals[i] is not None and prediction is not None:
+                totals[i] += prediction
+        for i, current, total in zip(missing, currents, totals):
+            results[i] = (current, total)
+        return results
+
+    @staticmethod
+    def predict_load_levels(rows: List[Tuple[int, int, int, int, str]]) -> List[Optional[int]]:
+        """
+        Оценивает загруженность [0–5] для пакета поездок
+        :param rows: список (route_id, order, stop_id, время в минутах после полуночи, день недели)
+        :return: уровни загруженности; None для маршрутов, не обученных в модели
+        """
+        return [None if total is None else MlService.calculate_load_level(round(total, 2))
+                for _, total in MlService.predict_accumulated(rows)]
+
+    @staticmethod
+    def route_rows(route_id: int, time_from: str, time_to: str, step: int,
+                   day_of_week: str) -> List[Tuple[int, int, int, int, str]]:
+        """
+        Разворачивает маршрут и временное окно в поездки от каждой остановки маршрута
+        :param route_id: айди маршрута
+        :param time_from: начало окна "HH:MM:SS"
+        :param time_to: конец окна "HH:MM:SS" включительно
+        :param step: шаг по времени в минутах
+        :param day_of_week: день недели
+        :return: список (route_id, order, stop_id, время в минутах после полуночи, день недели)
+        """
+        route_sections = NetworkService.get().sections.get(route_id)
+        if route_sections is None:
+            raise HTTPException(404, detail=f"Маршрут {route_id} не найден")
+        begin, end = MlService.parse_time(time_from), MlService.parse_time(time_to)
+        stops = list(zip(route_sections.orders.tolist(), route_sections.stop_ids.tolist()))
+        return [(route_id, order, stop_id, time, day_of_week)
+                for time in range(begin, end + 1, max(step, 1))
+                for order, stop_id in stops]
+
+    @staticmethod
+    def predict_batch(data: PredictionBatchInput) -> dict:
+        """
+        Пакетное предсказание загруженности по списку поездок или по маршруту во временном окне
+        :param data: модель пакетного запроса
+        :return: предсказания по каждой поездке
+        """
+        rows = []
+        try:
+            for item in data.items:
+                rows.append((item.route_id, item.order, item.stop_id, MlService.parse_time(item.time),
+                             item.day_of_week))
+            if data.route_id is not None:
+                if not (data.time_from and data.time_to and data.day_of_week):
+                    raise HTTPException(400, detail="Для маршрута укажите time_from, time_to и day_of_week")
+                rows.extend(MlService.route_rows(data.route_id, data.time_from, data.time_to, data.step,
+                                                 data.day_of_week))
+        except ValueError:
+            raise HTTPException(400, detail="Время указывается в формате HH:MM:SS")
+        if len(rows) > MAX_BATCH:
+            raise HTTPException(400, detail=f"Не более {MAX_BATCH} поездок в одном запросе")
+
+        predictions = []
+        for row, (current, total) in zip(rows, MlService.predict_accumulated(rows)):
+            route_id, order, stop_id, time, day_of_week = row
+            predictions.append({
+                "route_id": route_id,
+                "order": order,
+                "stop_id": stop_id,
+                "time": f"{time // 60:02}:{time % 60:02}:00",
+                "day_of_week": day_of_week,
+                "predicted_passengers_current": current,
+                "accumulated_passengers": None if total is None else round(total, 2),
+                "load_level_0_5": None if total is None else MlService.calculate_load_level(total)
+            })
+        return {"count": len(predictions), "predictions": predictions}
\ No newline at end of file
@@ -1,25 +1,70 @@
+import bisect
 import datetime
 import logging
 import traceback
-from typing import List, Tuple, Dict
+from typing import List, NamedTuple, Tuple, Dict, Optional
 
-import pandas as pd
 from fastapi import HTTPException
-from sqlalchemy import select, func
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
 
-from src.api.model_predict import predict_passenger_count
-from src.models.logistic import Section, Route, Stop, Tpu, Chart, Timetable
-from src.schemas.coord import Coord
-from src.schemas.navigation import RouteSimple, RouteReport, RouteDouble
-from src.schemas.prediction import PredictionInput
+from src.schemas.navigation import RouteSimple, RouteReport, RouteDouble, RouteLeg, RouteMulti
+from src.services.model_prediction import MlService
+from src.services.network import NetworkService, NetworkSnapshot, RouteInfo, TripSchedule
+from src.services.raptor import RaptorService, Journey, JourneyLeg, TRANSFER_TIME, WALK_TIME
+
+
+class RouteCandidate:
+    """
+    Кандидат в беспересадочные маршруты
+    """
+    __slots__ = ('route', 'home', 'end', 'long', 'stop_id', 'load', 'time_label', 'time_begin', 'time_road',
+                 'full_time', 'weight_time')
+
+    def __init__(self, route: RouteInfo, home: int, end: int, stop_id: int):
+        self.route = route
+        self.home = home
+        self.end = end
+        self.long = end - home
+        self.stop_id = stop_id
+        self.load = 9
+        self.time_label = 'Нет отправлений'
+        self.time_begin = '-'
+        self.time_road = '-'
+        self.full_time = 9999
+        self.weight_time = 9999
+
+    def set_time(self, time_label: str, start: float, trip: float, full: float, load: int) -> None:
+        """
+        Заполняет оценку времени поездки
+        :param time_label: источник оценки
+        :param start: время отправления в минутах после полуночи
+        :param trip: время в пути в минутах
+        :param full: полное время поездки с ожиданием в минутах
+        :param load: загруженность
+        """
+        self.time_label = time_label
+        self.time_begin = f'в {int(start // 60):02}:{int(start % 60):02}'
+        self.time_road = f'{int(trip // 60):02}:{int(trip % 60):02}'
+        self.full_time = int(full)
+        self.weight_time = int(full - trip + (1 + 0.2 * load) * trip)
+
+
+class TransferCandidate(NamedTuple):
+    """
+    Кандидат в маршруты с пересадками
+    """
+    journey: Journey
+    loads: Tuple[int, ...]
+    longs: Tuple[int, ...]
+    max_load: int
+    full_time: int
+    weight_time: int
+    scheduled: Tuple[bool, ...]
 
 
 class NavigationService:
     @staticmethod
-    async def create_routes(from_id: int, to_id: int, care: bool, change: bool, priority: int, fact_time: int,
-                            session: AsyncSession) -> RouteReport:
+    async def create_routes(from_id: int, to_id: int, care: bool, change: bool, priority: int,
+                            fact_time: int, transfers: int = 1) -> RouteReport:
         """
         Построение всех маршрутах по заданным начальным и конечным остановкам
         :param from_id: начальная остановка
@@ -28,62 +73,114 @@ class NavigationService:
         :param change: делать ли пересадки?
         :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
         :param fact_time: время отправления от начальной остановки в минутах после полуночи
-        :param session: сессия БД
+        :param transfers: максимальное число пересадок
         :return: json-модель маршрута
         """
         try:
-            # Определение списка соседних остановок от точки отправления
-            stop_from = await session.get(Stop, from_id)
-            tpu_from = await session.get(Tpu, stop_from.tpu_id)
-            stops_from = []
-            if tpu_from:
-                stmt = select(Stop).where(Stop.tpu_id == tpu_from.id)
-                results = await session.execute(stmt)
-                for row in results:
-                    stops_from.append(row[0].id)
-            else:
-                stops_from.append(from_id)
-
-            # Определение списка соседних остановок от точки прибытия
-            stop_to = await session.get(Stop, to_id)
-            tpu_to = await session.get(Tpu, stop_to.tpu_id)
-            stops_to = []
-            if tpu_to:
-                stmt = select(Stop).where(Stop.tpu_id == tpu_to.id)
-                results = await session.execute(stmt)
-                for row in results:
-                    stops_to.append(row[0].id)
-            else:
-                stops_to.append(to_id)
-
-            # Построение беспересадочных маршрутов
-            simple_routes, rb = await NavigationService().create_simple_routes(stops_from, stops_to, care, priority,
-                                                                               fact_time, session)
-
-            # Построение маршрутов с пересадками
-            double_routes = []
-            if not change:
-                double_routes = await NavigationService().create_double_routes(stops_from, stops_to, care, priority,
-                                                                               rb, fact_time, session)
-
-            # Формирование отчета
-            count = len(simple_routes) + len(double_routes)
-            count_simple = len(simple_routes)
-            if count:
-                result = 200
-            else:
-                result = 0
-            route_report = RouteReport(result=result, count=count, count_simple=count_simple,
-                                       simple_routes=simple_routes, double_routes=double_routes)
-            return route_report
+            # Снимок сети фиксируется на весь запрос
+            network = NetworkService.get()
+
+            # Определение списков соседних остановок от точек отправления и прибытия
+            stops_from = network.stop_group(from_id)
+            stops_to = network.stop_group(to_id)
+
+            return await NavigationService.build_report(stops_from, stops_to, care, change, priority, fact_time,
+                                                        transfers, network)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
             raise HTTPException(500, str(exc))
 
+    @staticmethod
+    async def create_routes_by_coords(from_lat: float, from_lon: float, to_lat: float, to_lon: float, care: bool,
+                                      change: bool, priority: int, fact_time: int, transfers: int = 1,
+                                      k: int = 3, radius: float = 1000) -> RouteReport:
+        """
+        Построение маршрутов между точками на карте: каждая точка привязывается к k ближайшим остановкам
+        :param from_lat: широта точки отправления
+        :param from_lon: долгота точки отправления
+        :param to_lat: широта точки прибытия
+        :param to_lon: долгота точки прибытия
+        :param care: только низкопольный пс?
+        :param change: делать ли пересадки?
+        :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
+        :param fact_time: время отправления от начальной остановки в минутах после полуночи
+        :param transfers: максимальное число пересадок
+        :param k: число ближайших остановок для каждой точки
+        :param radius: максимальное расстояние до остановки в метрах
+        :return: json-модель маршрута
+        """
+        try:
+            network = NetworkService.get()
+            stops_from = NavigationService.snap_stops(from_lat, from_lon, k, radius, network)
+            stops_to = NavigationService.snap_stops(to_lat, to_lon, k, radius, network)
+            return await NavigationService.build_report(stops_from, stops_to, care, change, priority, fact_time,
+                                                        transfers, network)
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+
+    @staticmethod
+    def snap_stops(lat: float, lon: float, k: int, radius: float, network: NetworkSnapshot) -> List[int]:
+        """
+        Остановки, с которых можно начать (или которыми закончить) поездку из точки:
+        k ближайших остановок вместе с их пересадочными узлами
+        :param lat: широта точки
+        :param lon: долгота точки
+        :param k: число ближайших остановок
+        :param radius: максимальное расстояние в метрах
+        :param network: снимок сети
+        :return: список айди остановок
+        """
+        stops = []
+        for stop_id, _ in network.stop_index().nearest(lat, lon, k, radius):
+            for group_stop_id in network.stop_group(stop_id):
+                if group_stop_id not in stops:
+                    stops.append(group_stop_id)
+        return stops
+
+    @staticmethod
+    async def build_report(stops_from: List[int], stops_to: List[int], care: bool, change: bool, priority: int,
+                           fact_time: int, transfers: int, network: NetworkSnapshot) -> RouteReport:
+        """
+        Построение всех маршрутов между группами остановок
+        :param stops_from: остановки отправления
+        :param stops_to: остановки прибытия
+        :param care: только низкопольный пс?
+        :param change: делать ли пересадки?
+        :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
+        :param fact_time: время отправления в минутах после полуночи
+        :param transfers: максимальное число пересадок
+        :param network: снимок сети
+        :return: json-модель маршрута
+        """
+        # Построение беспересадочных маршрутов
+        simple_routes, rb = await NavigationService().create_simple_routes(stops_from, stops_to, care, priority,
+                                                                           fact_time, network)
+
+        # Построение маршрутов с пересадками
+        double_routes, multi_routes = [], []
+        if not change and transfers > 0:
+            double_routes, multi_routes = await NavigationService().create_transfer_routes(
+                stops_from, stops_to, care, priority, rb, fact_time, transfers, network)
+
+        # Формирование отчета
+        count = len(simple_routes) + len(double_routes) + len(multi_routes)
+        count_simple = len(simple_routes)
+        if count:
+            result = 200
+        else:
+            result = 0
+        route_report = RouteReport.construct(result=result, count=count, count_simple=count_simple,
+                                             simple_routes=simple_routes, double_routes=double_routes,
+                                             multi_routes=multi_routes)
+        return route_report
+
     @staticmethod
     async def check_timetables(route_id: int, fact_time: int, before_time_coef: float, time_coef: float,
-                               full_time_coef: float, session: AsyncSession) -> Tuple[int, int, int]:
+                               full_time_coef: float, day: datetime.date,
+                               network: NetworkSnapshot) -> Tuple[int, int, int]:
         """
         Оценивает время в пути по постоянным графикам
         :param route_id: айди маршрута
@@ -91,28 +188,57 @@ class NavigationService:
         :param before_time_coef: коэффециент времени пройденного маршрута
         :param time_coef: коэффециент времени поездки по маршруту
         :param full_time_coef: суммарный коэффециент времени маршрута
-        :param session: сесси бд
+        :param day: дата поездки
+        :param network: снимок сети
         :return: время отправления по расписанию, время в пути, полное время поездки
         """
-        stmt = select(Timetable).where(Timetable.route_id == route_id).order_by(Timetable.start)
-        result = await session.execute(stmt)
-        results = result.fetchall()
-        timetable_start, timetable_trip, timetable_full = None, None, None
-        for row in results:
-            timetable = row[0]
-            start = timetable.start.hour * 60 + timetable.start.minute
-            lap = timetable.lap.hour * 60 + timetable.lap.minute
-            begin = start + lap * before_time_coef / full_time_coef
-            if (begin >= fact_time):
-                timetable_start = begin
-                timetable_trip = lap * time_coef / full_time_coef
-                timetable_full = begin - fact_time + timetable_trip
-                break
-        return timetable_start, timetable_trip, timetable_full
+        return NavigationService.check_schedule(network.schedule(route_id, day), fact_time, before_time_coef,
+                                                time_coef, full_time_coef)
+
+    @staticmethod
+    async def check_vehicles(route_id: int, fact_time: int, before_time_coef: float, time_coef: float,
+                             full_time_coef: float, day: datetime.date,
+                             network: NetworkSnapshot) -> Tuple[int, int, int]:
+        """
+        Оценивает время в пути по интервалам движения
+        :param route_id: айди маршрута
+        :param fact_time: текущее время в минутах после полуночи
+        :param before_time_coef: коэффециент времени пройденного маршрута
+        :param time_coef: коэффециент времени поездки по маршруту
+        :param full_time_coef: суммарный коэффециент времени маршрута
+        :param day: дата поездки
+        :param network: снимок сети
+        :return: расчетное время отправления, время в пути, полное время поездки
+        """
+        return NavigationService.check_schedule(network.headway_schedule(route_id, day), fact_time,
+                                                before_time_coef, time_coef, full_time_coef)
+
+    @staticmethod
+    def check_schedule(schedule: Optional[TripSchedule], fact_time: int, before_time_coef: float, time_coef: float,
+                       full_time_coef: float) -> Tuple[int, int, int]:
+        """
+        Ближайший рейс по отправлениям маршрута
+        :param schedule: отправления маршрута на дату поездки
+        :param fact_time: текущее время в минутах после полуночи
+        :param before_time_coef: коэффециент времени пройденного маршрута
+        :param time_coef: коэффециент времени поездки по маршруту
+        :param full_time_coef: суммарный коэффециент времени маршрута
+        :return: время отправления, время в пути, полное время поездки
+        """
+        start, trip_time, full = None, None, None
+        if schedule is None or not full_time_coef:
+            return start, trip_time, full
+        trip = schedule.next_trip(fact_time, before_time_coef / full_time_coef)
+        if trip is not None:
+            start = schedule.depart(trip, before_time_coef / full_time_coef)
+            trip_time = schedule.lap(trip) * time_coef / full_time_coef
+            full = start - fact_time + trip_time
+        return start, trip_time, full
 
     @staticmethod
     async def create_simple_routes(stops_from: List[int], stops_to: List[int], care: bool, priority: int,
-                                   fact_time: int, session: AsyncSession) -> Tuple[List[RouteSimple], Dict[Route, int]]:
+                                   fact_time: int,
+                                   network: NetworkSnapshot) -> Tuple[List[RouteSimple], Dict[int, int]]:
         """
         Построение беспересадочных маршрутов
         :param stops_from: множество начальных отсановок
@@ -120,436 +246,422 @@ class NavigationService:
         :param care: необходимость низкопольного ПС
         :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
         :param fact_time: текущее время в минутах после полуночи
-        :param session: сессия БД
+        :param network: снимок сети
         :return: модели беспересадочных маршрутов, краткая статистика по маршрутам
         """
 
-        # Создание псевдонимов таблиц
-        s1 = aliased(Section)
-        s2 = aliased(Section)
-        stop_table = aliased(Stop)
-        chart_table = aliased(Chart)
-
-        # Запрос выбора маршрута из БД
-        stmt = (select(s1, s2)
-                .join(s2, s1.route_id == s2.route_id)
-                .where(s1.stop_id.in_(stops_from), s2.stop_id.in_(stops_to), s1.order < s2.order)
-                .order_by(s1.route_id))
-        result = await session.execute(stmt)
-        results = result.fetchall()
-
-        # Датасет маршрутов
-        routes_df = pd.DataFrame(
-            {'route': [], 'home': [], 'end': [], 'long': [], 'load': [], 'time_label': [], 'time_begin': [],
-             'time_road': [],
-             'full_time': [], 'weight_time': [], 'stop_id': []})
-
-        # Выбор маршрутов из БД
-        for row in results:
-            section1, section2 = row
-            route = await session.get(Route, section1.route_id)
-            if route.stage != 1:
-                continue
-            if care and not route.care:
-                continue
-            routes_df.loc[len(routes_df)] = [route, section1.order, section2.order, section2.order - section1.order, 9,
-                                             'Нет отправлений', '-', '-',
-                                             9999, 9999, section1.stop_id]
+        # Кандидаты в маршруты
+        candidates: List[RouteCandidate] = []
+
+        # Выбор действующих маршрутов из снимка сети
+        for route_id, home, end, stop_id in NavigationService.find_sections(stops_from, stops_to, care, network):
+            candidates.append(RouteCandidate(network.routes[route_id], home, end, stop_id))
 
         days_ru = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
         today = datetime.date.today()
         weekday_num = today.weekday()
         weekday_ru = days_ru[weekday_num]
 
+        # Оценка загруженности всех маршрутов одним пакетом
+        predicted_loads = NavigationService.predict_loads(
+            [(candidate.route.id, candidate.home, candidate.stop_id, fact_time) for candidate in candidates],
+            weekday_ru)
+
         # Уточнение маршрутов
-        for i, row_df in routes_df.iterrows():
-            route, home, end, long, load, t1, t2, t3, t4, t5, stop1 = row_df
+        for candidate, max_load in zip(candidates, predicted_loads):
+            route, home, end = candidate.route, candidate.home, candidate.end
 
             # Оценка загруженности
-            try:
-                pi = PredictionInput(route_id=route.id,
-                                     order=home,
-                                     stop_id=stop1,
-                                     time=f'{int(fact_time // 60):02}:{int(fact_time % 60):02}:00',
-                                     day_of_week=weekday_ru)
-                predict = predict_passenger_count(pi)
-                max_load = min(predict['load_level_0_5'] + 1, 5)
-            except:
-                max_load = await NavigationService().analize_load(route.id, home, end, session)
-            time_coef = await NavigationService().analize_time(route.id, home, end, session)
-            routes_df.iloc[i, 4] = max_load
+            if max_load is None:
+                max_load = await NavigationService().analize_load(route.id, home, end, network)
+            time_coef = await NavigationService().analize_time(route.id, home, end, network)
+            candidate.load = max_load
 
             # Оценка времени
-            full_time_coef = await NavigationService().full_time_coeff(route.id, session)
-            before_time_coef = await NavigationService().before_time_coeff(route.id, home, session)
+            full_time_coef = await NavigationService().full_time_coeff(route.id, network)
+            before_time_coef = await NavigationService().before_time_coeff(route.id, home, network)
 
             # Оценка времени по графику
             timetable_start, timetable_trip, timetable_full \
                 = await NavigationService().check_timetables(route.id, fact_time, before_time_coef, time_coef,
-                                                             full_time_coef, session)
-            vehicles_start, vehicles_trip, vehicles_full = None, None, None
+                                                             full_time_coef, today, network)
+            # Оценка времени по интервалам движения
+            vehicles_start, vehicles_trip, vehicles_full \
+                = await NavigationService().check_vehicles(route.id, fact_time, before_time_coef, time_coef,
+                                                           full_time_coef, today, network)
 
             # Поиск наиболее быстрого выремени
-            if timetable_full and vehicles_full:
-                pass
-            elif timetable_full:
-                routes_df.iloc[i, 5] = 'По графику'
-                routes_df.iloc[i, 6] = f'в {int(timetable_start // 60):02}:{int(timetable_start % 60):02}'
-                routes_df.iloc[i, 7] = f'{int(timetable_trip // 60):02}:{int(timetable_trip % 60):02}'
-                routes_df.iloc[i, 8] = int(timetable_full)
-                routes_df.iloc[i, 9] = int(timetable_full - timetable_trip + (1 + 0.2 * max_load) * timetable_trip)
+            if timetable_full and (not vehicles_full or timetable_full <= vehicles_full):
+                candidate.set_time('По графику', timetable_start, timetable_trip, timetable_full, max_load)
             elif vehicles_full:
-                pass
+                candidate.set_time('По интервалам', vehicles_start, vehicles_trip, vehicles_full, max_load)
 
-        # Сортировка датасета маршрутов
+        # Сортировка маршрутов (устойчивая)
         if priority == 0:  # По загруженности
-            routes_df = routes_df.sort_values(by=['load', 'full_time', 'long'])
+            candidates.sort(key=lambda c: (c.load, c.full_time, c.long))
         elif priority == 1:  # По времени
-            routes_df = routes_df.sort_values(by=['full_time', 'load', 'long'])
+            candidates.sort(key=lambda c: (c.full_time, c.load, c.long))
         else:  # По взвешенному времени (баланс)
-            routes_df = routes_df.sort_values(by=['weight_time', 'load', 'long'])
-
-        # Ограничение поиска
-        routes_df.drop_duplicates(subset=['route'], keep='first', inplace=True, ignore_index=True)
-        #
-
-        routes_df['route_id'] = [routes_df.iloc[i, 0].id for i in range(len(routes_df))]
-        # Определение брифа беспересадочных маршрутов
-        routes_brief = routes_df.set_index('route_id')['long']
-        # routes_df = routes_df.head(10)
+            candidates.sort(key=lambda c: (c.weight_time, c.load, c.long))
+
+        # Ограничение поиска: лучший вариант каждого маршрута
+        # и определение брифа беспересадочных маршрутов {айди маршрута: длина поездки}
+        routes_brief: Dict[int, int] = {}
+        selected = []
+        for candidate in candidates:
+            if candidate.route.id in routes_brief:
+                continue
+            routes_brief[candidate.route.id] = candidate.long
+            selected.append(candidate)
 
         # Подготовка json-ответа
         simple_routes = []
-        for _, row_df in routes_df.iterrows():
-            route, home, end, long, load, time_label, time_begin, time_road, t4, t5, stop1, rid = row_df
-            stmt = (select(s1, stop_table, chart_table)
-                    .join(stop_table, stop_table.id == s1.stop_id)
-                    .join(chart_table, chart_table.id == s1.chart_id, isouter=True)
-                    .where(s1.order >= home, s1.order <= end, s1.route_id == route.id)
-                    .order_by(s1.order))
-            result = await session.execute(stmt)
-            results = result.fetchall()
-            stops = []
-            for row in results:
-                section, stop, chart = row
-                stops.append(Coord(lat=stop.lat, lon=stop.lon))
-                if chart and section.order < end:
-                    for i in range(min(len(chart.lats), len(chart.lons))):
-                        stops.append(Coord(lat=chart.lats[i], lon=chart.lons[i]))
+        for candidate in selected:
+            route = candidate.route
+            stops = network.geometry(route.id, candidate.home, candidate.end)
             simple_routes.append(
-                RouteSimple(route_id=route.id, info=route.info, label=route.label, number=route.number, load=load,
-                            stops=stops, time_label=time_label, time_begin=time_begin, time_road=time_road))
-            # route = await session.get(Route, section.route_id)
-            # routes.append(route)
+                RouteSimple.construct(route_id=route.id, info=route.info, label=route.label, number=route.number,
+                                      load=candidate.load, stops=stops, time_label=candidate.time_label,
+                                      time_begin=candidate.time_begin, time_road=candidate.time_road))
         return simple_routes, routes_brief
 
     @staticmethod
-    async def create_double_routes(stops_from: List[int], stops_to: List[int], care: bool, priority: int,
-                                   rb, fact_time: int, session: AsyncSession) -> List[RouteDouble]:
+    async def create_transfer_routes(stops_from: List[int], stops_to: List[int], care: bool, priority: int,
+                                     rb: Dict[int, int], fact_time: int, transfers: int,
+                                     network: NetworkSnapshot) -> Tuple[List[RouteDouble], List[RouteMulti]]:
         """
-        Построение маршрутов с 1 пересадкой
+        Построение маршрутов с пересадками
         :param stops_from: множество начальных отсановок
         :param stops_to: множество конечных отсановок
         :param care: необходимость низкопольного ПС
         :param priority: приоритет: 0 - загруженность, 1 - время, 2 - баланс
         :param rb: статистика по беспересадочным маршрутам
         :param fact_time: текущее время в минутах после полуночи
-        :param session: сессия БД
-        :return: модели маршрутов с 1 пересадкой
-        """
-        s1 = aliased(Section)
-        s2 = aliased(Section)
-
-        s3 = aliased(Section)
-        s4 = aliased(Section)
-
-        stop1 = aliased(Stop)
-        stop2 = aliased(Stop)
-
-        stop_table = aliased(Stop)
-        chart_table = aliased(Chart)
-
-        stmt = (select(s1, s2, stop1, stop2, s3, s4)
-                .join(s2, s1.route_id == s2.route_id)
-                .join(stop1, s2.stop_id == stop1.id)
-                .join(stop2, stop1.tpu_id == stop2.tpu_id)
-                .join(s3, stop2.id == s3.stop_id)
-                .join(s4, s3.route_id == s4.route_id)
-                .where(s1.stop_id.in_(stops_from), s4.stop_id.in_(stops_to), s2.route_id != s3.route_id,
-                       s1.order < s2.order, s3.order < s4.order)
-                .order_by(s1.route_id, s3.route_id))
-
-        result = await session.execute(stmt)
-        results = result.fetchall()
-
-        double_routes_df = pd.DataFrame(
-            {'route1': [], 'home1': [], 'end1': [], 'long1': [], 'load1': [],
-             'time_label1': [], 'time_begin1': [], 'time_road1': [], 'stop1': [],
-             'route2': [], 'home2': [], 'end2': [], 'long2': [], 'load2': [],
-             'time_label2': [], 'time_begin2': [], 'time_road2': [], 'stop2': [],
-             'full_time': [], 'weight_time': [], 'max_load': [], 'start1': [], 'start2': []})
-
-        for row in results:
-            section1, section2, stop_1, stop_2, section3, section4 = row
-            route1 = await session.get(Route, section1.route_id)
-            route2 = await session.get(Route, section3.route_id)
-            if route1.stage != 1 or route2.stage != 1:
-                continue
-            if care and (not route1.care or not route2.care):
-                continue
-            double_routes_df.loc[len(double_routes_df)] = \
-                [route1, section1.order, section2.order, section2.order - section1.order, 9, 'Нет отправлений', 'None',
-                 'None', stop_1.name,
-                 route2, section3.order, section4.order, section4.order - section3.order, 9, 'Нет отправлений', 'None',
-                 'None', stop_2.name,
-                 99999, 9999, 9, section1.stop_id, section3.stop_id]
-
-        # Ограничение поиска
-        double_routes_df = double_routes_df.sort_values(by=['long1', 'long2'])
-        double_routes_df.drop_duplicates(subset=['route1', 'route2'], keep='first', inplace=True, ignore_index=True)
-        routes_cache = {}  # Кэш оценки загруженности маршрутов: {(route_id, stop_id): load}
-
-        # Оценка загруженности 1 и 2 маршртуа
+        :param transfers: максимальное число пересадок
+        :param network: снимок сети
+        :return: модели маршрутов с 1 пересадкой, модели маршрутов с несколькими пересадками
+        """
         days_ru = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
         today = datetime.date.today()
         weekday_num = today.weekday()
         weekday_ru = days_ru[weekday_num]
-        for i, row_df in double_routes_df.iterrows():
-            route1, home1, end1, long1, load1, time_label1, time_begin1, time_road1, stop1, \
-                route2, home2, end2, long2, load2, time_label2, time_begin2, time_road2, stop2, tt, ll, ww, \
-                stop_id1, stop_id2 = row_df
-            if (route1.id, stop_id1) in routes_cache.keys():
-                max_load1 = routes_cache[(route1.id, stop_id1)]
-            else:
-                try:
-                    pi = PredictionInput(route_id=route1.id,
-                                         order=home1,
-                                         stop_id=stop_id1,
-                                         time=f'{int(fact_time // 60):02}:{int(fact_time % 60):02}:00',
-                                         day_of_week=weekday_ru)
-                    predict = predict_passenger_count(pi)
-                    max_load1 = min(predict['load_level_0_5'] + 1, 5)
-                except:
-                    max_load1 = await NavigationService().analize_load(route1.id, home1, end1, session)
-                routes_cache[(route1.id, stop_id1)] = max_load1
-            double_routes_df.iloc[i, 4] = max_load1
-
-            if (route2.id, stop_id2) in routes_cache.keys():
-                max_load2 = routes_cache[(route2.id, stop_id2)]
-            else:
-                try:
-                    pi = PredictionInput(route_id=route2.id,
-                                         order=home2,
-                                         stop_id=stop_id2,
-                                         time=f'{int(fact_time // 60):02}:{int(fact_time % 60):02}:00',
-                                         day_of_week=weekday_ru)
-                    predict = predict_passenger_count(pi)
-                    max_load2 = min(predict['load_level_0_5'] + 1, 5)
-                except:
-                    max_load2 = await NavigationService().analize_load(route2.id, home2, end2, session)
-                routes_cache[(route2.id, stop_id2)] = max_load2
-            double_routes_df.iloc[i, 13] = max_load2
-
-            double_routes_df.iloc[i, 20] = max(max_load1, max_load2)
-
-        for i, row_df in double_routes_df.iterrows():
-            route1, home1, end1, long1, load1, time_label1, time_begin1, time_road1, stop1, \
-                route2, home2, end2, long2, load2, time_label2, time_begin2, time_road2, stop2, tt, ll, max_load, \
-                stop_id1, stop_id2 = row_df
-
-            time_coef1 = await NavigationService().analize_time(route1.id, home1, end1, session)
-            time_coef2 = await NavigationService().analize_time(route2.id, home2, end2, session)
-
-            # Оценка времени 1 маршртуа
-            full_time_coef1 = await NavigationService().full_time_coeff(route1.id, session)
-            before_time_coef1 = await NavigationService().before_time_coeff(route1.id, home1, session)
-
-            # Оценка времени по графику 1 маршрута
-            timetable_start1, timetable_trip1, timetable_full1 \
-                = await NavigationService().check_timetables(route1.id, fact_time, before_time_coef1, time_coef1,
-                                                             full_time_coef1, session)
-            vehicles_start1, vehicles_trip1, vehicles_full1, real1 = None, None, None, None
-
-            # Поиск наиболее быстрого выремени 1 маршрута
-            if timetable_full1 and vehicles_full1:
-                pass
-            elif timetable_full1:
-                double_routes_df.iloc[i, 5] = 'По графику'
-                double_routes_df.iloc[i, 6] = f'в {int(timetable_start1 // 60):02}:{int(timetable_start1 % 60):02}'
-                double_routes_df.iloc[i, 7] = f'{int(timetable_trip1 // 60):02}:{int(timetable_trip1 % 60):02}'
-                real1 = timetable_full1
-            elif vehicles_full1:
-                pass
-
-            if real1:
-                # Оценка времени 2 маршртуа
-                full_time_coef2 = await NavigationService().full_time_coeff(route2.id, session)
-                before_time_coef2 = await NavigationService().before_time_coeff(route2.id, home2, session)
-
-                # Оценка времени по графику 2 маршрута
-                timetable_start2, timetable_trip2, timetable_full2 \
-                    = await NavigationService().check_timetables(route2.id, fact_time + real1 + 1, before_time_coef2,
-                                                                 time_coef2,
-                                                                 full_time_coef2, session)
-                vehicles_start2, vehicles_trip2, vehicles_full2 = None, None, None
-
-                # Поиск наиболее быстрого выремени 2 маршрута
-                if timetable_full2 and vehicles_full2:
-                    pass
-                elif timetable_full2:
-                    double_routes_df.iloc[i, 14] = 'По графику'
-                    double_routes_df.iloc[i, 15] = f'в {int(timetable_start2 // 60):02}:{int(timetable_start2 % 60):02}'
-                    double_routes_df.iloc[i, 16] = f'{int(timetable_trip2 // 60):02}:{int(timetable_trip2 % 60):02}'
-                    double_routes_df.iloc[i, 18] = int(timetable_full2)
-                    double_routes_df.iloc[i, 19] = int(
-                        timetable_full2 - timetable_trip2 + (1 + 0.2 * max_load) * timetable_trip2)
-                elif vehicles_full2:
-                    pass
-
-        # Сортировка датасета маршрутов
+
+        journeys = [journey for journey in
+                    RaptorService.plan(network, stops_from, stops_to, fact_time, transfers, care, today)
+                    if journey.transfers > 0]
+        candidates = await NavigationService.transfer_candidates(
+            [(journey, (True,) * len(journey.legs)) for journey in journeys], fact_time, weekday_ru, network)
+
+        # Сортировка маршрутов
         if priority == 0:  # По загруженности
-            double_routes_df = double_routes_df.sort_values(
-                by=['max_load', 'load1', 'load2', 'long1', 'long2', 'full_time'])
+            candidates.sort(key=lambda c: (c.max_load, c.loads, c.longs, c.full_time))
         elif priority == 1:  # По времени
-            double_routes_df = double_routes_df.sort_values(
-                by=['full_time', 'max_load', 'load1', 'load2', 'long1', 'long2'])
+            candidates.sort(key=lambda c: (c.full_time, c.max_load, c.loads, c.longs))
         else:  # По взвешенному времени (баланс)
-            double_routes_df = double_routes_df.sort_values(
-                by=['weight_time', 'max_load', 'load1', 'load2', 'long1', 'long2'])
-
-        def should_drop(row):
-            key = row['route1'].id
-            val_b = row['long1']
-            if key in rb:
-                val_a = rb[key]
-                if val_b > val_a:
-                    return True
-            key = row['route2'].id
-            val_b = row['long2']
-            if key in rb:
-                val_a = rb[key]
-                if val_b > val_a:
+            candidates.sort(key=lambda c: (c.weight_time, c.max_load, c.loads, c.longs))
+
+        def should_drop(journey: Journey) -> bool:
+            for leg in journey.legs:
+                if leg.route_id in rb and leg.end - leg.home > rb[leg.route_id]:
                     return True
             return False
 
-        double_routes_df = double_routes_df[~double_routes_df.apply(should_drop, axis=1)].reset_index(drop=True)
-
-        double_routes_df = double_routes_df.head(4)
-
-        double_routes = []
-        for i, row_df in double_routes_df.iterrows():
-            route1, home1, end1, long1, load1, time_label1, time_begin1, time_road1, stop1, \
-                route2, home2, end2, long2, load2, time_label2, time_begin2, time_road2, stop2, tt, ll, ww, \
-                stop_id1, stop_id2 = row_df
-
-            stmt = (select(s1, stop_table, chart_table)
-                    .join(stop_table, stop_table.id == s1.stop_id)
-                    .join(chart_table, chart_table.id == s1.chart_id, isouter=True)
-                    .where(s1.order >= home1, s1.order <= end1, s1.route_id == route1.id)
-                    .order_by(s1.order))
-            result = await session.execute(stmt)
-            results = result.fetchall()
-            stops1 = []
-            for row in results:
-                section, stop, chart = row
-                stops1.append(Coord(lat=stop.lat, lon=stop.lon))
-                if chart and section.order < end1:
-                    for i in range(min(len(chart.lats), len(chart.lons))):
-                        stops1.append(Coord(lat=chart.lats[i], lon=chart.lons[i]))
-
-            stmt = (select(s1, stop_table, chart_table)
-                    .join(stop_table, stop_table.id == s1.stop_id)
-                    .join(chart_table, chart_table.id == s1.chart_id, isouter=True)
-                    .where(s1.order >= home2, s1.order <= end2, s1.route_id == route2.id)
-                    .order_by(s1.order))
-            result = await session.execute(stmt)
-            results = result.fetchall()
-            stops2 = []
-            for row in results:
-                section, stop, chart = row
-                stops2.append(Coord(lat=stop.lat, lon=stop.lon))
-                if chart and section.order < end2:
-                    for i in range(min(len(chart.lats), len(chart.lons))):
-                        stops2.append(Coord(lat=chart.lats[i], lon=chart.lons[i]))
-
-            double_routes.append(
-                RouteDouble(route_id1=route1.id, info1=route1.info,
-                            label1=route1.label, number1=route1.number, load1=load1, stops1=stops1, stop1=stop1,
-                            time_label1=time_label1, time_begin1=time_begin1, time_road1=time_road1,
-                            route_id2=route2.id, info2=route2.info,
-                            label2=route2.label, number2=route2.number, load2=load2, stops2=stops2, stop2=stop2,
-                            time_label2=time_label2, time_begin2=time_begin2, time_road2=time_road2
-                            ))
-        return double_routes
+        # Ограничение поиска: одна комбинация маршрутов, не длиннее беспересадочных
+        selected = []
+        seen = set()
+
+        def select(candidates: List[TransferCandidate]) -> None:
+            for candidate in candidates:
+                if len(selected) >= 4:
+                    break
+                key = tuple(leg.route_id for leg in candidate.journey.legs)
+                if key in seen or should_drop(candidate.journey):
+                    continue
+                seen.add(key)
+                selected.append(candidate)
+
+        select(candidates)
+
+        # Пересадки на маршруты без графика и интервалов движения RAPTOR не находит:
+        # они дополняют выдачу после путей с известным временем поездки
+        if len(selected) < 4:
+            unscheduled = await NavigationService.transfer_candidates(
+                NavigationService.unscheduled_journeys(stops_from, stops_to, care, fact_time, today, network),
+                fact_time, weekday_ru, network)
+            if priority == 0:  # По загруженности
+                unscheduled.sort(key=lambda c: (c.max_load, c.loads, c.longs))
+            else:  # По длине поездки
+                unscheduled.sort(key=lambda c: (sum(c.longs), c.max_load, c.loads))
+            select(unscheduled)
+
+        double_routes, multi_routes = [], []
+        for candidate in selected:
+            legs = [NavigationService.create_leg(leg, load, network, scheduled)
+                    for leg, load, scheduled in zip(candidate.journey.legs, candidate.loads, candidate.scheduled)]
+            if len(legs) == 2:
+                leg1, leg2 = legs
+                double_routes.append(
+                    RouteDouble.construct(
+                        route_id1=leg1.route_id, info1=leg1.info,
+                        label1=leg1.label, number1=leg1.number, load1=leg1.load, stops1=leg1.stops,
+                        stop1=leg1.stop_out,
+                        time_label1=leg1.time_label, time_begin1=leg1.time_begin, time_road1=leg1.time_road,
+                        route_id2=leg2.route_id, info2=leg2.info,
+                        label2=leg2.label, number2=leg2.number, load2=leg2.load, stops2=leg2.stops,
+                        stop2=leg2.stop_in,
+                        time_label2=leg2.time_label, time_begin2=leg2.time_begin, time_road2=leg2.time_road))
+            else:
+                multi_routes.append(RouteMulti.construct(load=candidate.max_load, legs=legs))
+        return double_routes, multi_routes
+
+    @staticmethod
+    def create_leg(leg, load: int, network: NetworkSnapshot, scheduled: bool = True) -> RouteLeg:
+        """
+        Формирование json-модели поездки на одном маршруте
+        :param leg: поездка в составе пути
+        :param load: оценка загруженности
+        :param network: снимок сети
+        :param scheduled: известно ли время поездки
+        :return: модель поездки
+        """
+        route = network.routes[leg.route_id]
+        trip = leg.arrive - leg.depart
+        stops = network.geometry(route.id, leg.home, leg.end)
+        if scheduled:
+            time_label = 'По графику'
+            time_begin = f'в {int(leg.depart // 60):02}:{int(leg.depart % 60):02}'
+            time_road = f'{int(trip // 60):02}:{int(trip % 60):02}'
+        else:
+            time_label, time_begin, time_road = 'Нет отправлений', 'None', 'None'
+        return RouteLeg.construct(route_id=route.id, info=route.info, label=route.label, number=route.number,
+                                  load=load, stops=stops, time_label=time_label, time_begin=time_begin,
+                                  time_road=time_road,
+                                  stop_in=network.stops[leg.board_stop].name,
+                                  stop_out=network.stops[leg.alight_stop].name)
+
+    @staticmethod
+    def predict_loads(rows: List[Tuple[int, int, int, int]], weekday_ru: str) -> List[Optional[int]]:
+        """
+        Пакетная оценка загруженности поездок моделью
+        :param rows: список (айди маршрута, порядковый номер участка посадки, остановка посадки,
+                     время посадки в минутах после полуночи)
+        :param weekday_ru: день недели
+        :return: уровни загруженности [1-5]; None, если модель не дала оценку
+        """
+        if not rows:
+            return []
+        try:
+            levels = MlService.predict_load_levels(
+                [(route_id, order, stop_id, time, weekday_ru) for route_id, order, stop_id, time in rows])
+        except Exception:
+            return [None] * len(rows)
+        return [None if level is None else min(level + 1, 5) for level in levels]
+
+    @staticmethod
+    async def transfer_candidates(journeys: List[Tuple[Journey, Tuple[bool, ...]]], fact_time: int,
+                                  weekday_ru: str, network: NetworkSnapshot) -> List[TransferCandidate]:
+        """
+        Оценка загруженности и времени путей с пересадками
+        :param journeys: список (путь, известно ли время каждой поездки)
+        :param fact_time: текущее время в минутах после полуночи
+        :param weekday_ru: день недели
+        :param network: снимок сети
+        :return: кандидаты в маршруты с пересадками
+        """
+        # Оценка загруженности всех поездок одним пакетом
+        legs = list({(leg.route_id, leg.home, leg.board_stop, int(leg.depart)): leg
+                     for journey, _ in journeys for leg in journey.legs}.values())
+        predicted_loads = NavigationService.predict_loads(
+            [(leg.route_id, leg.home, leg.board_stop, int(leg.depart)) for leg in legs], weekday_ru)
+        routes_cache = {}  # Кэш оценки загруженности поездок: {(route_id, home, stop_id, time): load}
+        for leg, max_load in zip(legs, predicted_loads):
+            if max_load is None:
+                max_load = await NavigationService().analize_load(leg.route_id, leg.home, leg.end, network)
+            routes_cache[(leg.route_id, leg.home, leg.board_stop, int(leg.depart))] = max_load
+
+        candidates = []
+        for journey, scheduled in journeys:
+            loads = tuple(routes_cache[(leg.route_id, leg.home, leg.board_stop, int(leg.depart))]
+                          for leg in journey.legs)
+            max_load = max(loads)
+            longs = tuple(leg.end - leg.home for leg in journey.legs)
+            full_time = int(journey.arrival - fact_time)
+            trip_time = sum(leg.arrive - leg.depart for leg in journey.legs)
+            weight_time = int(full_time + 0.2 * max_load * trip_time)
+            candidates.append(TransferCandidate(journey, loads, longs, max_load, full_time, weight_time, scheduled))
+        return candidates
+
+    @staticmethod
+    def unscheduled_journeys(stops_from: List[int], stops_to: List[int], care: bool, fact_time: int,
+                             day: datetime.date,
+                             network: NetworkSnapshot) -> List[Tuple[Journey, Tuple[bool, ...]]]:
+        """
+        Пути с одной пересадкой внутри ТПУ, в которых хотя бы у одного маршрута нет отправлений на дату.
+        Для каждой пары маршрутов остается один путь с наименьшим числом участков
+        :param stops_from: множество начальных отсановок
+        :param stops_to: множество конечных отсановок
+        :param care: только низкопольные маршруты
+        :param fact_time: текущее время в минутах после полуночи
+        :param day: дата поездки
+        :param network: снимок сети
+        :return: список (путь, известно ли время каждой поездки)
+        """
+        # Конечные участки маршрутов по возрастанию порядкового номера
+        ends: Dict[int, List[Tuple[int, int]]] = {}
+        for stop_id in stops_to:
+            for route_id, order in network.routes_at(stop_id, care):
+                ends.setdefault(route_id, []).append((order, stop_id))
+        for route_ends in ends.values():
+            route_ends.sort()
+
+        schedules: Dict[int, Optional[TripSchedule]] = {}
+
+        def schedule_of(route_id: int) -> Optional[TripSchedule]:
+            if route_id not in schedules:
+                schedules[route_id] = RaptorService.route_schedule(network, route_id, day)
+            return schedules[route_id]
+
+        # Лучшая пересадка каждой пары маршрутов:
+        # {(маршрут 1, маршрут 2): (число участков, (home1, end1, остановка посадки, остановка высадки,
+        #                                            home2, end2, остановка посадки, остановка высадки))}
+        pairs: Dict[Tuple[int, int], Tuple[int, Tuple[int, ...]]] = {}
+        for stop_id1 in stops_from:
+            for route_id1, home1 in network.routes_at(stop_id1, care):
+                scheduled1 = schedule_of(route_id1) is not None
+                route_sections = network.sections[route_id1]
+                for i in range(route_sections.position(home1 + 1), len(route_sections)):
+                    change1 = int(route_sections.stop_ids[i])
+                    tpu_id = network.stops[change1].tpu_id
+                    # Пересадка возможна только внутри ТПУ
+                    if tpu_id is None:
+                        continue
+                    end1 = int(route_sections.orders[i])
+                    for change2 in network.tpus.get(tpu_id, ()):
+                        for route_id2, home2 in network.routes_at(change2, care):
+                            route_ends = ends.get(route_id2)
+                            if route_id2 == route_id1 or not route_ends:
+                                continue
+                            # Пути из двух маршрутов с отправлениями находит RAPTOR
+                            if scheduled1 and schedule_of(route_id2) is not None:
+                                continue
+                            best = pairs.get((route_id1, route_id2))
+                            if best is not None and end1 - home1 >= best[0]:
+                                continue
+                            # Ближайший конечный участок после посадки
+                            j = bisect.bisect_left(route_ends, (home2 + 1,))
+                            if j == len(route_ends):
+                                continue
+                            end2, stop_id2 = route_ends[j]
+                            long = end1 - home1 + end2 - home2
+                            if best is None or long < best[0]:
+                                pairs[(route_id1, route_id2)] = (long, (home1, end1, stop_id1, change1,
+                                                                        home2, end2, change2, stop_id2))
+
+        journeys = []
+        for (route_id1, route_id2), (_, sections) in pairs.items():
+            home1, end1, stop_id1, change1, home2, end2, change2, stop_id2 = sections
+            leg1, scheduled1 = NavigationService.timed_leg(route_id1, home1, end1, stop_id1, change1, fact_time,
+                                                           schedule_of(route_id1), network)
+            ready = leg1.arrive
+            if scheduled1:
+                ready += (WALK_TIME if change2 != change1 else 0) + TRANSFER_TIME
+            leg2, scheduled2 = NavigationService.timed_leg(route_id2, home2, end2, change2, stop_id2, ready,
+                                                           schedule_of(route_id2), network)
+            journeys.append((Journey(arrival=leg2.arrive, load=0, legs=(leg1, leg2)), (scheduled1, scheduled2)))
+        return journeys
 
     @staticmethod
-    async def analize_load(route_id: int, home: int, end: int, session: AsyncSession) -> int:
+    def timed_leg(route_id: int, home: int, end: int, board_stop: int, alight_stop: int, ready: float,
+                  schedule: Optional[TripSchedule], network: NetworkSnapshot) -> Tuple[JourneyLeg, bool]:
+        """
+        Поездка на ближайшем рейсе маршрута
+        :param route_id: айди маршрута
+        :param home: начальный участок
+        :param end: конечный участок
+        :param board_stop: остановка посадки
+        :param alight_stop: остановка высадки
+        :param ready: время готовности к посадке в минутах после полуночи
+        :param schedule: отправления маршрута на дату поездки
+        :param network: снимок сети
+        :return: поездка, известно ли ее время; без рейса время отправления и прибытия равно ready
+        """
+        route_sections = network.sections[route_id]
+        full_time_coef = route_sections.full_time_coef()
+        if schedule is not None and full_time_coef:
+            fraction = route_sections.before_time_coef(home) / full_time_coef
+            trip = schedule.next_trip(ready, fraction)
+            if trip is not None:
+                depart = schedule.depart(trip, fraction)
+                arrive = schedule.depart(trip, route_sections.before_time_coef(end) / full_time_coef)
+                return JourneyLeg(route_id, home, end, board_stop, alight_stop, depart, arrive, 0), True
+        return JourneyLeg(route_id, home, end, board_stop, alight_stop, ready, ready, 0), False
+
+    @staticmethod
+    def find_sections(stops_from: List[int], stops_to: List[int], care: bool,
+                      network: NetworkSnapshot) -> List[Tuple[int, int, int, int]]:
+        """
+        Поиск пар участков одного действующего маршрута от начальных к конечным остановкам
+        :param stops_from: множество начальных отсановок
+        :param stops_to: множество конечных отсановок
+        :param care: только низкопольные маршруты
+        :param network: снимок сети
+        :return: список (айди маршрута, начальный участок, конечный участок, начальная остановка)
+        """
+        homes: Dict[int, List[Tuple[int, int]]] = {}
+        for stop_id in stops_from:
+            for route_id, order in network.routes_at(stop_id, care):
+                homes.setdefault(route_id, []).append((order, stop_id))
+
+        pairs = []
+        for stop_id in stops_to:
+            for route_id, end in network.routes_at(stop_id, care):
+                for home, home_stop_id in homes.get(route_id, ()):
+                    if home < end:
+                        pairs.append((route_id, home, end, home_stop_id))
+        pairs.sort(key=lambda pair: pair[0])
+        return pairs
+
+    @staticmethod
+    async def analize_load(route_id: int, home: int, end: int, network: NetworkSnapshot) -> int:
         """
         Вычисление загруженности промежутка маршрута
         :param route_id: айди маршрута
         :param home: первая остановка по ходу маршрута
         :param end: последння остановка по ходу маршрута
-        :param session: сессия БД
+        :param network: снимок сети
         :return:
         """
-        stmt = select(func.max(Section.load).label('max_load')
-                      ).where(Section.route_id == route_id, Section.order >= home, Section.order < end)
-        result = await session.execute(stmt)
-        values = result.one()
-        max_load = values[0]
-        return max_load
+        return network.sections[route_id].max_load(home, end)
 
     @staticmethod
-    async def analize_time(route_id: int, home: int, end: int, session: AsyncSession) -> float:
+    async def analize_time(route_id: int, home: int, end: int, network: NetworkSnapshot) -> float:
         """
         Вычисление загруженности времени маршрута
         :param route_id: айди маршрута
         :param home: первая остановка по ходу маршрута
         :param end: последння остановка по ходу маршрута
-        :param session: сессия БД
+        :param network: снимок сети
         :return:
         """
-        stmt = select(func.sum(Section.coef).label('time_coef')
-                      ).where(Section.route_id == route_id, Section.order >= home, Section.order < end)
-        result = await session.execute(stmt)
-        values = result.one()
-        time_coef = values[0]
-        return time_coef
+        return network.sections[route_id].time_coef(home, end)
 
     @staticmethod
-    async def full_time_coeff(route_id: int, session: AsyncSession) -> float:
+    async def full_time_coeff(route_id: int, network: NetworkSnapshot) -> float:
         """
         Вычисление загруженности промежутка маршрута
         :param route_id: айди маршрутка
-        :param home: 1 остановка по ходу движения
-        :param end: последння остановка по ходу движения
-        :param session: сессия БД
+        :param network: снимок сети
         :return:
         """
-        stmt = select(
-            func.sum(Section.coef).label('full_time'),
-        ).where(Section.route_id == route_id)
-        result = await session.execute(stmt)
-        values = result.one()
-        full_time = values[0]
-        return full_time
+        return network.sections[route_id].full_time_coef()
 
     @staticmethod
-    async def before_time_coeff(route_id: int, home: int, session: AsyncSession) -> float:
+    async def before_time_coeff(route_id: int, home: int, network: NetworkSnapshot) -> float:
         """
         Вычисление загруженности промежутка маршрута
         :param route_id: айди маршрутка
         :param home: 1 остановка по ходу движения
-        :param end: последння остановка по ходу движения
-        :param session: сессия БД
+        :param network: снимок сети
         :return:
         """
-        stmt = select(
-            func.sum(Section.coef).label('time_coef'),
-        ).where(Section.route_id == route_id, Section.order < home)
-        result = await session.execute(stmt)
-        values = result.one()
-        time_coef = values[0]
-        if time_coef is None:
-            return 0.0
-        return time_coef
+        return network.sections[route_id].before_time_coef(home)
@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from src.core.constants import (NAVIGATION_CACHE_BUCKET, NAVIGATION_CACHE_BYTES, NAVIGATION_CACHE_SIZE,
+                                NAVIGATION_CACHE_TTL)
+from src.services.network import NetworkService
+
+# Запись кэша: (момент устаревания, тело ответа, тип содержимого)
+CacheEntry = Tuple[float, bytes, str]
+
+_entries: "OrderedDict[Hashable, CacheEntry]" = OrderedDict()
+# Вычисляемые ответы: ключ -> задача вычисления и число ожидающих ее запросов
+_inflight: Dict[Hashable, asyncio.Task] = {}
+_waiters: Dict[Hashable, int] = {}
+_stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+_state = {"bytes": 0, "version": None}
+_lock = threading.Lock()
+
+
+class NavigationCacheService:
+    """
+    Кэш готовых ответов навигации (TTL + LRU) с ограничением по числу записей и объему.
+    Ответы зависят только от снимка сети, поэтому при смене его версии кэш очищается.
+    Одновременные одинаковые промахи вычисляются один раз.
+    """
+
+    @staticmethod
+    def key(from_id: int, to_id: int, care: bool, change: bool, priority: int, fact_time: int, transfers: int,
+            geometry: str, media: str) -> Hashable:
+        """
+        Ключ ответа: пересадочные узлы, флаги и интервал времени отправления
+        :param from_id: начальная остановка
+        :param to_id: конечная остановка
+        :param care: только низкопольный пс?
+        :param change: делать ли пересадки?
+        :param priority: приоритет
+        :param fact_time: время отправления в минутах после полуночи
+        :param transfers: максимальное число пересадок
+        :param geometry: формат геометрии
+        :param media: тип содержимого ответа
+        :return: ключ
+        """
+        network = NetworkService.get()
+        stops_from, stops_to = (network.stop_group(stop_id) if stop_id in network.stops else [stop_id]
+                                for stop_id in (from_id, to_id))
+        return NavigationCacheService.groups_key(stops_from, stops_to, care, change, priority, fact_time, transfers,
+                                                 geometry, media)
+
+    @staticmethod
+    def groups_key(stops_from: Iterable[int], stops_to: Iterable[int], care: bool, change: bool, priority: int,
+                   fact_time: int, transfers: int, geometry: str, media: str) -> Hashable:
+        """
+        Ключ ответа по группам остановок отправления и прибытия
+        (запросы по координатам, привязанные к одним и тем же остановкам, делят одну запись)
+        :param stops_from: остановки отправления
+        :param stops_to: остановки прибытия
+        :param care: только низкопольный пс?
+        :param change: делать ли пересадки?
+        :param priority: приоритет
+        :param fact_time: время отправления в минутах после полуночи
+        :param transfers: максимальное число пересадок
+        :param geometry: формат геометрии
+        :param media: тип содержимого ответа
+        :return: ключ
+        """
+        network = NetworkService.get()
+        return (network.version, tuple(sorted(set(stops_from))), tuple(sorted(set(stops_to))), care, change,
+                priority, fact_time // max(NAVIGATION_CACHE_BUCKET, 1), datetime.date.today(), transfers, geometry,
+                media)
+
+    @staticmethod
+    def get(key: Hashable) -> Optional[CacheEntry]:
+        """
+        Поиск ответа в кэше
+        :return: запись или None
+        """
+        with _lock:
+            NavigationCacheService.check_version()
+            entry = _entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                NavigationCacheService.remove(key)
+                _stats["expired"] += 1
+                return None
+            _entries.move_to_end(key)
+            return entry
+
+    @staticmethod
+    def put(key: Hashable, body: bytes, media_type: str) -> None:
+        """
+        Сохраняет ответ и вытесняет давно не использованные записи сверх лимитов
+        """
+        if len(body) > NAVIGATION_CACHE_BYTES:
+            return
+        with _lock:
+            NavigationCacheService.check_version()
+            if key in _entries:
+                NavigationCacheService.remove(key)
+            _entries[key] = (time.monotonic() + NAVIGATION_CACHE_TTL, body, media_type)
+            _state["bytes"] += len(body)
+            while len(_entries) > NAVIGATION_CACHE_SIZE or _state["bytes"] > NAVIGATION_CACHE_BYTES:
+                NavigationCacheService.remove(next(iter(_entries)))
+                _stats["evictions"] += 1
+
+    @staticmethod
+    def remove(key: Hashable) -> None:
+        """
+        Удаляет запись (вызывается под блокировкой)
+        """
+        entry = _entries.pop(key)
+        _state["bytes"] -= len(entry[1])
+
+    @staticmethod
+    def check_version() -> None:
+        """
+        Очищает кэш, если снимок сети сменился (вызывается под блокировкой)
+        """
+        version = NetworkService.get().version
+        if _state["version"] != version:
+            if _entries:
+                _stats["invalidations"] += 1
+            _entries.clear()
+            _state["bytes"] = 0
+            _state["version"] = version
+
+    @staticmethod
+    async def get_or_compute(key: Hashable, compute: Callable[[], Awaitable[Tuple[bytes, str]]]) -> CacheEntry:
+        """
+        Возвращает ответ из кэша или вычисляет его.
+        Запросы с тем же ключом, пришедшие во время вычисления, ждут его результат
+        :param key: ключ ответа
+        :param compute: построение ответа: (тело, тип содержимого)
+        :return: запись кэша
+        """
+        entry = NavigationCacheService.get(key)
+        if entry is not None:
+            with _lock:
+                _stats["hits"] += 1
+            return entry
+
+        task = _inflight.get(key)
+        if task is not None:
+            with _lock:
+                _stats["coalesced"] += 1
+        else:
+            with _lock:
+                _stats["misses"] += 1
+            # Вычисление идет отдельной задачей: отмена запроса, начавшего его, не затрагивает остальных
+            task = asyncio.get_running_loop().create_task(NavigationCacheService.build(key, compute))
+            _inflight[key] = task
+            _waiters[key] = 0
+            task.add_done_callback(lambda done: NavigationCacheService.finish(key, done))
+        _waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if _inflight.get(key) is task:
+                _waiters[key] -= 1
+                # Ушел последний ожидающий (клиенты отключились) - вычисление больше никому не нужно
+                if _waiters[key] == 0 and not task.done():
+                    del _inflight[key], _waiters[key]
+                    task.cancel()
+
+    @staticmethod
+    async def build(key: Hashable, compute: Callable[[], Awaitable[Tuple[bytes, str]]]) -> CacheEntry:
+        """
+        Вычисляет ответ и сохраняет его в кэш
+        :param key: ключ ответа
+        :param compute: построение ответа: (тело, тип содержимого)
+        :return: запись кэша
+        """
+        body, media_type = await compute()
+        NavigationCacheService.put(key, body, media_type)
+        return 0.0, body, media_type
+
+    @staticmethod
+    def finish(key: Hashable, task: asyncio.Task) -> None:
+        """
+        Снимает завершенное вычисление с учета
+        """
+        if _inflight.get(key) is task:
+            del _inflight[key], _waiters[key]
+        # Исключение передается ожидающим; если их нет, помечаем его полученным
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Метрики кэша
+        """
+        with _lock:
+            requests = _stats["hits"] + _stats["misses"] + _stats["coalesced"]
+            return {**_stats,
+                    "hit_rate": round((_stats["hits"] + _stats["coalesced"]) / requests, 3) if requests else 0.0,
+                    "entries": len(_entries), "bytes": _state["bytes"], "max_entries": NAVIGATION_CACHE_SIZE,
+                    "max_bytes": NAVIGATION_CACHE_BYTES, "ttl": NAVIGATION_CACHE_TTL}
+
+    @staticmethod
+    def clear() -> None:
+        """
+        Очищает кэш
+        """
+        with _lock:
+            _entries.clear()
+            _state["bytes"] = 0
@@ -0,0 +1,855 @@
+import asyncio
+import bisect
+import copy
+import itertools
+import json
+import logging
+import threading
+import traceback
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from src.core.constants import NETWORK_REVISION_INTERVAL
+from src.core.db import SessionLocal
+from src.models.logistic import Route, Section, Stop, Chart, Timetable, Traffic, NetworkRevision
+from src.services.spatial import StopIndex, haversine
+from src.utils.json_writer import RawJson
+from src.utils.polyline import PRECISION, encode_value
+
+
+class RouteInfo:
+    """
+    Запись маршрута в снимке сети (только для чтения)
+    """
+    __slots__ = ('id', 'number', 'label', 'title', 'info', 'stage', 'care')
+
+    def __init__(self, id: int, number: str, label: str, title: str, info: Optional[str], stage: int, care: bool):
+        self.id = id
+        self.number = number
+        self.label = label
+        self.title = title
+        self.info = info
+        self.stage = stage
+        self.care = care
+
+
+class StopInfo(NamedTuple):
+    """
+    Неизменяемая запись остановки в снимке сети
+    """
+    id: int
+    name: str
+    about: Optional[str]
+    lat: float
+    lon: float
+    stage: int
+    tpu_id: Optional[int]
+
+
+class TimetableInfo(NamedTuple):
+    """
+    Постоянный график в минутах после полуночи
+    """
+    start: int
+    lap: int
+    day: Optional[date]
+
+
+class TripSchedule:
+    """
+    Отправления маршрута на один день: начала рейсов и длительности кругов в минутах,
+    упорядоченные по началу. Поиск ближайшего рейса выполняется бинарным поиском.
+    """
+    __slots__ = ('starts', 'laps', 'fifo', '_starts', '_laps', '_lap', '_max_lap')
+
+    def __init__(self, timetables: List[TimetableInfo]):
+        """
+        :param timetables: графики одного дня
+        """
+        starts = np.array([timetable.start for timetable in timetables], dtype=np.int32)
+        laps = np.array([timetable.lap for timetable in timetables], dtype=np.int32)
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.laps = laps[order]
+        for array in (self.starts, self.laps):
+            array.flags.writeable = False
+        self._starts: List[int] = self.starts.tolist()
+        self._laps: List[int] = self.laps.tolist()
+        # Общая длительность круга, если она одинакова у всех рейсов
+        self._lap: Optional[int] = self._laps[0] if len(set(self._laps)) == 1 else None
+        self._max_lap: int = max(self._laps, default=0)
+        # Рейсы не обгоняют друг друга: более ранний по началу рейс проходит любую точку не позже
+        self.fifo: bool = bool(np.all(np.diff(self.starts + self.laps) >= 0))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def depart(self, trip: int, fraction: float) -> float:
+        """
+        Время прохождения рейсом точки маршрута
+        :param trip: индекс рейса
+        :param fraction: доля времени маршрута, пройденная до точки
+        :return: время в минутах после полуночи
+        """
+        return self._starts[trip] + self._laps[trip] * fraction
+
+    def lap(self, trip: int) -> int:
+        """
+        Длительность круга рейса в минутах
+        """
+        return self._laps[trip]
+
+    def next_trip(self, after: float, fraction: float) -> Optional[int]:
+        """
+        Первый по началу рейс, проходящий точку маршрута не раньше заданного времени
+        :param after: время в минутах после полуночи
+        :param fraction: доля времени маршрута, пройденная до точки (от 0 до 1)
+        :return: индекс рейса
+        """
+        starts, laps = self._starts, self._laps
+        if self._lap is not None:
+            lap = self._lap
+            trip = bisect.bisect_left(starts, after, key=lambda start: start + lap * fraction)
+        else:
+            # Рейс проходит точку в пределах [start, start + max_lap], поэтому подходящий рейс
+            # либо начался не раньше after - max_lap и не позже after, либо первый начавшийся после after
+            trip = bisect.bisect_left(starts, after - self._max_lap)
+            last = bisect.bisect_left(starts, after)
+            while trip < last and starts[trip] + laps[trip] * fraction < after:
+                trip += 1
+        return trip if trip < len(starts) else None
+
+    def boarding_trips(self, after: float, fraction: float) -> List[int]:
+        """
+        Рейсы, на которые имеет смысл сесть в точке маршрута не раньше заданного времени.
+        Без обгонов это только ближайший рейс; иначе добавляются более поздние рейсы,
+        которые обгоняют его и все предыдущие кандидаты и приходят в конец маршрута раньше
+        :param after: время в минутах после полуночи
+        :param fraction: доля времени маршрута, пройденная до точки (от 0 до 1)
+        :return: индексы рейсов
+        """
+        trip = self.next_trip(after, fraction)
+        if trip is None:
+            return []
+        trips = [trip]
+        if self.fifo:
+            return trips
+        starts, laps = self._starts, self._laps
+        finish = starts[trip] + laps[trip]
+        for other in range(trip + 1, len(starts)):
+            if starts[other] >= finish:
+                break
+            if starts[other] + laps[other] < finish and starts[other] + laps[other] * fraction >= after:
+                trips.append(other)
+                finish = starts[other] + laps[other]
+        return trips
+
+
+class RouteTimetable:
+    """
+    Расписание маршрута: общие графики и графики на отдельные даты,
+    которые в свой день заменяют общие
+    """
+    __slots__ = ('default', 'days')
+
+    def __init__(self, timetables: List[TimetableInfo]):
+        """
+        :param timetables: все графики маршрута
+        """
+        days: Dict[date, List[TimetableInfo]] = {}
+        for timetable in timetables:
+            if timetable.day is not None:
+                days.setdefault(timetable.day, []).append(timetable)
+        self.default = TripSchedule([timetable for timetable in timetables if timetable.day is None])
+        self.days: Dict[date, TripSchedule] = {day: TripSchedule(items) for day, items in days.items()}
+
+    def for_day(self, day: Optional[date]) -> TripSchedule:
+        """
+        Отправления на заданную дату
+        """
+        return self.days.get(day, self.default)
+
+
+class RouteSections:
+    """
+    Упорядоченные участки одного маршрута в виде компактных массивов.
+    Хранит префиксные суммы коэффициентов времени и разреженную таблицу максимумов загруженности,
+    поэтому любые запросы по промежутку (home, end) выполняются за O(1) без обращения к БД.
+    """
+    __slots__ = ('orders', 'stop_ids', 'coefs', 'loads', 'chart_ids', '_orders', '_coef_prefix', '_load_table')
+
+    def __init__(self, orders: np.ndarray, stop_ids: np.ndarray, coefs: np.ndarray, loads: np.ndarray,
+                 chart_ids: np.ndarray):
+        """
+        :param orders: порядковые номера участков по возрастанию
+        :param stop_ids: айди остановок участков
+        :param coefs: коэффициенты времени участков
+        :param loads: статическая загруженность участков
+        :param chart_ids: айди схем движения участков (-1 - соединить прямой)
+        """
+        self.orders = orders
+        self.stop_ids = stop_ids
+        self.coefs = coefs
+        self.loads = loads
+        self.chart_ids = chart_ids
+        for array in (orders, stop_ids, coefs, loads, chart_ids):
+            array.flags.writeable = False
+
+        # Скалярные запросы к спискам Python быстрее, чем к массивам NumPy
+        self._orders: List[int] = orders.tolist()
+
+        # Префиксные суммы: _coef_prefix[i] = сумма коэффициентов участков [0, i)
+        prefix = np.zeros(len(coefs) + 1, dtype=np.float64)
+        np.cumsum(coefs, out=prefix[1:])
+        self._coef_prefix: List[float] = prefix.tolist()
+
+        # Разреженная таблица: _load_table[k][i] = максимум загруженности участков [i, i + 2^k)
+        level = loads.astype(np.int64)
+        table = [level.tolist()]
+        width = 1
+        while 2 * width <= len(loads):
+            level = np.maximum(level[:-width], level[width:])
+            table.append(level.tolist())
+            width *= 2
+        self._load_table: List[List[int]] = table
+
+    def __len__(self) -> int:
+        return len(self.orders)
+
+    def position(self, order: int) -> int:
+        """
+        Позиция первого участка с порядковым номером не меньше заданного
+        :param order: порядковый номер участка
+        :return: индекс в массивах
+        """
+        orders = self._orders
+        # Обычно участки пронумерованы подряд, и позиция вычисляется без поиска
+        if orders and orders[-1] - orders[0] == len(orders) - 1:
+            return min(max(order - orders[0], 0), len(orders))
+        return bisect.bisect_left(orders, order)
+
+    def time_coef(self, home: int, end: int) -> float:
+        """
+        Сумма коэффициентов времени участков home <= order < end
+        """
+        return self._coef_prefix[self.position(end)] - self._coef_prefix[self.position(home)]
+
+    def full_time_coef(self) -> float:
+        """
+        Сумма коэффициентов времени всего маршрута
+        """
+        return self._coef_prefix[-1]
+
+    def before_time_coef(self, home: int) -> float:
+        """
+        Сумма коэффициентов времени участков до остановки home
+        """
+        return self._coef_prefix[self.position(home)]
+
+    def max_load(self, home: int, end: int) -> Optional[int]:
+        """
+        Максимальная статическая загруженность участков home <= order < end
+        """
+        left, right = self.position(home), self.position(end)
+        if left >= right:
+            return None
+        level = (right - left).bit_length() - 1
+        row = self._load_table[level]
+        return max(row[left], row[right - (1 << level)])
+
+
+# Форматы геометрии в ответах: точки JSON, Google Encoded Polyline, разности координат в int32
+GEOMETRY_FORMATS = ('json', 'polyline', 'delta')
+
+# Точность формата delta: 6 знаков после запятой
+DELTA_PRECISION = 6
+
+
+class RoutePolyline:
+    """
+    Линия маршрута целиком: точка каждой остановки и следом точки ее схемы движения.
+    offsets[i] - индекс точки i-й остановки, поэтому линия между любыми остановками - срез без копирования.
+    Точки заранее сериализованы в JSON, сжатые представления кодируются при первом запросе.
+    """
+    __slots__ = ('lats', 'lons', 'offsets', 'points', '_points_e5', '_chunks', '_points_e6', '_lengths')
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, offsets: List[int]):
+        """
+        :param lats: широты точек
+        :param lons: долготы точек
+        :param offsets: индексы точек остановок (и число точек последним элементом)
+        """
+        self.lats = lats
+        self.lons = lons
+        self.offsets = offsets
+        self.points: List[str] = [f'{{"lat":{lat!r},"lon":{lon!r}}}'
+                                  for lat, lon in zip(lats.tolist(), lons.tolist())]
+        for array in (lats, lons):
+            array.flags.writeable = False
+        self._points_e5: Optional[np.ndarray] = None
+        self._chunks: Optional[List[str]] = None
+        self._points_e6: Optional[np.ndarray] = None
+        self._lengths: Optional[np.ndarray] = None
+
+    def lengths(self) -> np.ndarray:
+        """
+        Путь от начала линии до каждой точки в метрах (считается один раз)
+        """
+        if self._lengths is None:
+            steps = haversine(self.lats[:-1], self.lons[:-1], self.lats[1:], self.lons[1:])
+            lengths = np.concatenate([[0.0], np.cumsum(steps)])
+            lengths.flags.writeable = False
+            self._lengths = lengths
+        return self._lengths
+
+    def scaled(self, precision: int) -> np.ndarray:
+        """
+        Координаты точек, умноженные на 10^precision и округленные до целых
+        :return: массив [точки, 2]
+        """
+        factor = 10 ** precision
+        return np.stack([np.round(self.lats * factor), np.round(self.lons * factor)], axis=1).astype(np.int64)
+
+    def encoded(self, begin: int, end: int) -> str:
+        """
+        Участок линии в формате Google Encoded Polyline.
+        Разности соседних точек закодированы заранее, поэтому участок собирается склейкой строк
+        :param begin: индекс первой точки
+        :param end: индекс после последней точки
+        """
+        if begin >= end:
+            return ''
+        if self._chunks is None:
+            points = self.scaled(PRECISION)
+            deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+            self._points_e5 = points
+            self._chunks = [encode_value(lat) + encode_value(lon) for lat, lon in deltas.tolist()]
+        lat, lon = self._points_e5[begin].tolist()
+        return encode_value(lat) + encode_value(lon) + ''.join(self._chunks[begin + 1:end])
+
+    def deltas(self, begin: int, end: int) -> List[int]:
+        """
+        Участок линии в виде [широта, долгота, Δширота, Δдолгота, ...] в 10^-6 градуса
+        :param begin: индекс первой точки
+        :param end: индекс после последней точки
+        """
+        if self._points_e6 is None:
+            self._points_e6 = self.scaled(DELTA_PRECISION).astype(np.int32)
+        block = self._points_e6[begin:end]
+        result = block.copy()
+        result[1:] = np.diff(block, axis=0)
+        return result.ravel().tolist()
+
+
+class GeometrySlice(RawJson):
+    """
+    Участок линии маршрута, сериализуемый в JSON без построения моделей точек
+    """
+    __slots__ = ('polyline', 'begin', 'end')
+
+    def __init__(self, polyline: RoutePolyline, begin: int, end: int):
+        self.polyline = polyline
+        self.begin = begin
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.begin
+
+    def __iter__(self):
+        return zip(self.polyline.lats[self.begin:self.end].tolist(), self.polyline.lons[self.begin:self.end].tolist())
+
+    def value(self, fmt: str = 'json'):
+        if fmt == 'polyline':
+            return self.polyline.encoded(self.begin, self.end)
+        if fmt == 'delta':
+            return self.polyline.deltas(self.begin, self.end)
+        return [{'lat': lat, 'lon': lon} for lat, lon in self]
+
+    def raw_json(self, fmt: str = 'json') -> str:
+        if fmt == 'json':
+            return '[' + ','.join(self.polyline.points[self.begin:self.end]) + ']'
+        return json.dumps(self.value(fmt), separators=(',', ':'))
+
+
+class NetworkSnapshot:
+    """
+    Неизменяемый снимок транспортной сети для построения маршрутов без обращений к БД
+    """
+
+    def __init__(self, version: int, routes: Dict[int, RouteInfo], sections: Dict[int, RouteSections],
+                 stops: Dict[int, StopInfo], charts: Dict[int, Tuple[np.ndarray, np.ndarray]],
+                 timetables: Dict[int, RouteTimetable], headways: Optional[Dict[int, RouteTimetable]] = None):
+        """
+        :param version: номер ревизии снимка
+        :param routes: маршруты по айди
+        :param sections: участки маршрутов по айди маршрута
+        :param stops: остановки по айди
+        :param charts: схемы движения по айди: (широты, долготы)
+        :param timetables: расписания по айди маршрута
+        :param headways: расчетные отправления по интервалам движения по айди маршрута
+        """
+        self.version = version
+        self.routes = routes
+        self.sections = sections
+        self.stops = stops
+        self.charts = charts
+        self.timetables = timetables
+        self.headways = headways if headways is not None else {}
+
+        # Линии маршрутов и пространственный индекс строятся при первом обращении
+        self._polylines: Dict[int, RoutePolyline] = {}
+        self._stop_index: Optional[StopIndex] = None
+
+        # Состав пересадочных узлов
+        tpus: Dict[int, List[int]] = {}
+        for stop in stops.values():
+            if stop.tpu_id is not None:
+                tpus.setdefault(stop.tpu_id, []).append(stop.id)
+        self.tpus: Dict[int, Tuple[int, ...]] = {tpu_id: tuple(ids) for tpu_id, ids in tpus.items()}
+
+        # Обратный индекс: остановка -> (маршрут, порядковый номер участка)
+        stop_routes: Dict[int, List[Tuple[int, int]]] = {}
+        for route_id, route_sections in sections.items():
+            for order, stop_id in zip(route_sections.orders.tolist(), route_sections.stop_ids.tolist()):
+                stop_routes.setdefault(stop_id, []).append((route_id, order))
+        self.stop_routes: Dict[int, Tuple[Tuple[int, int], ...]] = \
+            {stop_id: tuple(items) for stop_id, items in stop_routes.items()}
+
+        # Тот же индекс только по действующим маршрутам и по действующим низкопольным маршрутам:
+        # отфильтрованные участки не попадают в поиск
+        self.active_stop_routes: Dict[int, Tuple[Tuple[int, int], ...]] = {}
+        self.care_stop_routes: Dict[int, Tuple[Tuple[int, int], ...]] = {}
+        self.filter_stop_routes(self.stop_routes)
+
+    @staticmethod
+    def empty() -> "NetworkSnapshot":
+        """
+        Пустой снимок до первой загрузки из БД
+        """
+        return NetworkSnapshot(0, {}, {}, {}, {}, {})
+
+    def with_route_sections(self, version: int, route_id: int,
+                            route_sections: Optional[RouteSections]) -> "NetworkSnapshot":
+        """
+        Создает новый снимок, в котором заменены участки одного маршрута.
+        Остальные маршруты и индексы переиспользуются, обратный индекс обновляется только для затронутых остановок.
+        :param version: номер ревизии нового снимка
+        :param route_id: айди маршрута
+        :param route_sections: новые участки маршрута (None - участков нет)
+        :return: новый снимок
+        """
+        snapshot = copy.copy(self)
+        snapshot.version = version
+        snapshot.sections = dict(self.sections)
+        snapshot._polylines = {key: value for key, value in self._polylines.items() if key != route_id}
+        stop_routes = dict(self.stop_routes)
+
+        old_sections = self.sections.get(route_id)
+        if old_sections is not None:
+            for stop_id in set(old_sections.stop_ids.tolist()):
+                items = tuple(item for item in stop_routes.get(stop_id, ()) if item[0] != route_id)
+                if items:
+                    stop_routes[stop_id] = items
+                else:
+                    stop_routes.pop(stop_id, None)
+            del snapshot.sections[route_id]
+
+        if route_sections is not None and len(route_sections):
+            snapshot.sections[route_id] = route_sections
+            for order, stop_id in zip(route_sections.orders.tolist(), route_sections.stop_ids.tolist()):
+                stop_routes[stop_id] = stop_routes.get(stop_id, ()) + ((route_id, order),)
+
+        snapshot.stop_routes = stop_routes
+        snapshot.active_stop_routes = dict(self.active_stop_routes)
+        snapshot.care_stop_routes = dict(self.care_stop_routes)
+        affected = set(old_sections.stop_ids.tolist()) if old_sections is not None else set()
+        if route_sections is not None:
+            affected.update(route_sections.stop_ids.tolist())
+        snapshot.filter_stop_routes(stop_routes, affected)
+        return snapshot
+
+    def with_route_timetable(self, version: int, route_id: int,
+                             route_timetable: Optional[RouteTimetable]) -> "NetworkSnapshot":
+        """
+        Создает новый снимок, в котором заменено расписание одного маршрута
+        :param version: номер ревизии нового снимка
+        :param route_id: айди маршрута
+        :param route_timetable: новое расписание (None - графиков нет)
+        :return: новый снимок
+        """
+        snapshot = copy.copy(self)
+        snapshot.version = version
+        snapshot.timetables = dict(self.timetables)
+        if route_timetable is None:
+            snapshot.timetables.pop(route_id, None)
+        else:
+            snapshot.timetables[route_id] = route_timetable
+        return snapshot
+
+    def schedule(self, route_id: int, day: Optional[date]) -> Optional[TripSchedule]:
+        """
+        Отправления маршрута на заданную дату
+        :param route_id: айди маршрута
+        :param day: дата
+        :return: отправления или None, если в этот день рейсов нет
+        """
+        route_timetable = self.timetables.get(route_id)
+        if route_timetable is None:
+            return None
+        schedule = route_timetable.for_day(day)
+        return schedule if len(schedule) else None
+
+    def headway_schedule(self, route_id: int, day: Optional[date]) -> Optional[TripSchedule]:
+        """
+        Расчетные отправления маршрута по интервалам движения на заданную дату
+        :param route_id: айди маршрута
+        :param day: дата
+        :return: отправления или None, если интервалы движения не заданы
+        """
+        route_headways = self.headways.get(route_id)
+        if route_headways is None:
+            return None
+        schedule = route_headways.for_day(day)
+        return schedule if len(schedule) else None
+
+    def filter_stop_routes(self, stop_routes: Dict[int, Tuple[Tuple[int, int], ...]],
+                           stop_ids: Optional[Set[int]] = None) -> None:
+        """
+        Заполняет индексы остановок по действующим и низкопольным маршрутам
+        :param stop_routes: полный обратный индекс
+        :param stop_ids: остановки, для которых индексы пересчитываются (None - все)
+        """
+        for stop_id in stop_routes if stop_ids is None else stop_ids:
+            active = tuple(item for item in stop_routes.get(stop_id, ())
+                           if item[0] in self.routes and self.routes[item[0]].stage == 1)
+            care = tuple(item for item in active if self.routes[item[0]].care)
+            for index, items in ((self.active_stop_routes, active), (self.care_stop_routes, care)):
+                if items:
+                    index[stop_id] = items
+                else:
+                    index.pop(stop_id, None)
+
+    def routes_at(self, stop_id: int, care: bool) -> Tuple[Tuple[int, int], ...]:
+        """
+        Действующие маршруты, проходящие через остановку
+        :param stop_id: айди остановки
+        :param care: только низкопольные маршруты
+        :return: пары (айди маршрута, порядковый номер участка)
+        """
+        index = self.care_stop_routes if care else self.active_stop_routes
+        return index.get(stop_id, ())
+
+    def stop_group(self, stop_id: int) -> List[int]:
+        """
+        Определение списка соседних остановок (ТПУ) для заданной остановки
+        :param stop_id: айди остановки
+        :return: айди остановок пересадочного узла
+        """
+        stop = self.stops[stop_id]
+        if stop.tpu_id is not None and stop.tpu_id in self.tpus:
+            return list(self.tpus[stop.tpu_id])
+        return [stop_id]
+
+    def stop_index(self) -> StopIndex:
+        """
+        Пространственный индекс действующих остановок (строится один раз на снимок)
+        """
+        if self._stop_index is None:
+            stops = [stop for stop in self.stops.values() if stop.stage > 0]
+            self._stop_index = StopIndex([stop.id for stop in stops], [stop.lat for stop in stops],
+                                         [stop.lon for stop in stops])
+        return self._stop_index
+
+    def polyline(self, route_id: int) -> RoutePolyline:
+        """
+        Линия маршрута целиком (строится один раз на снимок)
+        :param route_id: айди маршрута
+        """
+        polyline = self._polylines.get(route_id)
+        if polyline is None:
+            route_sections = self.sections[route_id]
+            lats, lons, offsets = [], [], []
+            for stop_id, chart_id in zip(route_sections.stop_ids.tolist(), route_sections.chart_ids.tolist()):
+                stop = self.stops[stop_id]
+                offsets.append(len(lats))
+                lats.append(stop.lat)
+                lons.append(stop.lon)
+                chart = self.charts.get(chart_id)
+                if chart:
+                    lats.extend(chart[0].tolist())
+                    lons.extend(chart[1].tolist())
+            offsets.append(len(lats))
+            polyline = RoutePolyline(np.array(lats, dtype=np.float64), np.array(lons, dtype=np.float64), offsets)
+            self._polylines[route_id] = polyline
+        return polyline
+
+    def geometry(self, route_id: int, home: int, end: int) -> GeometrySlice:
+        """
+        Точки линии маршрута между остановками home и end включительно
+        :param route_id: айди маршрута
+        :param home: первая остановка по ходу маршрута
+        :param end: последняя остановка по ходу маршрута
+        :return: участок линии; при итерации дает пары (широта, долгота)
+        """
+        route_sections = self.sections[route_id]
+        polyline = self.polyline(route_id)
+        first, last = route_sections.position(home), route_sections.position(end + 1) - 1
+        if last < first:
+            return GeometrySlice(polyline, 0, 0)
+        # Схема движения последней остановки входит в участок, только если она раньше end
+        if route_sections.orders[last] < end:
+            return GeometrySlice(polyline, polyline.offsets[first], polyline.offsets[last + 1])
+        return GeometrySlice(polyline, polyline.offsets[first], polyline.offsets[last] + 1)
+
+
+# Таблицы, изменение которых требует пересборки снимка сети
+NETWORK_TABLES = ('atps', 'tpus', 'stops', 'routes', 'charts', 'sections', 'timetables', 'traffics')
+
+_snapshot = NetworkSnapshot.empty()
+_versions = itertools.count(1)
+_lock = threading.Lock()
+# Ревизия сети в БД, которой соответствует снимок процесса
+_revision: Optional[int] = None
+
+# Фоновые задачи процесса (ссылка нужна, чтобы задача не была собрана сборщиком мусора)
+_tasks = set()
+
+
+class NetworkService:
+    """
+    Сервис хранения снимка транспортной сети в памяти процесса
+    """
+
+    @staticmethod
+    def get() -> NetworkSnapshot:
+        """
+        Возвращает актуальный снимок сети
+        """
+        return _snapshot
+
+    @staticmethod
+    def build(db_session: Session) -> NetworkSnapshot:
+        """
+        Собирает снимок сети из БД
+        :param db_session: сессия БД
+        :return: новый снимок
+        """
+        routes = {}
+        for route in db_session.query(Route).all():
+            routes[route.id] = RouteInfo(id=route.id, number=route.number, label=route.label, title=route.title,
+                                         info=route.info, stage=route.stage, care=bool(route.care))
+
+        stops = {}
+        for stop in db_session.query(Stop).all():
+            stops[stop.id] = StopInfo(id=stop.id, name=stop.name, about=stop.about, lat=stop.lat, lon=stop.lon,
+                                      stage=stop.stage, tpu_id=stop.tpu_id)
+
+        charts = {}
+        for chart in db_session.query(Chart).all():
+            length = min(len(chart.lats), len(chart.lons))
+            lats = np.array(chart.lats[:length], dtype=np.float64)
+            lons = np.array(chart.lons[:length], dtype=np.float64)
+            lats.flags.writeable = False
+            lons.flags.writeable = False
+            charts[chart.id] = (lats, lons)
+
+        rows: Dict[int, List[Section]] = {}
+        for section in db_session.query(Section).order_by(Section.route_id, Section.order).all():
+            rows.setdefault(section.route_id, []).append(section)
+        sections = {route_id: NetworkService.pack_sections(route_sections)
+                    for route_id, route_sections in rows.items()}
+
+        timetables: Dict[int, List[TimetableInfo]] = {}
+        for timetable in db_session.query(Timetable).order_by(Timetable.start).all():
+            timetables.setdefault(timetable.route_id, []).append(NetworkService.pack_timetable(timetable))
+
+        headways: Dict[int, List[TimetableInfo]] = {}
+        for traffic in db_session.query(Traffic).order_by(Traffic.start).all():
+            headways.setdefault(traffic.route_id, []).extend(NetworkService.expand_traffic(traffic))
+
+        return NetworkSnapshot(next(_versions), routes, sections, stops, charts,
+                               {route_id: RouteTimetable(items) for route_id, items in timetables.items()},
+                               {route_id: RouteTimetable(items) for route_id, items in headways.items() if items})
+
+    @staticmethod
+    def expand_traffic(traffic: Traffic) -> List[TimetableInfo]:
+        """
+        Разворачивает интервал движения в расчетные отправления.
+        vehicles машин равномерно распределены по обороту: кольцевой маршрут (round) машина проходит
+        за lap, остальные - за lap в одну сторону и столько же в обратную
+        :param traffic: модель интервала движения
+        :return: записи отправлений
+        """
+        start = traffic.start.hour * 60 + traffic.start.minute
+        end = traffic.end.hour * 60 + traffic.end.minute
+        lap = traffic.lap.hour * 60 + traffic.lap.minute
+        vehicles = traffic.vehicles or 1
+        if lap <= 0 or vehicles <= 0:
+            return []
+        if end < start:
+            # Движение после полуночи
+            end += 24 * 60
+        headway = lap / vehicles if traffic.round else 2 * lap / vehicles
+        return [TimetableInfo(start=int(round(depart)), lap=lap, day=traffic.day)
+                for depart in np.arange(start, end + 1e-9, headway).tolist()]
+
+    @staticmethod
+    def pack_timetable(timetable: Timetable) -> TimetableInfo:
+        """
+        Переводит график в минуты после полуночи
+        :param timetable: модель графика
+        :return: запись графика
+        """
+        return TimetableInfo(start=timetable.start.hour * 60 + timetable.start.minute,
+                             lap=timetable.lap.hour * 60 + timetable.lap.minute,
+                             day=timetable.day)
+
+    @staticmethod
+    def pack_sections(sections: List[Section]) -> RouteSections:
+        """
+        Упаковывает участки маршрута в массивы
+        :param sections: участки маршрута, упорядоченные по порядковому номеру
+        :return: участки маршрута в виде массивов
+        """
+        return RouteSections(
+            orders=np.array([section.order for section in sections], dtype=np.int32),
+            stop_ids=np.array([section.stop_id for section in sections], dtype=np.int32),
+            coefs=np.array([section.coef for section in sections], dtype=np.float64),
+            loads=np.array([section.load or 0 for section in sections], dtype=np.int32),
+            chart_ids=np.array([section.chart_id if section.chart_id else -1 for section in sections],
+                               dtype=np.int32))
+
+    @staticmethod
+    def read_revision(db_session: Session) -> int:
+        """
+        Текущая ревизия сети в БД
+        """
+        row = db_session.get(NetworkRevision, 1)
+        return row.revision if row is not None else 0
+
+    @staticmethod
+    def publish(db_session: Session) -> int:
+        """
+        Увеличивает ревизию сети в БД, чтобы остальные процессы сервера перечитали свои снимки
+        :param db_session: сессия БД
+        :return: новая ревизия
+        """
+        revision = db_session.execute(update(NetworkRevision).where(NetworkRevision.id == 1)
+                                      .values(revision=NetworkRevision.revision + 1)
+                                      .returning(NetworkRevision.revision)).scalar()
+        if revision is None:
+            revision = 1
+            db_session.add(NetworkRevision(id=1, revision=revision))
+        db_session.commit()
+        return revision
+
+    @staticmethod
+    def reload(publish: bool = True) -> None:
+        """
+        Перечитывает снимок сети из БД и атомарно подменяет текущий.
+        Вызывается при старте и после сохранения изменений в редакторах.
+        При ошибке продолжает работать прежний снимок.
+        :param publish: сообщить об изменении сети остальным процессам сервера
+        """
+        global _snapshot, _revision
+        try:
+            with _lock:
+                with SessionLocal() as db_session:
+                    if publish:
+                        revision = NetworkService.publish(db_session)
+                    else:
+                        revision = NetworkService.read_revision(db_session)
+                    snapshot = NetworkService.build(db_session)
+                _snapshot, _revision = snapshot, revision
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(f"Ошибка при загрузке снимка сети: \n{msg}")
+
+    @staticmethod
+    def reload_route(route_id: int) -> None:
+        """
+        Перечитывает из БД участки одного маршрута и атомарно подменяет снимок.
+        Массивы остальных маршрутов не пересобираются.
+        :param route_id: айди маршрута
+        """
+        global _snapshot, _revision
+        try:
+            with _lock:
+                with SessionLocal() as db_session:
+                    revision = NetworkService.publish(db_session)
+                    if _revision != revision - 1:
+                        # Снимок отстал от изменений других процессов: пересборка целиком
+                        snapshot = NetworkService.build(db_session)
+                    else:
+                        sections = db_session.query(Section).filter_by(route_id=route_id) \
+                            .order_by(Section.order).all()
+                        route_sections = NetworkService.pack_sections(sections) if sections else None
+                        snapshot = _snapshot.with_route_sections(next(_versions), route_id, route_sections)
+                _snapshot, _revision = snapshot, revision
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(f"Ошибка при обновлении маршрута в снимке сети: \n{msg}")
+
+    @staticmethod
+    def reload_timetables(route_id: int) -> None:
+        """
+        Перечитывает из БД расписание одного маршрута и атомарно подменяет снимок
+        :param route_id: айди маршрута
+        """
+        global _snapshot, _revision
+        try:
+            with _lock:
+                with SessionLocal() as db_session:
+                    revision = NetworkService.publish(db_session)
+                    if _revision != revision - 1:
+                        # Снимок отстал от изменений других процессов: пересборка целиком
+                        snapshot = NetworkService.build(db_session)
+                    else:
+                        timetables = db_session.query(Timetable).filter_by(route_id=route_id).all()
+                        route_timetable = RouteTimetable([NetworkService.pack_timetable(timetable)
+                                                          for timetable in timetables]) if timetables else None
+                        snapshot = _snapshot.with_route_timetable(next(_versions), route_id, route_timetable)
+                _snapshot, _revision = snapshot, revision
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(f"Ошибка при обновлении расписания в снимке сети: \n{msg}")
+
+    @staticmethod
+    def check_revision() -> None:
+        """
+        Перечитывает снимок, если сеть изменена в другом процессе сервера
+        """
+        try:
+            with SessionLocal() as db_session:
+                revision = NetworkService.read_revision(db_session)
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(f"Ошибка при проверке ревизии сети: \n{msg}")
+            return
+        if revision != _revision:
+            NetworkService.reload(publish=False)
+
+    @staticmethod
+    async def watch() -> None:
+        """
+        Цикл проверки ревизии сети; запрос к БД и пересборка снимка выполняются в пуле потоков
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(NETWORK_REVISION_INTERVAL)
+            await loop.run_in_executor(None, NetworkService.check_revision)
+
+    @staticmethod
+    def start() -> None:
+        """
+        Запускает проверку изменений сети из других процессов в цикле событий приложения
+        """
+        if NETWORK_REVISION_INTERVAL <= 0:
+            return
+        task = asyncio.get_running_loop().create_task(NetworkService.watch())
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
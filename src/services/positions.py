@@ -0,0 +1,150 @@
+import threading
+from datetime import date, datetime
+from typing import Dict, Tuple
+
+import numpy as np
+
+from src.services.network import NetworkSnapshot
+
+# Минут в сутках
+DAY_MINUTES = 24 * 60
+
+# Госномер тестовых позиций в формате ЦОДД
+TEST_PLATE = "B236PH236"
+
+# Разрыв между линиями соседних маршрутов в общей шкале пути, м
+ROUTE_GAP = 1.0
+
+# Последние собранные линии города: (версия снимка, дата) -> линии
+_tracks: Dict[Tuple[int, date], "CityTrack"] = {}
+_tracks_lock = threading.Lock()
+
+
+class CityTrack:
+    """
+    Линии всех маршрутов города, склеенные в общие массивы, и рейсы дня.
+    Путь каждой точки отсчитывается по общей шкале: маршрут i занимает отрезок [base[i], base[i] + total[i]],
+    поэтому точки для всех машин ищутся одним searchsorted
+    """
+    __slots__ = ('route_ids', 'base', 'total', 'first', 'last', 'lats', 'lons', 'distances', 'stop_ids',
+                 'starts', 'laps', 'trip_routes', 'max_lap')
+
+    def __init__(self, network: NetworkSnapshot, day: date):
+        """
+        :param network: снимок сети
+        :param day: дата, расписание которой используется
+        """
+        route_ids, base, total, first, last = [], [], [], [], []
+        lats, lons, distances, stop_ids = [], [], [], []
+        starts, laps, trip_routes = [], [], []
+        offset, points = 0.0, 0
+        for route_id in sorted(network.sections):
+            # Рейсы по графику, а для маршрутов без графика - расчетные по интервалам движения
+            schedule = network.schedule(route_id, day) or network.headway_schedule(route_id, day)
+            if schedule is None:
+                continue
+            polyline = network.polyline(route_id)
+            lengths = polyline.lengths()
+            if len(lengths) < 2 or lengths[-1] <= 0:
+                continue
+            index = len(route_ids)
+            route_ids.append(route_id)
+            base.append(offset)
+            total.append(lengths[-1])
+            first.append(points)
+            last.append(points + len(lengths) - 1)
+            lats.append(polyline.lats)
+            lons.append(polyline.lons)
+            distances.append(lengths + offset)
+            sections = np.searchsorted(polyline.offsets, np.arange(len(lengths)), side='right') - 1
+            stop_ids.append(network.sections[route_id].stop_ids[sections])
+            starts.append(schedule.starts)
+            laps.append(schedule.laps)
+            trip_routes.append(np.full(len(schedule), index, dtype=np.int64))
+            offset += lengths[-1] + ROUTE_GAP
+            points += len(lengths)
+
+        self.route_ids = np.array(route_ids, dtype=np.int64)
+        self.base = np.array(base, dtype=np.float64)
+        self.total = np.array(total, dtype=np.float64)
+        self.first = np.array(first, dtype=np.int64)
+        self.last = np.array(last, dtype=np.int64)
+        self.lats = np.concatenate(lats) if lats else np.empty(0)
+        self.lons = np.concatenate(lons) if lons else np.empty(0)
+        self.distances = np.concatenate(distances) if distances else np.empty(0)
+        self.stop_ids = np.concatenate(stop_ids) if stop_ids else np.empty(0, dtype=np.int64)
+
+        starts = np.concatenate(starts) if starts else np.empty(0, dtype=np.int32)
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.laps = (np.concatenate(laps) if laps else np.empty(0, dtype=np.int32))[order]
+        self.trip_routes = (np.concatenate(trip_routes) if trip_routes else np.empty(0, dtype=np.int64))[order]
+        self.max_lap = int(self.laps.max()) if len(self.laps) else 0
+
+    def positions(self, minutes: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Позиции всех машин города, находящихся в рейсе
+        :param minutes: время в минутах после полуночи
+        :return: индексы маршрутов, широты, долготы и айди последних пройденных остановок,
+        упорядоченные по маршруту и началу рейса
+        """
+        # Рейсы в пути: начало в (now - самый долгий круг, now), затем отбор по длительности круга.
+        # Второе окно - рейсы, начатые до полуночи и продолжающиеся после нее
+        trips, elapsed = [], []
+        for now in (minutes, minutes + DAY_MINUTES):
+            window = np.arange(np.searchsorted(self.starts, now - self.max_lap, side='right'),
+                               np.searchsorted(self.starts, now, side='left'))
+            passed = now - self.starts[window]
+            running = passed < self.laps[window]
+            trips.append(window[running])
+            elapsed.append(passed[running])
+        trips, elapsed = np.concatenate(trips), np.concatenate(elapsed)
+        order = np.lexsort((self.starts[trips], self.trip_routes[trips]))
+        trips, elapsed = trips[order], elapsed[order]
+        routes = self.trip_routes[trips]
+
+        # Пройденный путь по общей шкале и интерполяция внутри отрезка линии
+        distance = self.base[routes] + elapsed / self.laps[trips] * self.total[routes]
+        point = np.searchsorted(self.distances, distance, side='right') - 1
+        point = np.minimum(np.maximum(point, self.first[routes]), self.last[routes] - 1)
+        segment = self.distances[point + 1] - self.distances[point]
+        fraction = np.divide(distance - self.distances[point], segment, out=np.zeros_like(distance),
+                             where=segment > 0)
+        lats = self.lats[point] + fraction * (self.lats[point + 1] - self.lats[point])
+        lons = self.lons[point] + fraction * (self.lons[point + 1] - self.lons[point])
+        return routes, lats, lons, self.stop_ids[point]
+
+
+class PositionService:
+    """
+    Расчетные позиции транспорта по расписанию: машина рейса движется по линии маршрута
+    равномерно от начала до конца круга
+    """
+
+    @staticmethod
+    def track(network: NetworkSnapshot, day: date) -> CityTrack:
+        """
+        Линии города для снимка сети и даты (собираются один раз)
+        """
+        key = (network.version, day)
+        track = _tracks.get(key)
+        if track is None:
+            with _tracks_lock:
+                track = _tracks.get(key)
+                if track is None:
+                    track = CityTrack(network, day)
+                    _tracks.clear()
+                    _tracks[key] = track
+        return track
+
+    @staticmethod
+    def positions(network: NetworkSnapshot, real_time: datetime) -> Tuple[CityTrack, Tuple[np.ndarray, ...]]:
+        """
+        Позиции всех машин города в рейсе на заданный момент
+        :param network: снимок сети
+        :param real_time: время
+        :return: линии города и результат CityTrack.positions
+        """
+        track = PositionService.track(network, real_time.date())
+        minutes = real_time.hour * 60 + real_time.minute + real_time.second / 60 + real_time.microsecond / 6e7
+        return track, track.positions(minutes)
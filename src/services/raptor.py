@@ -0,0 +1,228 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from src.services.network import NetworkSnapshot, RouteSections, TripSchedule
+
+# Время на пересадку в минутах
+TRANSFER_TIME = 1
+# Время пешего перехода между остановками одного ТПУ в минутах
+WALK_TIME = 2
+# Максимально допустимое число пересадок
+MAX_TRANSFERS = 3
+
+
+class JourneyLeg(NamedTuple):
+    """
+    Поездка на одном маршруте в составе пути
+    """
+    route_id: int
+    home: int
+    end: int
+    board_stop: int
+    alight_stop: int
+    depart: float
+    arrive: float
+    load: int
+
+
+class Journey(NamedTuple):
+    """
+    Путь от начальной до конечной остановки
+    """
+    arrival: float
+    load: int
+    legs: Tuple[JourneyLeg, ...]
+
+    @property
+    def transfers(self) -> int:
+        return len(self.legs) - 1
+
+
+class _RouteLabel(NamedTuple):
+    """
+    Метка пассажира, едущего по маршруту в текущем раунде
+    """
+    trip: int
+    load: int
+    board_position: int
+    board_stop: int
+    depart: float
+    parent: Journey
+
+
+def _dominates(a: Journey, b: Journey) -> bool:
+    return a.arrival <= b.arrival
+
+
+def _insert(bag: List[Journey], label: Journey) -> bool:
+    """
+    Добавляет метку в парето-множество, вытесняя доминируемые
+    :return: была ли метка добавлена
+    """
+    for other in bag:
+        if _dominates(other, label):
+            return False
+    bag[:] = [other for other in bag if not _dominates(label, other)]
+    bag.append(label)
+    return True
+
+
+def _rides_better(a: _RouteLabel, b: _RouteLabel, fifo: bool) -> bool:
+    """
+    Метка a в маршруте не хуже b на всех следующих остановках.
+    Сравнение рейсов по индексу верно, только если рейсы не обгоняют друг друга
+    """
+    return a.trip == b.trip or (fifo and a.trip <= b.trip)
+
+
+class RaptorService:
+    """
+    Поиск путей с пересадками по раундам (RAPTOR) на снимке сети.
+    Раунд k находит пути из k поездок; в каждой остановке хранится лучшая метка по времени прибытия,
+    поэтому результат оптимален по времени прибытия и числу пересадок.
+    Загруженность в метках - оценка по участкам маршрута без учета времени посадки; она не участвует
+    в отборе путей, т.к. прогноз модели зависит от времени посадки и уточняется после поиска.
+    """
+
+    @staticmethod
+    def route_schedule(network: NetworkSnapshot, route_id: int, day: Optional[date]) -> Optional[TripSchedule]:
+        """
+        Отправления маршрута: по графику, а при его отсутствии - расчетные по интервалам движения
+        """
+        return network.schedule(route_id, day) or network.headway_schedule(route_id, day)
+
+    @staticmethod
+    def plan(network: NetworkSnapshot, stops_from: List[int], stops_to: List[int], fact_time: int,
+             max_transfers: int, care: bool, day: Optional[date] = None) -> List[Journey]:
+        """
+        Построение парето-оптимальных путей
+        :param network: снимок сети
+        :param stops_from: множество начальных остановок
+        :param stops_to: множество конечных остановок
+        :param fact_time: время отправления в минутах после полуночи
+        :param max_transfers: максимальное число пересадок
+        :param care: необходимость низкопольного ПС
+        :param day: дата поездки для выбора расписания
+        :return: пути, упорядоченные по числу пересадок и времени прибытия
+        """
+        max_transfers = max(0, min(max_transfers, MAX_TRANSFERS))
+        targets = set(stops_to)
+
+        # Лучшие метки по остановкам за все раунды и метки прибытия в конечные остановки
+        best: Dict[int, List[Journey]] = {}
+        target_bag: List[Journey] = []
+        journeys: List[Journey] = []
+
+        previous: Dict[int, List[Journey]] = {}
+        for stop_id in stops_from:
+            previous[stop_id] = [Journey(arrival=fact_time, load=0, legs=())]
+            best[stop_id] = list(previous[stop_id])
+        marked: Set[int] = set(previous)
+
+        for _ in range(max_transfers + 1):
+            if not marked:
+                break
+
+            # Маршруты, проходящие через отмеченные остановки, и самая ранняя позиция посадки
+            queue: Dict[int, int] = {}
+            for stop_id in marked:
+                for route_id, order in network.routes_at(stop_id, care):
+                    if RaptorService.route_schedule(network, route_id, day) is None:
+                        continue
+                    position = network.sections[route_id].position(order)
+                    if route_id not in queue or position < queue[route_id]:
+                        queue[route_id] = position
+
+            current: Dict[int, List[Journey]] = {}
+            for route_id, start in queue.items():
+                RaptorService.scan_route(network, RaptorService.route_schedule(network, route_id, day), route_id,
+                                         start, previous, current, best, targets, target_bag, journeys)
+
+            # Пешие переходы внутри ТПУ; конечная остановка может быть достигнута и пешком
+            for stop_id in list(current):
+                tpu_id = network.stops[stop_id].tpu_id
+                if tpu_id is None:
+                    continue
+                for other_id in network.tpus.get(tpu_id, ()):
+                    if other_id == stop_id:
+                        continue
+                    for label in list(current[stop_id]):
+                        label = label._replace(arrival=label.arrival + WALK_TIME)
+                        if _insert(best.setdefault(other_id, []), label):
+                            _insert(current.setdefault(other_id, []), label)
+                            if other_id in targets and not any(_dominates(other, label) for other in target_bag):
+                                _insert(target_bag, label)
+                                journeys.append(label)
+
+            previous = current
+            marked = set(current)
+
+        # Итоговое парето-множество по времени прибытия и числу пересадок
+        result = []
+        for journey in sorted(journeys, key=lambda j: (j.transfers, j.arrival)):
+            if any(other.arrival <= journey.arrival and other.transfers <= journey.transfers for other in result):
+                continue
+            result.append(journey)
+        return result
+
+    @staticmethod
+    def scan_route(network: NetworkSnapshot, schedule: TripSchedule, route_id: int, start: int,
+                   previous: Dict[int, List[Journey]],
+                   current: Dict[int, List[Journey]], best: Dict[int, List[Journey]], targets: Set[int],
+                   target_bag: List[Journey], journeys: List[Journey]) -> None:
+        """
+        Проход по маршруту в рамках одного раунда
+        :param network: снимок сети
+        :param schedule: отправления маршрута на дату поездки
+        :param route_id: айди маршрута
+        :param start: самая ранняя позиция посадки
+        :param previous: метки предыдущего раунда
+        :param current: метки текущего раунда (пополняются)
+        :param best: лучшие метки за все раунды (пополняются)
+        :param targets: конечные остановки
+        :param target_bag: лучшие метки в конечных остановках (пополняются)
+        :param journeys: найденные пути (пополняются)
+        """
+        route_sections: RouteSections = network.sections[route_id]
+        full_time_coef = route_sections.full_time_coef()
+        orders = route_sections.orders.tolist()
+        stop_ids = route_sections.stop_ids.tolist()
+        loads = route_sections.loads.tolist()
+
+        route_bag: List[_RouteLabel] = []
+        for i in range(start, len(orders)):
+            stop_id = stop_ids[i]
+            fraction = route_sections.before_time_coef(orders[i]) / full_time_coef if full_time_coef else 0.0
+
+            if route_bag:
+                # Учет загруженности пройденного участка
+                route_bag = [label._replace(load=max(label.load, loads[i - 1])) for label in route_bag]
+
+                # Высадка
+                for label in route_bag:
+                    arrival = schedule.depart(label.trip, fraction)
+                    leg = JourneyLeg(route_id=route_id, home=orders[label.board_position], end=orders[i],
+                                     board_stop=label.board_stop, alight_stop=stop_id, depart=label.depart,
+                                     arrive=arrival, load=label.load)
+                    journey = Journey(arrival=arrival, load=label.load, legs=label.parent.legs + (leg,))
+                    if any(_dominates(other, journey) for other in target_bag):
+                        continue
+                    if not _insert(best.setdefault(stop_id, []), journey):
+                        continue
+                    _insert(current.setdefault(stop_id, []), journey)
+                    if stop_id in targets:
+                        _insert(target_bag, journey)
+                        journeys.append(journey)
+
+            # Посадка на первый доступный рейс (и на обгоняющие его, если рейсы могут обгонять друг друга)
+            for parent in previous.get(stop_id, ()):
+                if parent.legs and parent.legs[-1].route_id == route_id:
+                    continue
+                ready = parent.arrival + (TRANSFER_TIME if parent.legs else 0)
+                for trip in schedule.boarding_trips(ready, fraction):
+                    label = _RouteLabel(trip=trip, load=parent.load, board_position=i, board_stop=stop_id,
+                                        depart=schedule.depart(trip, fraction), parent=parent)
+                    if any(_rides_better(other, label, schedule.fifo) for other in route_bag):
+                        continue
+                    route_bag = [other for other in route_bag if not _rides_better(label, other, schedule.fifo)]
+                    route_bag.append(label)
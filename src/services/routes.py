@@ -8,6 +8,7 @@ from sqlalchemy.orm import Session
 from src.models.logistic import Route, Section
 from src.models.users import Log
 from src.schemas.route import RouteModel, RouteInput, SectionsInput
+from src.services.network import NetworkService
 
 
 class RouteService:
@@ -51,6 +52,7 @@ class RouteService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -82,6 +84,7 @@ class RouteService:
             db_session.add(log)
             db_session.add(route)
             db_session.commit()
+            NetworkService.reload()
             return RouteModel(**route.__dict__)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -122,6 +125,7 @@ class RouteService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload_route(route_id)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.core.constants import SIMULATION_TICK
+from src.services.broadcast import BroadcastService
+from src.services.network import NetworkService, NetworkSnapshot
+from src.services.positions import TEST_PLATE, PositionService
+from src.utils.json_writer import RawJson
+
+# Через сколько тактов кадр считается устаревшим и пересчитывается по запросу
+STALE_TICKS = 2
+
+_state = {"frame": None, "ticks": 0, "tick_ms": 0.0, "pending": None}
+
+# Фоновые задачи процесса (ссылка нужна, чтобы задача не была собрана сборщиком мусора)
+_tasks = set()
+
+
+class VehicleFrame:
+    """
+    Состояние всех машин города на один такт в виде структуры массивов.
+    Машины упорядочены по маршруту, поэтому машины маршрута - непрерывный срез массивов.
+    Строки в формате ЦОДД и их JSON формируются при первом обращении и переиспользуются до следующего такта
+    """
+    __slots__ = ('network', 'time', 'stamp', 'route_ids', 'lats', 'lons', 'stop_ids', 'slices', 'active',
+                 '_rows', '_texts')
+
+    def __init__(self, network: NetworkSnapshot, real_time: datetime):
+        """
+        :param network: снимок сети
+        :param real_time: время такта
+        """
+        track, (routes, lats, lons, stop_ids) = PositionService.positions(network, real_time)
+        self.network = network
+        self.time = real_time
+        self.stamp = real_time.isoformat()
+        self.route_ids = track.route_ids[routes]
+        self.lats = lats
+        self.lons = lons
+        self.stop_ids = stop_ids
+
+        bounds = np.flatnonzero(np.diff(self.route_ids)) + 1
+        begins = np.concatenate(([0], bounds)) if len(self.route_ids) else np.empty(0, dtype=np.int64)
+        ends = np.concatenate((bounds, [len(self.route_ids)])) if len(self.route_ids) else begins
+        self.slices: Dict[int, Tuple[int, int]] = {
+            route_id: (begin, end)
+            for route_id, begin, end in zip(self.route_ids[begins].tolist(), begins.tolist(), ends.tolist())}
+        # Маршруты с машинами в рейсе, выдаваемые по умолчанию
+        self.active: List[int] = [route_id for route_id in self.slices
+                                  if route_id in network.routes and network.routes[route_id].stage > 0]
+        self._rows: Dict[int, List[list]] = {}
+        self._texts: Dict[int, str] = {}
+
+    @property
+    def version(self) -> int:
+        return self.network.version
+
+    def rows(self, route_id: int) -> List[list]:
+        """
+        Позиции машин маршрута в формате ЦОДД
+        :param route_id: айди маршрута
+        :return: список позиций (пустой, если машин в рейсе нет)
+        """
+        rows = self._rows.get(route_id)
+        if rows is None:
+            begin, end = self.slices.get(route_id, (0, 0))
+            number = self.network.routes[route_id].number if route_id in self.network.routes else None
+            stops, stamp = self.network.stops, self.stamp
+            rows = [[lat, lon, 0, stamp, TEST_PLATE, 0, 0, number, 0, stamp, stops[stop_id].name, None]
+                    for lat, lon, stop_id in zip(self.lats[begin:end].tolist(), self.lons[begin:end].tolist(),
+                                                 self.stop_ids[begin:end].tolist())]
+            self._rows[route_id] = rows
+        return rows
+
+    def text(self, route_id: int) -> str:
+        """
+        JSON позиций маршрута без внешних скобок массива
+        """
+        text = self._texts.get(route_id)
+        if text is None:
+            text = ','.join(json.dumps(row, ensure_ascii=False, separators=(',', ':'))
+                            for row in self.rows(route_id))
+            self._texts[route_id] = text
+        return text
+
+    def vehicles(self, route_ids: Optional[Iterable[int]] = None) -> "VehicleRows":
+        """
+        Позиции машин маршрутов одним списком
+        :param route_ids: айди маршрутов (None - все действующие маршруты)
+        :return: список, готовый к сериализации
+        """
+        route_ids = self.active if route_ids is None else route_ids
+        return VehicleRows(self, [route_id for route_id in route_ids if route_id in self.slices])
+
+
+class VehicleRows(RawJson):
+    """
+    Плоский список позиций нескольких маршрутов, склеиваемый из готового JSON маршрутов кадра
+    """
+    __slots__ = ('frame', 'route_ids')
+
+    def __init__(self, frame: VehicleFrame, route_ids: List[int]):
+        self.frame = frame
+        self.route_ids = route_ids
+
+    def value(self, fmt: str = 'json') -> List[list]:
+        return [row for route_id in self.route_ids for row in self.frame.rows(route_id)]
+
+    def raw_json(self, fmt: str = 'json') -> str:
+        return '[' + ','.join(self.frame.text(route_id) for route_id in self.route_ids) + ']'
+
+
+class SimulationService:
+    """
+    Движение транспорта по общим часам: фоновая задача раз в такт пересчитывает позиции всех машин города,
+    а запросы читают последний кадр (или рассчитывают его сами, если кадр устарел)
+    """
+
+    @staticmethod
+    def step(real_time: Optional[datetime] = None) -> VehicleFrame:
+        """
+        Рассчитывает кадр на заданный момент и делает его текущим
+        :param real_time: время такта (по умолчанию текущее)
+        :return: кадр
+        """
+        started = time.perf_counter()
+        frame = VehicleFrame(NetworkService.get(), real_time or datetime.now())
+        _state["frame"] = frame
+        _state["ticks"] += 1
+        _state["tick_ms"] = (time.perf_counter() - started) * 1000
+        return frame
+
+    @staticmethod
+    def stale(frame: Optional[VehicleFrame], now: datetime) -> bool:
+        """
+        Нужно ли пересчитать кадр: его нет, сменился снимок сети или такты давно не шли
+        """
+        return (frame is None or frame.version != NetworkService.get().version
+                or now - frame.time > timedelta(seconds=SIMULATION_TICK * STALE_TICKS))
+
+    @staticmethod
+    def frame() -> VehicleFrame:
+        """
+        Текущий кадр. Если фоновая задача не запущена или отстала, кадр рассчитывается при запросе
+        :return: кадр
+        """
+        frame = _state["frame"]
+        now = datetime.now()
+        if SimulationService.stale(frame, now):
+            frame = SimulationService.step(now)
+        return frame
+
+    @staticmethod
+    async def current() -> VehicleFrame:
+        """
+        Текущий кадр для обработчиков в цикле событий: устаревший кадр пересчитывается в пуле потоков,
+        одновременные запросы ждут один пересчет
+        :return: кадр
+        """
+        frame = _state["frame"]
+        if not SimulationService.stale(frame, datetime.now()):
+            return frame
+        pending = _state["pending"]
+        if pending is None or pending.done():
+            pending = asyncio.get_running_loop().run_in_executor(None, SimulationService.step)
+            _state["pending"] = pending
+        return await asyncio.shield(pending)
+
+    @staticmethod
+    async def run() -> None:
+        """
+        Цикл тактов, выровненных по границе секунд. Такты идут, только пока есть подписчики живого канала
+        позиций (без них кадр рассчитывается по запросу), и считаются в пуле потоков, не занимая цикл событий
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                wanted = BroadcastService.routes('transport')
+                if wanted is None or wanted:
+                    await loop.run_in_executor(None, SimulationService.step)
+            except Exception as exc:
+                msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+                logging.error(msg)
+            await asyncio.sleep(SIMULATION_TICK - time.time() % SIMULATION_TICK)
+
+    @staticmethod
+    def start() -> None:
+        """
+        Запускает такты в цикле событий приложения
+        """
+        task = asyncio.get_running_loop().create_task(SimulationService.run())
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+
+    @staticmethod
+    def stats() -> dict:
+        """
+        Число тактов, время расчета последнего такта и число машин в рейсе
+        """
+        frame = _state["frame"]
+        return {"ticks": _state["ticks"], "tick_ms": round(_state["tick_ms"], 3),
+                "time": frame.stamp if frame is not None else None,
+                "vehicles": len(frame.route_ids) if frame is not None else 0}
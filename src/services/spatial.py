@@ -0,0 +1,131 @@
+import math
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Средний радиус Земли в метрах
+EARTH_RADIUS = 6371008.8
+
+# Размер ячейки сетки в метрах
+CELL_SIZE = 250.0
+
+# Запас на искажение проекции при выборе ячеек
+PROJECTION_MARGIN = 1.1
+
+
+def haversine(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Расстояния по большому кругу от точки до массива точек (или попарно между двумя массивами точек)
+    :param lat: широта точки или массив широт
+    :param lon: долгота точки или массив долгот
+    :param lats: широты точек
+    :param lons: долготы точек
+    :return: расстояния в метрах
+    """
+    lat1, lon1 = np.radians(lat), np.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StopIndex:
+    """
+    Сеточный пространственный индекс остановок.
+    Координаты проецируются на плоскость (равнопромежуточная проекция вокруг средней широты),
+    точки раскладываются по квадратным ячейкам, а точные расстояния считаются по гаверсинусу
+    только для точек из ячеек, покрывающих круг поиска.
+    """
+    __slots__ = ('ids', 'lats', 'lons', 'cell', '_cos', '_cells')
+
+    def __init__(self, ids: List[int], lats: List[float], lons: List[float], cell: float = CELL_SIZE):
+        """
+        :param ids: айди остановок
+        :param lats: широты остановок
+        :param lons: долготы остановок
+        :param cell: размер ячейки в метрах
+        """
+        self.ids = np.array(ids, dtype=np.int64)
+        self.lats = np.array(lats, dtype=np.float64)
+        self.lons = np.array(lons, dtype=np.float64)
+        self.cell = cell
+        self._cos = math.cos(math.radians(float(self.lats.mean()))) if len(self.lats) else 1.0
+
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        xs, ys = self.project(self.lats, self.lons)
+        for i, key in enumerate(zip((xs // cell).astype(np.int64).tolist(), (ys // cell).astype(np.int64).tolist())):
+            cells.setdefault(key, []).append(i)
+        self._cells: Dict[Tuple[int, int], np.ndarray] = {key: np.array(items, dtype=np.int64)
+                                                         for key, items in cells.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def project(self, lats, lons):
+        """
+        Проекция координат на плоскость в метрах
+        """
+        return (np.radians(lons) * EARTH_RADIUS * self._cos, np.radians(lats) * EARTH_RADIUS)
+
+    def within(self, lat: float, lon: float, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Позиции точек индекса в радиусе от точки (без сортировки)
+        :param lat: широта точки
+        :param lon: долгота точки
+        :param radius: радиус поиска в метрах
+        :return: позиции точек в массивах индекса и расстояния до них в метрах
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        if not len(self.ids):
+            return empty
+        x, y = self.project(lat, lon)
+        reach = radius * PROJECTION_MARGIN
+        x0, x1 = int((x - reach) // self.cell), int((x + reach) // self.cell)
+        y0, y1 = int((y - reach) // self.cell), int((y + reach) // self.cell)
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self._cells):
+            # Круг больше всей сети: проще проверить все точки
+            candidates = np.arange(len(self.ids))
+        else:
+            chunks = [self._cells[key] for key in ((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+                      if key in self._cells]
+            if not chunks:
+                return empty
+            candidates = np.concatenate(chunks)
+
+        distances = haversine(lat, lon, self.lats[candidates], self.lons[candidates])
+        inside = distances <= radius
+        return candidates[inside], distances[inside]
+
+    def nearby(self, lat: float, lon: float, radius: float, limit: int) -> List[Tuple[int, float]]:
+        """
+        Остановки в радиусе от точки, от ближней к дальней
+        :param lat: широта точки
+        :param lon: долгота точки
+        :param radius: радиус поиска в метрах
+        :param limit: максимальное число остановок
+        :return: пары (айди остановки, расстояние в метрах)
+        """
+        if limit <= 0:
+            return []
+        candidates, distances = self.within(lat, lon, radius)
+        if len(distances) > limit:
+            part = np.argpartition(distances, limit - 1)[:limit]
+            candidates, distances = candidates[part], distances[part]
+        order = np.argsort(distances, kind='stable')
+        return list(zip(self.ids[candidates[order]].tolist(), distances[order].tolist()))
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius: float) -> List[Tuple[int, float]]:
+        """
+        k ближайших остановок не дальше max_radius.
+        Радиус поиска удваивается, пока не найдено k остановок
+        :param lat: широта точки
+        :param lon: долгота точки
+        :param k: число остановок
+        :param max_radius: максимальное расстояние в метрах
+        :return: пары (айди остановки, расстояние в метрах)
+        """
+        radius = min(self.cell, max_radius)
+        while True:
+            found = self.nearby(lat, lon, radius, k)
+            if len(found) >= k or radius >= max_radius:
+                return found
+            radius = min(radius * 2, max_radius)
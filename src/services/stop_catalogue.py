@@ -0,0 +1,227 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+from src.core.constants import STOP_LIKES_TTL
+from src.services.network import NetworkService, NetworkSnapshot, StopInfo
+
+# Число последних ревизий каталога, от которых можно получить разницу
+CATALOGUE_HISTORY = 64
+# Число пользователей, для которых хранится ETag персонального каталога
+LIKES_CACHE_SIZE = 10000
+
+# Ревизия -> (предыдущая ревизия, измененные или добавленные остановки, удаленные остановки)
+_history: "OrderedDict[str, Tuple[Optional[str], FrozenSet[int], FrozenSet[int]]]" = OrderedDict()
+_state = {"catalogue": None}
+_lock = threading.Lock()
+
+# Айди пользователя -> (срок действия, ETag персонального каталога)
+_etags: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+
+class StopCatalogue:
+    """
+    Готовый к отправке каталог действующих остановок без персональных данных.
+    Ревизия - хэш содержимого, поэтому она совпадает у всех воркеров с одинаковыми данными
+    """
+    __slots__ = ('version', 'revision', 'entries', 'stops', 'body')
+
+    def __init__(self, version: int, entries: Dict[int, bytes], stops: Dict[int, StopInfo]):
+        """
+        :param version: версия снимка сети, из которого собран каталог
+        :param entries: JSON остановок по айди
+        :param stops: записи остановок по айди
+        """
+        self.version = version
+        self.entries = entries
+        self.stops = stops
+        self.body = b'[' + b','.join(entries.values()) + b']'
+        self.revision = hashlib.sha1(self.body).hexdigest()[:16]
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.revision}"'
+
+
+class StopCatalogueService:
+    @staticmethod
+    def serialize(stop: StopInfo, like: bool) -> bytes:
+        """
+        JSON остановки в формате StopModel
+        :param stop: запись остановки
+        :param like: остановка в избранном?
+        :return: JSON-текст
+        """
+        return json.dumps({"id": stop.id, "name": stop.name, "about": stop.about, "like": like,
+                           "coord": {"lat": stop.lat, "lon": stop.lon}},
+                          ensure_ascii=False, separators=(',', ':')).encode()
+
+    @staticmethod
+    def current() -> StopCatalogue:
+        """
+        Каталог для текущего снимка сети (пересобирается после изменения снимка)
+        :return: каталог
+        """
+        network = NetworkService.get()
+        catalogue = _state["catalogue"]
+        if catalogue is not None and catalogue.version >= network.version:
+            return catalogue
+        with _lock:
+            catalogue = _state["catalogue"]
+            if catalogue is None or catalogue.version < network.version:
+                catalogue = StopCatalogueService.build(network, catalogue)
+                _state["catalogue"] = catalogue
+            return catalogue
+
+    @staticmethod
+    def build(network: NetworkSnapshot, previous: Optional[StopCatalogue]) -> StopCatalogue:
+        """
+        Собирает каталог и записывает в историю разницу с предыдущей ревизией
+        :param network: снимок сети
+        :param previous: предыдущий каталог
+        :return: каталог
+        """
+        stops = {stop_id: network.stops[stop_id] for stop_id in sorted(network.stops)
+                 if network.stops[stop_id].stage > 0}
+        entries = {}
+        for stop_id, stop in stops.items():
+            if previous is not None and previous.stops.get(stop_id) == stop:
+                entries[stop_id] = previous.entries[stop_id]
+            else:
+                entries[stop_id] = StopCatalogueService.serialize(stop, False)
+        catalogue = StopCatalogue(network.version, entries, stops)
+
+        if previous is None:
+            _history[catalogue.revision] = (None, frozenset(entries), frozenset())
+        elif catalogue.revision != previous.revision:
+            changed = frozenset(stop_id for stop_id, entry in entries.items()
+                                if previous.entries.get(stop_id) != entry)
+            removed = frozenset(stop_id for stop_id in previous.entries if stop_id not in entries)
+            _history.pop(catalogue.revision, None)
+            _history[catalogue.revision] = (previous.revision, changed, removed)
+            while len(_history) > CATALOGUE_HISTORY:
+                _history.popitem(last=False)
+        return catalogue
+
+    @staticmethod
+    def personal(liked: Iterable[int]) -> Tuple[str, bytes]:
+        """
+        Каталог с отметками избранных остановок пользователя
+        :param liked: айди избранных остановок
+        :return: ETag и JSON-текст
+        """
+        catalogue = StopCatalogueService.current()
+        liked = set(liked) & catalogue.entries.keys()
+        if not liked:
+            return catalogue.etag, catalogue.body
+        likes_hash = hashlib.sha1(json.dumps(sorted(liked)).encode()).hexdigest()[:8]
+        body = b'[' + b','.join(StopCatalogueService.serialize(catalogue.stops[stop_id], True)
+                                if stop_id in liked else entry
+                                for stop_id, entry in catalogue.entries.items()) + b']'
+        return f'"{catalogue.revision}-{likes_hash}"', body
+
+    @staticmethod
+    def delta(since: str) -> bytes:
+        """
+        Изменения каталога после ревизии since.
+        Если ревизия неизвестна (устарела или получена от другой версии данных), передается весь каталог
+        :param since: ревизия, которая уже есть у клиента
+        :return: JSON-текст {"revision", "full", "stops", "removed"}
+        """
+        catalogue = StopCatalogueService.current()
+        with _lock:
+            changed, removed = set(), set()
+            revision, full = catalogue.revision, False
+            for _ in range(len(_history) + 1):
+                if revision == since:
+                    break
+                parent, step_changed, step_removed = _history.get(revision, (None, (), ()))
+                if parent is None:
+                    full = True
+                    break
+                changed |= step_changed
+                removed |= step_removed
+                revision = parent
+            else:
+                full = True
+
+        if full:
+            stops = catalogue.body
+            removed = []
+        else:
+            stops = b'[' + b','.join(catalogue.entries[stop_id] for stop_id in sorted(changed)
+                                    if stop_id in catalogue.entries) + b']'
+            removed = sorted(stop_id for stop_id in removed | changed if stop_id not in catalogue.entries)
+        return (b'{"revision":"' + catalogue.revision.encode() + b'","full":' + (b'true' if full else b'false') +
+                b',"stops":' + stops + b',"removed":' + json.dumps(removed).encode() + b'}')
+
+    @staticmethod
+    def remember(user_id: str, etag: str) -> None:
+        """
+        Запоминает ETag персонального каталога пользователя, чтобы отвечать 304 без запроса избранного к БД
+        :param user_id: айди пользователя
+        :param etag: ETag каталога с отметками избранного
+        """
+        with _lock:
+            _etags.pop(user_id, None)
+            _etags[user_id] = (time.monotonic() + STOP_LIKES_TTL, etag)
+            while len(_etags) > LIKES_CACHE_SIZE:
+                _etags.popitem(last=False)
+
+    @staticmethod
+    def remembered(user_id: str, revision: str) -> Optional[str]:
+        """
+        Запомненный ETag персонального каталога текущей ревизии
+        :param user_id: айди пользователя
+        :param revision: текущая ревизия каталога
+        :return: ETag или None, если он устарел или неизвестен
+        """
+        with _lock:
+            expires, etag = _etags.get(user_id, (0.0, ''))
+            if expires < time.monotonic() or StopCatalogueService.revision_of(etag) != revision:
+                return None
+            return etag
+
+    @staticmethod
+    def forget(user_id: str) -> None:
+        """
+        Сбрасывает запомненный ETag после изменения избранного пользователя
+        """
+        with _lock:
+            _etags.pop(user_id, None)
+
+    @staticmethod
+    def revision_of(etag: str) -> str:
+        """
+        Ревизия каталога, к которой относится ETag (без суффикса избранного)
+        """
+        return etag.removeprefix('W/').strip('"').split('-', 1)[0]
+
+    @staticmethod
+    def revision_matches(if_none_match: Optional[str], revision: str) -> bool:
+        """
+        Относится ли хотя бы один ETag заголовка If-None-Match к текущей ревизии каталога
+        :param if_none_match: значение заголовка
+        :param revision: текущая ревизия каталога
+        :return: возможен ли ответ 304
+        """
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(StopCatalogueService.revision_of(tag) == revision for tag in tags)
+
+    @staticmethod
+    def matches(if_none_match: Optional[str], etag: str) -> bool:
+        """
+        Совпадает ли заголовок If-None-Match с текущим ETag
+        :param if_none_match: значение заголовка
+        :param etag: текущий ETag
+        :return: можно ли ответить 304
+        """
+        if not if_none_match:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
@@ -1,50 +1,136 @@
 import logging
 import traceback
-from typing import List, Type, Optional
+from typing import List, Type, Optional, Tuple
 
 from fastapi import HTTPException
-from geopy.distance import geodesic
 from sqlalchemy import select, insert, delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.models.logistic import Stop, Tpu
+from src.models.logistic import Stop
 from src.models.users import Log, UserStopLikes
 from src.schemas.coord import Coord
-from src.schemas.stop import StopModel, StopUpd, StopInput
+from src.schemas.stop import StopModel, StopNearby, StopUpd, StopInput
 from src.utils.security import decode_token
+from src.services.network import NetworkService
+from src.services.stop_catalogue import StopCatalogueService
 
 
 class StopService:
     @staticmethod
-    async def get_all_stops(session: AsyncSession, token: Optional[str]) -> List[StopModel]:
+    async def get_all_stops(session: AsyncSession, token: Optional[str],
+                            if_none_match: Optional[str] = None) -> Tuple[str, Optional[bytes]]:
         """
-        Выбирает из БД все остановки в виде JSON-схем
+        Передает готовый каталог действующих остановок из снимка сети.
+        Если передан токен, в каталоге отмечаются избранные остановки пользователя.
+        Ревизия каталога в If-None-Match проверяется до разбора токена: избранное запрашивается из БД,
+        только если без него нельзя ответить
         :param token: авторизационный токен пользователя
         :param session: сессия БД
-        :return: список остановок
+        :param if_none_match: ETag каталога, который уже есть у клиента
+        :return: ETag и JSON-текст списка остановок; None вместо текста, если каталог у клиента актуален
         """
         try:
-            user_id = None
-            if token:
+            catalogue = StopCatalogueService.current()
+            fresh = StopCatalogueService.revision_matches(if_none_match, catalogue.revision)
+            user_id = StopService.token_user(token) if token else None
+            if user_id is None:
+                if fresh and StopCatalogueService.matches(if_none_match, catalogue.etag):
+                    return catalogue.etag, None
+                return catalogue.etag, catalogue.body
+
+            if fresh:
+                etag = StopCatalogueService.remembered(user_id, catalogue.revision)
+                if etag is not None and StopCatalogueService.matches(if_none_match, etag):
+                    return etag, None
+            etag, body = StopCatalogueService.personal(await StopService.user_likes(session, user_id))
+            StopCatalogueService.remember(user_id, etag)
+            if fresh and StopCatalogueService.matches(if_none_match, etag):
+                return etag, None
+            return etag, body
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+
+    @staticmethod
+    async def get_liked_stops(session: AsyncSession, token: str) -> List[int]:
+        """
+        Выбирает из БД айди избранных остановок пользователя
+        :param token: авторизационный токен пользователя
+        :param session: сессия БД
+        :return: список айди остановок (пустой, если токен недействителен)
+        """
+        try:
+            user_id = StopService.token_user(token)
+            if user_id is None:
+                return []
+            return await StopService.user_likes(session, user_id)
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.error(msg)
+            raise HTTPException(500, str(exc))
+
+    @staticmethod
+    def token_user(token: str) -> Optional[str]:
+        """
+        Айди пользователя из авторизационного токена
+        :param token: авторизационный токен пользователя
+        :return: айди пользователя; None, если токен недействителен
+        """
+        try:
+            return decode_token(token)["sub"]
+        except Exception as exc:
+            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
+            logging.warning(msg)
+            return None
+
+    @staticmethod
+    async def user_likes(session: AsyncSession, user_id: str) -> List[int]:
+        """
+        Выбирает из БД айди избранных остановок пользователя
+        :param session: сессия БД
+        :param user_id: айди пользователя
+        :return: упорядоченный список айди остановок
+        """
+        result = await session.execute(select(UserStopLikes.stop_id).where(UserStopLikes.user_id == user_id))
+        return sorted(result.scalars().all())
+
+    @staticmethod
+    async def nearby_stops(session: AsyncSession, token: Optional[str], lat: float, lon: float, radius: float,
+                           limit: int) -> List[StopNearby]:
+        """
+        Выбирает ближайшие к точке остановки по пространственному индексу снимка сети
+        :param session: сессия БД
+        :param token: авторизационный токен пользователя
+        :param lat: широта точки
+        :param lon: долгота точки
+        :param radius: радиус поиска в метрах
+        :param limit: максимальное число остановок
+        :return: список остановок от ближней к дальней
+        """
+        try:
+            network = NetworkService.get()
+            found = network.stop_index().nearby(lat, lon, radius, limit)
+
+            liked = set()
+            if token and found:
                 try:
-                    payload = decode_token(token)
-                    user_id = payload["sub"]
+                    user_id = decode_token(token)["sub"]
+                    result = await session.execute(
+                        select(UserStopLikes.stop_id).where(UserStopLikes.user_id == user_id,
+                                                            UserStopLikes.stop_id.in_([stop_id for stop_id, _ in found])))
+                    liked = set(result.scalars().all())
                 except Exception as exc:
                     msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-                    print(msg)
+                    logging.error(msg)
 
-            liked = set()
-            if user_id:
-                result = await session.execute(select(UserStopLikes).where(UserStopLikes.user_id == user_id))
-                for stop in result.scalars().all():
-                    liked.add(stop.stop_id)
             stops = []
-            result = await session.execute(select(Stop).where(Stop.stage > 0))
-            for stop in result.scalars().all():
-                stops.append(
-                    StopModel(id=stop.id, name=stop.name, about=stop.about,
-                              coord=Coord(lat=stop.lat, lon=stop.lon), like=stop.id in liked))
+            for stop_id, distance in found:
+                stop = network.stops[stop_id]
+                stops.append(StopNearby(id=stop.id, name=stop.name, about=stop.about,
+                                        coord=Coord(lat=stop.lat, lon=stop.lon), like=stop.id in liked,
+                                        distance=round(distance)))
             return stops
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -65,6 +151,7 @@ class StopService:
             user_id = payload["sub"]
             await session.execute(insert(UserStopLikes).values(user_id=user_id, stop_id=stop_id))
             await session.commit()
+            StopCatalogueService.forget(user_id)
             stop = await session.get(Stop, stop_id)
             return StopModel(id=stop.id, name=stop.name, about=stop.about,
                              coord=Coord(lat=stop.lat, lon=stop.lon), like=True)
@@ -88,6 +175,7 @@ class StopService:
             await session.execute(delete(UserStopLikes).where(UserStopLikes.user_id==user_id,
             UserStopLikes.stop_id==stop_id))
             await session.commit()
+            StopCatalogueService.forget(user_id)
             stop = await session.get(Stop, stop_id)
             return StopModel(id=stop.id, name=stop.name, about=stop.about,
                              coord=Coord(lat=stop.lat, lon=stop.lon), like=False)
@@ -134,6 +222,7 @@ class StopService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -163,56 +252,13 @@ class StopService:
             db_session.add(log)
             db_session.add(stop)
             db_session.commit()
+            NetworkService.reload()
             return StopUpd(**stop.__dict__)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
             raise HTTPException(500, str(exc))
 
-    @staticmethod
-    def reset_tpu(db_session: Session, ip: str, user_id: str) -> None:
-        """
-        Перераспределяет остановки между ТПУ
-        :param db_session:
-        :param ip: айпи редактора
-        :param user_id: айди редактора
-        :return:
-        """
-        try:
-            stops = db_session.query(Stop).order_by(Stop.id).all()
-            for stop in stops:
-                stop.tpu_id = None
-            db_session.commit()
-
-            tpus = db_session.query(Tpu).order_by(Tpu.id).all()
-            for tpu in tpus:
-                db_session.delete(tpu)
-            db_session.commit()
-
-            stops = db_session.query(Stop).order_by(Stop.id).all()
-            for i in range(len(stops)):
-                if stops[i].tpu is None:
-                    point1 = (stops[i].lat, stops[i].lon)
-                    tpu = Tpu(id=stops[i].id, name=stops[i].name + str(stops[i].id))
-                    stops[i].tpu = tpu
-                    for j in range(i + 1, len(stops)):
-                        if stops[j].tpu is None:
-                            point2 = (stops[j].lat, stops[j].lon)
-                            distance = geodesic(point1, point2).m
-                            if distance < 200:
-                                stops[j].tpu = tpu
-            log = Log(created_ip=ip,
-                      level=5,
-                      action='Пересчитал ТПУ',
-                      user_id=user_id)
-            db_session.add(log)
-            db_session.commit()
-        except Exception as exc:
-            msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-            logging.error(msg)
-            raise HTTPException(500, str(exc))
-
-
     @staticmethod
     def delete_stop(id: int, db_session: Session, ip: str, user_id: str) -> None:
         """
@@ -236,6 +282,7 @@ class StopService:
             db_session.add(log)
 
             db_session.commit()
+            NetworkService.reload()
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
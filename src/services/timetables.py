@@ -7,6 +7,7 @@ from sqlalchemy.orm import Session
 from src.models.logistic import Timetable
 from src.models.users import Log
 from src.schemas.timetable import TimetableInput, TimetableModel
+from src.services.network import NetworkService
 
 
 class TimetableService:
@@ -32,6 +33,7 @@ class TimetableService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload_timetables(data.route_id)
             return TimetableModel(**timetable.__dict__)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
@@ -50,6 +52,7 @@ class TimetableService:
         """
         try:
             timetable = db_session.get(Timetable, id)
+            route_id = timetable.route_id
             db_session.delete(timetable)
             log = Log(created_ip=ip,
                       level=3,
@@ -58,6 +61,7 @@ class TimetableService:
                       user_id=user_id)
             db_session.add(log)
             db_session.commit()
+            NetworkService.reload_timetables(route_id)
         except Exception as exc:
             msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
             logging.error(msg)
@@ -0,0 +1,122 @@
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import delete, insert, update
+from sqlalchemy.orm import Session
+
+from src.core.db import SessionLocal
+from src.models.logistic import Stop, Tpu
+from src.models.users import Log
+from src.services.jobs import JobContext
+from src.services.network import NetworkService
+from src.services.spatial import StopIndex
+
+# Как часто обновлять прогресс при кластеризации (число остановок)
+PROGRESS_STEP = 1000
+
+
+def cluster_stops(ids: List[int], lats: List[float], lons: List[float], radius: float,
+                  progress: Optional[Callable[[float], None]] = None) -> Dict[int, int]:
+    """
+    Жадная кластеризация остановок по ТПУ: остановки перебираются по возрастанию айди,
+    первая свободная остановка становится центром нового ТПУ и забирает все свободные
+    остановки ближе radius метров
+    :param ids: айди остановок
+    :param lats: широты остановок
+    :param lons: долготы остановок
+    :param radius: радиус ТПУ в метрах
+    :param progress: функция, получающая долю обработанных остановок
+    :return: словарь {айди остановки: айди центральной остановки ТПУ}
+    """
+    index = StopIndex(ids, lats, lons, cell=radius)
+    order = np.argsort(index.ids, kind='stable')
+    assigned = np.full(len(index), -1, dtype=np.int64)
+    for step, i in enumerate(order.tolist()):
+        if progress is not None and step % PROGRESS_STEP == 0:
+            progress(step / len(index))
+        if assigned[i] >= 0:
+            continue
+        positions, distances = index.within(index.lats[i], index.lons[i], radius)
+        members = positions[(distances < radius) & (assigned[positions] < 0)]
+        assigned[members] = index.ids[i]
+        assigned[i] = index.ids[i]
+    return dict(zip(index.ids.tolist(), assigned.tolist()))
+
+
+class TpuService:
+    """
+    Фоновое перераспределение остановок по транспортно-пересадочным узлам.
+    Вместо удаления всех ТПУ в БД вносится только разница с текущим разбиением
+    """
+
+    @staticmethod
+    def run(job: JobContext, radius: float, dry_run: bool, ip: str, user_id: str) -> dict:
+        """
+        Задача перераспределения в собственной сессии БД
+        :param job: состояние задачи
+        :param radius: радиус ТПУ в метрах
+        :param dry_run: только посчитать разницу, не изменяя БД
+        :param ip: айпи редактора
+        :param user_id: айди редактора
+        :return: число ТПУ и размер внесенной разницы
+        """
+        with SessionLocal() as db_session:
+            return TpuService.reset_tpu(db_session, radius, dry_run, ip, user_id, job)
+
+    @staticmethod
+    def reset_tpu(db_session: Session, radius: float, dry_run: bool, ip: str, user_id: str,
+                  job: Optional[JobContext] = None) -> dict:
+        """
+        Перераспределяет остановки между ТПУ, изменяя только отличающиеся записи
+        :param db_session: сессия БД
+        :param radius: радиус ТПУ в метрах
+        :param dry_run: только посчитать разницу, не изменяя БД
+        :param ip: айпи редактора
+        :param user_id: айди редактора
+        :param job: состояние фоновой задачи для прогресса и отмены
+        :return: число ТПУ и размер внесенной разницы
+        """
+        stops = db_session.query(Stop.id, Stop.name, Stop.lat, Stop.lon, Stop.tpu_id).order_by(Stop.id).all()
+        current_tpus = dict(db_session.query(Tpu.id, Tpu.name).all())
+
+        report = job.report if job is not None else (lambda stage, share: None)
+        report("Кластеризация", 0.0)
+        clusters = cluster_stops([stop.id for stop in stops], [stop.lat for stop in stops],
+                                 [stop.lon for stop in stops], radius,
+                                 lambda share: report("Кластеризация", share * 0.9))
+
+        # ТПУ получает айди и название своей центральной остановки
+        names = {stop.id: stop.name for stop in stops}
+        target_tpus = {tpu_id: names[tpu_id] + str(tpu_id) for tpu_id in set(clusters.values())}
+        created = [{"id": tpu_id, "name": name} for tpu_id, name in target_tpus.items()
+                   if tpu_id not in current_tpus]
+        renamed = [{"id": tpu_id, "name": name} for tpu_id, name in target_tpus.items()
+                   if tpu_id in current_tpus and current_tpus[tpu_id] != name]
+        removed = [tpu_id for tpu_id in current_tpus if tpu_id not in target_tpus]
+        moved = [{"id": stop.id, "tpu_id": clusters[stop.id]} for stop in stops
+                 if stop.tpu_id != clusters[stop.id]]
+        result = {"stops": len(stops), "tpus": len(target_tpus), "created": len(created), "renamed": len(renamed),
+                  "removed": len(removed), "moved": len(moved)}
+        if dry_run or not (created or renamed or removed or moved):
+            return result
+
+        report("Запись изменений", 0.9)
+        # Сначала создаются новые ТПУ и переносятся остановки, и только потом удаляются
+        # опустевшие узлы: каскадное удаление не должно задеть остановки
+        if created:
+            db_session.execute(insert(Tpu), created)
+        if moved:
+            db_session.execute(update(Stop), moved)
+        if removed:
+            db_session.execute(delete(Tpu).where(Tpu.id.in_(removed)))
+        if renamed:
+            db_session.execute(update(Tpu), renamed)
+        log = Log(created_ip=ip,
+                  level=5,
+                  action='Пересчитал ТПУ',
+                  information=str(result),
+                  user_id=user_id)
+        db_session.add(log)
+        db_session.commit()
+        NetworkService.reload()
+        return result
@@ -0,0 +1,60 @@
+import json
+from typing import Any
+
+from pydantic import BaseModel
+from pydantic.json import pydantic_encoder
+
+
+class RawJson:
+    """
+    Значение, которое само формирует свой JSON-текст (например, заранее закодированная геометрия)
+    """
+    __slots__ = ()
+
+    def value(self, fmt: str = 'json') -> Any:
+        raise NotImplementedError
+
+    def raw_json(self, fmt: str = 'json') -> str:
+        raise NotImplementedError
+
+
+def dumps(value: Any, fmt: str = 'json') -> str:
+    """
+    Сериализует ответ в JSON, вставляя фрагменты RawJson как есть.
+    Модели, собранные через construct(), не проходят повторную валидацию
+
+    :param value: модель, список, словарь или простое значение
+    :param fmt: формат фрагментов RawJson
+    :return: JSON-текст
+    """
+    if isinstance(value, RawJson):
+        return value.raw_json(fmt)
+    if isinstance(value, BaseModel):
+        value = value.__dict__
+    if isinstance(value, dict):
+        return '{' + ','.join(f'{json.dumps(str(key), ensure_ascii=False)}:{dumps(item, fmt)}'
+                              for key, item in value.items()) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join(dumps(item, fmt) for item in value) + ']'
+    return json.dumps(value, ensure_ascii=False, default=pydantic_encoder)
+
+
+def plain(value: Any, fmt: str = 'json') -> Any:
+    """
+    Переводит ответ в простые типы Python для двоичных форматов
+
+    :param value: модель, список, словарь или простое значение
+    :param fmt: формат фрагментов RawJson
+    :return: словари, списки и скаляры
+    """
+    if isinstance(value, RawJson):
+        return value.value(fmt)
+    if isinstance(value, BaseModel):
+        value = value.__dict__
+    if isinstance(value, dict):
+        return {str(key): plain(item, fmt) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(item, fmt) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return pydantic_encoder(value)
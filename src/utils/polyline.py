@@ -0,0 +1,67 @@
+from typing import Iterable, List, Tuple
+
+# Точность формата Google Encoded Polyline: 5 знаков после запятой
+PRECISION = 5
+
+
+def encode_value(value: int) -> str:
+    """
+    Кодирует одно целое число (уже умноженное на 10^precision) в символы encoded polyline
+
+    :param value: целое число
+    :return: закодированная строка
+    """
+    value = ~(value << 1) if value < 0 else value << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def encode(points: Iterable[Tuple[float, float]], precision: int = PRECISION) -> str:
+    """
+    Кодирует последовательность точек в строку Google Encoded Polyline
+
+    :param points: пары (широта, долгота)
+    :param precision: число знаков после запятой
+    :return: закодированная строка
+    """
+    factor = 10 ** precision
+    result = []
+    last_lat, last_lon = 0, 0
+    for lat, lon in points:
+        lat, lon = round(lat * factor), round(lon * factor)
+        result.append(encode_value(lat - last_lat))
+        result.append(encode_value(lon - last_lon))
+        last_lat, last_lon = lat, lon
+    return ''.join(result)
+
+
+def decode(text: str, precision: int = PRECISION) -> List[Tuple[float, float]]:
+    """
+    Раскодирует строку Google Encoded Polyline
+
+    :param text: закодированная строка
+    :param precision: число знаков после запятой
+    :return: пары (широта, долгота)
+    """
+    factor = 10 ** precision
+    values = []
+    value, shift = 0, 0
+    for char in text:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+
+    points = []
+    lat, lon = 0, 0
+    for i in range(0, len(values) - 1, 2):
+        lat += values[i]
+        lon += values[i + 1]
+        points.append((lat / factor, lon / factor))
+    return points
@@ -0,0 +1,37 @@
+from typing import Any
+
+import msgpack
+from fastapi import Response
+
+from src.utils.json_writer import dumps, plain
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def negotiate(accept: str) -> str:
+    """
+    Выбирает тип содержимого ответа по заголовку Accept
+
+    :param accept: заголовок Accept
+    :return: application/msgpack или application/json
+    """
+    accept = (accept or '').lower()
+    if any(media_type in accept for media_type in MSGPACK_TYPES):
+        return "application/msgpack"
+    return "application/json"
+
+
+def render(value: Any, accept: str, fmt: str = 'json') -> Response:
+    """
+    Формирует ответ в формате, запрошенном клиентом в заголовке Accept:
+    MessagePack или JSON (по умолчанию). Сжатие gzip выполняет middleware приложения
+
+    :param value: модель, список, словарь или простое значение
+    :param accept: заголовок Accept
+    :param fmt: формат геометрии
+    :return: ответ
+    """
+    media_type = negotiate(accept)
+    if media_type == "application/msgpack":
+        return Response(content=msgpack.packb(plain(value, fmt), use_bin_type=True), media_type=media_type)
+    return Response(content=dumps(value, fmt), media_type=media_type)
@@ -0,0 +1,58 @@
+import math
+from typing import List, Optional, Tuple
+
+# Масштаб тайлов, по которым индексируются точки (около 2.4 км по долготе на широте 56°)
+TILE_ZOOM = 14
+
+# Предел широты проекции Меркатора
+MAX_LAT = 85.05112878
+
+# Если область покрывает больше строк тайлов, фильтр по тайлам не используется
+MAX_TILE_ROWS = 64
+
+
+def tile_xy(lat: float, lon: float, zoom: int = TILE_ZOOM) -> Tuple[int, int]:
+    """
+    Номер тайла веб-Меркатора, содержащего точку
+    :param lat: широта
+    :param lon: долгота
+    :param zoom: масштаб
+    :return: (x, y)
+    """
+    n = 1 << zoom
+    lat = math.radians(max(-MAX_LAT, min(MAX_LAT, lat)))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(lat)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_key(lat: float, lon: float) -> int:
+    """
+    Ключ тайла для индекса: тайлы одной строки идут подряд
+    :param lat: широта
+    :param lon: долгота
+    :return: y * 2^TILE_ZOOM + x
+    """
+    x, y = tile_xy(lat, lon)
+    return (y << TILE_ZOOM) + x
+
+
+def tile_ranges(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+                margin: int = 1) -> Optional[List[Tuple[int, int]]]:
+    """
+    Диапазоны ключей тайлов, покрывающих прямоугольную область (по одному на строку тайлов)
+    :param min_lat: южная граница
+    :param min_lon: западная граница
+    :param max_lat: северная граница
+    :param max_lon: восточная граница
+    :param margin: запас в тайлах на погрешность вычисления ключей в БД
+    :return: список пар (первый ключ, последний ключ) или None, если область слишком велика
+    """
+    n = 1 << TILE_ZOOM
+    x0, y0 = tile_xy(max_lat, min_lon)
+    x1, y1 = tile_xy(min_lat, max_lon)
+    x0, x1 = max(x0 - margin, 0), min(x1 + margin, n - 1)
+    y0, y1 = max(y0 - margin, 0), min(y1 + margin, n - 1)
+    if y1 - y0 + 1 > MAX_TILE_ROWS or x0 > x1:
+        return None
+    return [((y << TILE_ZOOM) + x0, (y << TILE_ZOOM) + x1) for y in range(y0, y1 + 1)]
@@ -5,7 +5,9 @@ from src.web.atps import atps_router
 from src.web.charts import charts_router
 from src.web.events import events_router
 from src.web.io import io_router
+from src.web.jobs import jobs_router
 from src.web.logs import logs_router
+from src.web.model import model_router
 from src.web.profile import profile_router
 from src.web.routes import routes_router
 from src.web.statistic import statistic_router
@@ -17,6 +19,7 @@ web_router = APIRouter(prefix="/web")
 all_routers = [
     profile_router,
     io_router,
+    jobs_router,
     stops_router,
     routes_router,
     atps_router,
@@ -25,7 +28,8 @@ all_routers = [
     admins_router,
     charts_router,
     statistic_router,
-    events_router
+    events_router,
+    model_router
 ]
 
 for router in all_routers:
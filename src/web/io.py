@@ -1,7 +1,3 @@
-import logging
-import traceback
-from http.client import HTTPException
-
 from fastapi import APIRouter, Request, UploadFile
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
@@ -10,6 +6,7 @@ from starlette.responses import JSONResponse
 
 from src.core.db import db_client
 from src.services.io import IOService
+from src.services.jobs import JobService
 
 io_router = APIRouter(
     prefix="/io",
@@ -31,38 +28,40 @@ async def import_output(request: Request):
 
 
 @io_router.post('/upload/{source}')
-async def upload_table(request: Request, source: str, table: UploadFile, db_session: Session = db_client):
+def upload_table(request: Request, source: str, table: UploadFile, mode: str = 'replace'):
     """
-    Обработчик формы загрузки страницы
+    Обработчик формы загрузки страницы: файл сохраняется, а запись в БД ставится в очередь фоновых задач;
+    ход выполнения и сводка изменений передаются по /web/jobs/{job_id}
 
     :param request: запрос сессии
     :param source: название таблицы
     :param table: ксв-файл
-    :param db_session: сессия БД
+    :param mode: replace - полная замена таблицы, upsert - обновление по первичному ключу
     :return:
     """
     if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
         return RedirectResponse("/web/profile/login", status_code=303)
-    try:
-        contents = await table.read()
-    except Exception as exc:
-        msg = '\n'.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
-        logging.error(msg)
-        raise HTTPException(500, str(exc))
-    count = IOService.upload_table(contents, source, db_session, request.session['created_ip'], request.session['id'])
-    return JSONResponse(content={"count": count}, status_code=200)
+    number = IOService.save_upload(table.file, source, mode)
+    job_id = JobService.submit('upload', IOService.run_upload, number, source, mode, request.session['created_ip'],
+                               request.session['id'], key=f'upload:{source}',
+                               params={"source": source, "mode": mode, "file": number}, user_id=request.session['id'])
+    if job_id is None:
+        return JSONResponse(content={"message": f"Таблица {source} уже загружается"}, status_code=409)
+    return JSONResponse(content={"message": "Загрузка поставлена в очередь", "job_id": job_id}, status_code=202)
 
 
 @io_router.get('/download/{source}')
-async def download_table(request: Request, source: str, db_session: Session = db_client):
+def download_table(request: Request, source: str, gzip: bool = False, db_session: Session = db_client):
     """
     Ссылка для скачивания таблицы
     :param request: запрос сессии
     :param source: название таблицы
+    :param gzip: сжать файл gzip
     :param db_session: сессия БД
     :return:
     """
     if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
         return RedirectResponse("/web/profile/login")
-    answer = IOService.download_table(source, db_session, request.session['created_ip'], request.session['id'])
+    answer = IOService.download_table(source, db_session, request.session['created_ip'], request.session['id'],
+                                      gzip)
     return answer
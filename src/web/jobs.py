@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, RedirectResponse
+
+from src.services.jobs import JobService
+
+jobs_router = APIRouter(
+    prefix="/jobs",
+    tags=["Фоновые задачи"],
+)
+
+
+@jobs_router.get('')
+def show_jobs(request: Request, limit: int = Query(50, ge=1, le=500)):
+    """
+    Передает последние фоновые задачи
+    :param request: запрос сессии
+    :param limit: число задач
+    :return:
+    """
+    if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
+        return RedirectResponse("/web/profile/login")
+    return JobService.jobs(limit)
+
+
+@jobs_router.get('/{job_id}')
+def show_job(request: Request, job_id: str):
+    """
+    Передает статус, этап, прогресс и итог фоновой задачи
+    :param request: запрос сессии
+    :param job_id: айди задачи
+    :return:
+    """
+    if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
+        return RedirectResponse("/web/profile/login")
+    return JobService.get(job_id)
+
+
+@jobs_router.post('/{job_id}/cancel')
+def cancel_job(request: Request, job_id: str):
+    """
+    Отменяет фоновую задачу
+    :param request: запрос сессии
+    :param job_id: айди задачи
+    :return:
+    """
+    if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
+        return RedirectResponse("/web/profile/login", status_code=303)
+    if not JobService.cancel(job_id):
+        return JSONResponse(content={"message": "Задача уже завершена"},
+                            status_code=409)
+    return JSONResponse(content={"message": "Задача отменяется"}, status_code=202)
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import RedirectResponse
+
+from src.services.model_prediction import MlService
+
+model_router = APIRouter(
+    prefix="/model",
+    tags=["Модель загруженности"],
+)
+
+
+@model_router.post('/reload')
+def reload_model(request: Request):
+    """
+    Загружает новую версию модели из папки model_ml без перезапуска сервера
+    :param request: запрос сессии
+    :return: сведения о загруженной модели
+    """
+    if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
+        return RedirectResponse("/web/profile/login", status_code=303)
+    return MlService.reload_model()
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Request, BackgroundTasks
+from typing import Optional
+
+from fastapi import APIRouter, Request, Query
 from fastapi.responses import RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 
-from src.core.constants import MAP_KEY
+from src.core.constants import MAP_KEY, TPU_RADIUS
 from src.core.db import db_client
 from src.schemas.stop import StopUpd, StopInput
+from src.services.jobs import JobService
 from src.services.stops import StopService
+from src.services.tpu import TpuService
 
 stops_router = APIRouter(
     prefix="/stops",
@@ -52,16 +56,21 @@ async def add_stop(request: Request, data: StopInput, db_session: Session = db_c
 
 
 @stops_router.post('/reset_tpu')
-async def reset_tpu(request: Request, background_tasks: BackgroundTasks, db_session: Session = db_client):
+def reset_tpu(request: Request, radius: Optional[float] = Query(None, gt=0, le=1000), dry_run: bool = False):
     """
-    Распределение всех остановок по пересадочным узлам
+    Ставит в очередь фоновое распределение всех остановок по пересадочным узлам;
+    ход выполнения передается по /web/jobs/{job_id}
     """
     if not request.session.keys().__contains__('id') or request.session['rang'] < 50:
         return RedirectResponse("/web/profile/login")
     ip = request.session['created_ip']
     id = request.session['id']
-    background_tasks.add_task(StopService().reset_tpu, db_session, ip, id)
-    return 200
+    radius = radius or TPU_RADIUS
+    job_id = JobService.submit('tpu', TpuService.run, radius, dry_run, ip, id, key='tpu',
+                               params={"radius": radius, "dry_run": dry_run}, user_id=id)
+    if job_id is None:
+        return JSONResponse(content={"message": "Перераспределение ТПУ уже выполняется"}, status_code=409)
+    return JSONResponse(content={"message": "Перераспределение ТПУ запущено", "job_id": job_id}, status_code=202)
 
 
 @stops_router.delete('/{id}')
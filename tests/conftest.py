@@ -0,0 +1,48 @@
+import os
+
+# Настройки, без которых не импортируется приложение; БД в тестах не используется
+for name, value in {"PORT": "8000", "DB_HOST": "localhost", "DB_PORT": "5432", "DB_USER": "test",
+                    "DB_PASS": "test", "DB_NAME": "test", "VERSION": "DEBUG"}.items():
+    os.environ.setdefault(name, value)
+
+import numpy as np
+import pytest
+
+from src.services.network import (NetworkService, NetworkSnapshot, RouteInfo, RouteSections, RouteTimetable,
+                                  StopInfo, TimetableInfo)
+
+
+def make_sections(stop_ids, coefs=None, loads=None, orders=None) -> RouteSections:
+    """
+    Участки маршрута по списку остановок
+    """
+    count = len(stop_ids)
+    return RouteSections(np.array(orders if orders is not None else range(count), dtype=np.int32),
+                         np.array(stop_ids, dtype=np.int32),
+                         np.array(coefs if coefs is not None else [1.0] * count, dtype=np.float64),
+                         np.array(loads if loads is not None else [2] * count, dtype=np.int32),
+                         np.full(count, -1, dtype=np.int32))
+
+
+def make_network(version: int = 1) -> NetworkSnapshot:
+    """
+    Небольшая сеть: три маршрута, ТПУ 100 = {4, 5} и ТПУ 200 = {7, 8}
+    """
+    routes = {i: RouteInfo(id=i, number=str(i), label=f'L{i}', title='t', info=None, stage=1, care=True)
+              for i in (1, 2, 3)}
+    stops = {i: StopInfo(id=i, name=f'S{i}', about=None, lat=55 + i * 0.01, lon=37 + i * 0.01, stage=1,
+                         tpu_id={4: 100, 5: 100, 7: 200, 8: 200}.get(i)) for i in range(1, 10)}
+    sections = {1: make_sections([1, 2, 3, 4]), 2: make_sections([5, 6, 7]), 3: make_sections([1, 6, 9, 8])}
+    timetables = {route_id: RouteTimetable([TimetableInfo(start=start, lap=60, day=None)
+                                            for start in range(300, 1400, 20)]) for route_id in (1, 2, 3)}
+    return NetworkSnapshot(version, routes, sections, stops, {}, timetables)
+
+
+@pytest.fixture
+def network(monkeypatch) -> NetworkSnapshot:
+    """
+    Снимок сети, который возвращает NetworkService.get
+    """
+    snapshot = make_network()
+    monkeypatch.setattr(NetworkService, "get", staticmethod(lambda: snapshot))
+    return snapshot
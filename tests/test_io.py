@@ -0,0 +1,217 @@
+import csv
+import gzip
+import io
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.testclient import TestClient
+
+from src.services import io as io_service
+from src.services.io import CSV_DELIMITER, CopyStream, IOService, to_array, to_integer
+
+
+def read_all(copy_stream: CopyStream, size: int = 16) -> str:
+    chunks = []
+    while True:
+        chunk = copy_stream.read(size)
+        if not chunk:
+            return ''.join(chunks)
+        chunks.append(chunk)
+
+
+def test_conversions():
+    assert to_array('[1.5, 2.0]') == '{1.5, 2.0}'
+    assert to_integer('5.0') == '5' and to_integer('12') == '12' and to_integer('2.5') == '2.5'
+
+
+def test_converters_by_column_type():
+    assert IOService.converters(IOService.table('charts'), ['id', 'lats', 'lons']) == [to_integer, to_array, to_array]
+    assert IOService.converters(IOService.table('stops'), ['name', 'lat']) == [None, None]
+
+
+def test_copy_stream():
+    rows = [['1.0', '[55.1, 55.2]', 'a;b'], ['', '', ''], ['2', '[]', 'текст "в кавычках"'], ['3.0', '', '']]
+    progress = []
+    copy_stream = CopyStream(iter(rows), [to_integer, to_array, None], lambda: progress.append(1))
+    parsed = list(csv.reader(io.StringIO(read_all(copy_stream)), delimiter=CSV_DELIMITER))
+    assert parsed == [['1', '{55.1, 55.2}', 'a;b'], ['2', '{}', 'текст "в кавычках"'], ['3', '', '']]
+    assert copy_stream.count == 3
+    assert progress
+
+
+def test_copy_stream_chunks():
+    rows = [[str(i), 'x' * 10] for i in range(1000)]
+    copy_stream = CopyStream(iter(rows), [None, None])
+    first = copy_stream.read(100)
+    assert 100 <= len(first) < 200
+    assert (first + read_all(copy_stream, 100)).count('\n') == 1000
+
+
+def test_unknown_columns_are_rejected():
+    stream = io.StringIO('id;name;color\n1;a;red\n')
+    with pytest.raises(HTTPException) as error:
+        IOService.read_header(stream, IOService.table('stops'))
+    assert error.value.status_code == 400 and 'color' in error.value.detail
+
+
+def test_unknown_table():
+    with pytest.raises(HTTPException) as error:
+        IOService.table('nope')
+    assert error.value.status_code == 404
+
+
+class FakeCursor:
+    """
+    Курсор, выполняющий COPY TO STDOUT записью заданных строк (или падающий после них)
+    """
+
+    def __init__(self, lines, error=None):
+        self.lines = lines
+        self.error = error
+
+    def copy_expert(self, sql, file):
+        for line in self.lines:
+            file.write(line)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    def use(lines, error=None):
+        cursor = FakeCursor(lines, error)
+        monkeypatch.setattr(io_service.engine_sync, "raw_connection", lambda: FakeConnection(cursor))
+    return use
+
+
+def test_export_stream(exported, monkeypatch):
+    monkeypatch.setattr(io_service, "COPY_CHUNK", 1000)
+    lines = [f'"{i}";"name {i}"\n'.encode() for i in range(500)]
+    exported(lines)
+    chunks = list(IOService.export_rows('stops'))
+    assert b''.join(chunks) == b''.join(lines)
+    assert len(chunks) > 1 and all(len(chunk) < 2000 for chunk in chunks)
+
+
+def test_export_gzip(exported):
+    lines = [b'"1";"a"\n'] * 1000
+    exported(lines)
+    assert gzip.decompress(b''.join(IOService.export_rows('stops', True))) == b''.join(lines)
+
+
+def test_export_error_reaches_reader(exported):
+    exported([b'"1";"a"\n'], RuntimeError('copy failed'))
+    with pytest.raises(RuntimeError):
+        list(IOService.export_rows('stops'))
+
+
+def test_gzip_download_is_not_compressed_again(monkeypatch):
+    body = b'"id";"name"\n' + b'"1";"a"\n' * 1000
+    monkeypatch.setattr(IOService, "export_rows", staticmethod(
+        lambda source, compress=False: iter([gzip.compress(body) if compress else body])))
+
+    class Session:
+        def add(self, log):
+            pass
+
+        def commit(self):
+            pass
+
+    app = FastAPI()
+    app.add_middleware(GZipMiddleware)
+    app.get('/download')(lambda: IOService.download_table('stops', Session(), '127.0.0.1', None, True))
+    response = TestClient(app).get('/download', headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.content == body
+
+
+class FakeResult:
+    def __init__(self, rows=(), rowcount=0):
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    def all(self):
+        return self.rows
+
+    def one(self):
+        return self.rows[0]
+
+
+class FakeSession:
+    """
+    Сессия, отвечающая на запросы upsert_rows заранее заданными результатами
+    """
+
+    def __init__(self, duplicates=(), deleted=0, inserted=0, updated=0):
+        self.duplicates = duplicates
+        self.deleted = deleted
+        self.counts = (inserted, updated)
+        self.statements = []
+
+    def execute(self, statement):
+        sql = str(statement)
+        self.statements.append(sql)
+        if 'HAVING COUNT(*) > 1' in sql:
+            return FakeResult(self.duplicates)
+        if sql.startswith('DELETE'):
+            return FakeResult(rowcount=self.deleted)
+        if sql.startswith('WITH upsert'):
+            return FakeResult([self.counts])
+        return FakeResult()
+
+
+@pytest.fixture
+def copied(monkeypatch):
+    """
+    COPY во временную таблицу: строки потока только вычитываются
+    """
+    monkeypatch.setattr(IOService, "copy_from", staticmethod(
+        lambda db_session, target, header, copy_stream: read_all(copy_stream)))
+
+
+def test_upsert_summary(copied):
+    table = IOService.table('stops')
+    header = ['id', 'name', 'lat', 'lon', 'stage']
+    rows = [[str(i), f'S{i}', '55.0', '37.0', '1'] for i in range(10)]
+    db_session = FakeSession(deleted=2, inserted=3, updated=4)
+    summary = IOService.upsert_rows(db_session, table, header, CopyStream(iter(rows), [None] * 5))
+    assert summary == {"mode": "upsert", "count": 10, "inserted": 3, "updated": 4, "deleted": 2, "unchanged": 3}
+
+    upsert = db_session.statements[-1]
+    assert 'ON CONFLICT ("id") DO UPDATE SET' in upsert and 'IS DISTINCT FROM' in upsert
+    assert '"id" = EXCLUDED."id"' not in upsert
+
+
+def test_upsert_rejects_duplicate_keys(copied):
+    table = IOService.table('sections')
+    header = [column.name for column in table.primary_key.columns]
+    db_session = FakeSession(duplicates=[(1, 2), (3, 4)])
+    with pytest.raises(HTTPException) as error:
+        IOService.upsert_rows(db_session, table, header, CopyStream(iter([]), [None] * len(header)))
+    assert error.value.status_code == 400
+    assert '(1, 2), (3, 4)' in error.value.detail
+    assert not any(sql.startswith(('DELETE', 'WITH upsert')) for sql in db_session.statements)
+
+
+def test_upsert_needs_key_columns(copied):
+    with pytest.raises(HTTPException) as error:
+        IOService.upsert_rows(FakeSession(), IOService.table('stops'), ['name'], CopyStream(iter([]), [None]))
+    assert error.value.status_code == 400
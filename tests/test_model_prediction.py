@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from src.services.model_prediction import COLUMN_ORDER, MODEL_DIR, MODEL_FILES, MlService
+
+pytest.importorskip("xgboost")
+pytestmark = pytest.mark.skipif(not all((MODEL_DIR / name).exists() for name in MODEL_FILES.values()),
+                                reason="нет файлов модели")
+
+DAYS = ['Понедельник', 'Вторник', 'Среда', 'Четверг', 'Пятница', 'Суббота', 'Воскресенье']
+
+
+def predict_pandas(model, row) -> float:
+    """
+    Прежний расчет: признаки одной поездки в DataFrame, кодирование и вызов модели
+    """
+    import pandas as pd
+
+    route_id, order, stop_id, minutes, day = row
+    hour, minute = divmod(minutes, 60)
+    features = {"route_id": route_id, "order": order, "stop_id": stop_id, "День недели": day, "hour": hour,
+                "minute": minute, "time_minutes": minutes, "day_part": MlService.get_day_part(hour),
+                "route_stop": f"{route_id}_{stop_id}",
+                "avg_passengers_route_hour": model.avg_stats.get((route_id, hour), 0)}
+    frame = pd.DataFrame([features])[COLUMN_ORDER]
+    return round(float(model.xgb_model.predict(model.encoder.transform(frame))[0]), 2)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return MlService.model()
+
+
+def test_batch_matches_pandas(model):
+    rnd = random.Random(1)
+    route_ids = sorted(model.route_ids)
+    mapping = {item['col']: item['mapping'] for item in model.encoder.ordinal_encoder.mapping}
+    stop_ids = [value for value in mapping['stop_id'].index if value == value]
+    rows = [(rnd.choice(route_ids), rnd.randint(0, 30), rnd.choice(stop_ids) if rnd.random() < 0.8 else 999999,
+             rnd.randint(0, 24 * 60 - 1), rnd.choice(DAYS)) for _ in range(200)]
+
+    predictions = MlService.predict_passengers_batch(rows)
+    for row, prediction in zip(rows, predictions):
+        assert prediction == pytest.approx(predict_pandas(model, row), abs=0.011), row
+
+
+def test_unknown_route(model):
+    unknown = max(model.route_ids) + 1
+    assert MlService.predict_passengers_batch([(unknown, 0, 1, 600, DAYS[0])]) == [None]
+
+
+def test_accumulated_adds_previous_stop(model):
+    route_id = min(model.route_ids)
+    rows = [(route_id, 0, 1, 480, DAYS[2]), (route_id, 3, 1, 480, DAYS[2])]
+    (first, first_total), (current, total) = MlService.predict_accumulated(rows, use_table=False)
+    previous, = MlService.predict_passengers_batch([(route_id, 2, 1, 480, DAYS[2])])
+    assert first_total == first
+    assert total == pytest.approx(current + previous)
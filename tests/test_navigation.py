@@ -0,0 +1,25 @@
+import datetime
+
+from src.services.network import NetworkSnapshot
+from src.services.navigation import NavigationService
+from src.services.raptor import TRANSFER_TIME, WALK_TIME
+
+
+def test_unscheduled_journeys_keep_times_of_scheduled_legs(network):
+    # У маршрута 2 нет ни графика, ни интервалов движения
+    timetables = {route_id: timetable for route_id, timetable in network.timetables.items() if route_id != 2}
+    snapshot = NetworkSnapshot(2, network.routes, network.sections, network.stops, {}, timetables)
+    journeys = NavigationService.unscheduled_journeys([1], snapshot.stop_group(8), False, 400,
+                                                      datetime.date.today(), snapshot)
+    assert len(journeys) == 1
+    journey, scheduled = journeys[0]
+    leg1, leg2 = journey.legs
+    assert (leg1.route_id, leg2.route_id) == (1, 2)
+    assert scheduled == (True, False)
+    assert leg1.depart >= 400 and leg1.arrive > leg1.depart
+    assert leg2.depart == leg2.arrive == leg1.arrive + WALK_TIME + TRANSFER_TIME
+
+
+def test_unscheduled_journeys_skip_scheduled_pairs(network):
+    assert NavigationService.unscheduled_journeys([1], network.stop_group(8), False, 400,
+                                                  datetime.date.today(), network) == []
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from src.services import navigation_cache
+from src.services.navigation_cache import NavigationCacheService
+
+
+@pytest.fixture(autouse=True)
+def cache(network, monkeypatch):
+    NavigationCacheService.clear()
+    for name in navigation_cache._stats:
+        monkeypatch.setitem(navigation_cache._stats, name, 0)
+    yield
+    NavigationCacheService.clear()
+
+
+def slow_compute(calls: list, body: bytes = b'{}', delay: float = 0.05):
+    async def compute():
+        calls.append(body)
+        await asyncio.sleep(delay)
+        return body, 'application/json'
+    return compute
+
+
+def test_concurrent_misses_are_coalesced():
+    calls = []
+
+    async def run():
+        return await asyncio.gather(*[NavigationCacheService.get_or_compute('key', slow_compute(calls))
+                                      for _ in range(5)])
+
+    entries = asyncio.run(run())
+    assert len(calls) == 1
+    assert {entry[1] for entry in entries} == {b'{}'}
+    stats = NavigationCacheService.stats()
+    assert (stats["misses"], stats["coalesced"], stats["entries"]) == (1, 4, 1)
+    assert not navigation_cache._inflight
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    calls = []
+
+    async def run():
+        leader = asyncio.create_task(NavigationCacheService.get_or_compute('key', slow_compute(calls)))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(NavigationCacheService.get_or_compute('key', slow_compute(calls)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return leader, await waiter
+
+    leader, entry = asyncio.run(run())
+    assert leader.cancelled()
+    assert entry[1] == b'{}' and len(calls) == 1
+    assert NavigationCacheService.get('key') is not None
+
+
+def test_computation_is_cancelled_without_waiters():
+    calls = []
+
+    async def run():
+        task = asyncio.create_task(NavigationCacheService.get_or_compute('key', slow_compute(calls)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert NavigationCacheService.get('key') is None
+    assert not navigation_cache._inflight and not navigation_cache._waiters
+
+
+def test_errors_reach_every_waiter():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def run():
+        return await asyncio.gather(*[NavigationCacheService.get_or_compute('key', fail) for _ in range(3)],
+                                    return_exceptions=True)
+
+    assert [type(result) for result in asyncio.run(run())] == [ValueError] * 3
+    assert NavigationCacheService.get('key') is None
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(navigation_cache, "NAVIGATION_CACHE_SIZE", 2)
+    NavigationCacheService.put('a', b'1', 'application/json')
+    NavigationCacheService.put('b', b'2', 'application/json')
+    assert NavigationCacheService.get('a') is not None
+    NavigationCacheService.put('c', b'3', 'application/json')
+    assert NavigationCacheService.get('b') is None
+    assert NavigationCacheService.get('a') is not None and NavigationCacheService.get('c') is not None
+    assert NavigationCacheService.stats()["evictions"] == 1
+
+
+def test_byte_limit(monkeypatch):
+    monkeypatch.setattr(navigation_cache, "NAVIGATION_CACHE_BYTES", 10)
+    NavigationCacheService.put('a', b'12345', 'application/json')
+    NavigationCacheService.put('b', b'12345', 'application/json')
+    NavigationCacheService.put('c', b'1', 'application/json')
+    NavigationCacheService.put('big', b'x' * 11, 'application/json')
+    stats = NavigationCacheService.stats()
+    assert NavigationCacheService.get('a') is None and NavigationCacheService.get('big') is None
+    assert stats["bytes"] == 6 and stats["entries"] == 2
+
+
+def test_expired_entry(monkeypatch):
+    monkeypatch.setattr(navigation_cache, "NAVIGATION_CACHE_TTL", -1)
+    NavigationCacheService.put('a', b'1', 'application/json')
+    assert NavigationCacheService.get('a') is None
+    assert NavigationCacheService.stats()["expired"] == 1
+
+
+def test_new_network_version_clears_cache(network, monkeypatch):
+    NavigationCacheService.put('a', b'1', 'application/json')
+    monkeypatch.setattr(network, "version", network.version + 1)
+    assert NavigationCacheService.get('a') is None
+    assert NavigationCacheService.stats()["invalidations"] == 1
@@ -0,0 +1,45 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from src.models.logistic import NetworkRevision
+from src.services import network as network_module
+from src.services.network import NetworkService
+
+
+def make_session_factory():
+    engine = create_engine("sqlite://")
+    NetworkRevision.__table__.create(engine)
+    return sessionmaker(bind=engine)
+
+
+def test_publish_increments_revision():
+    session_factory = make_session_factory()
+    with session_factory() as db_session:
+        assert NetworkService.read_revision(db_session) == 0
+        assert NetworkService.publish(db_session) == 1
+        assert NetworkService.publish(db_session) == 2
+        assert NetworkService.read_revision(db_session) == 2
+
+
+def test_check_revision_reloads_only_on_change(monkeypatch):
+    session_factory = make_session_factory()
+    monkeypatch.setattr(network_module, "SessionLocal", session_factory)
+    reloads = []
+
+    def reload(publish=True):
+        reloads.append(publish)
+        with session_factory() as db_session:
+            network_module._revision = NetworkService.read_revision(db_session)
+
+    monkeypatch.setattr(NetworkService, "reload", staticmethod(reload))
+    monkeypatch.setattr(network_module, "_revision", None)
+
+    NetworkService.check_revision()
+    NetworkService.check_revision()
+    assert reloads == [False]
+
+    # Изменение сети в другом процессе
+    with session_factory() as db_session:
+        NetworkService.publish(db_session)
+    NetworkService.check_revision()
+    assert reloads == [False, False]
@@ -0,0 +1,116 @@
+import math
+import random
+from typing import List
+
+import numpy as np
+import pytest
+
+from src.services.network import (NetworkSnapshot, RouteInfo, RouteSections, RouteTimetable, StopInfo,
+                                  TimetableInfo)
+from src.services.raptor import TRANSFER_TIME, WALK_TIME, RaptorService
+
+
+def random_network(seed: int, fifo: bool) -> NetworkSnapshot:
+    """
+    Случайная сеть; при fifo=False время рейсов различается и рейсы обгоняют друг друга
+    """
+    rnd = random.Random(seed)
+    stops = {i: StopInfo(id=i, name=f'S{i}', about=None, lat=55 + rnd.random(), lon=37 + rnd.random(), stage=1,
+                         tpu_id=100 + i // 3 if rnd.random() < 0.5 else None) for i in range(1, 31)}
+    routes, sections, timetables = {}, {}, {}
+    for route_id in range(1, 13):
+        routes[route_id] = RouteInfo(id=route_id, number=str(route_id), label=f'L{route_id}', title='t', info=None,
+                                     stage=1, care=True)
+        count = rnd.randint(3, 9)
+        sections[route_id] = RouteSections(np.arange(count, dtype=np.int32),
+                                           np.array(rnd.sample(range(1, 31), count), dtype=np.int32),
+                                           np.array([rnd.uniform(0.5, 2) for _ in range(count)]),
+                                           np.array([rnd.randint(1, 5) for _ in range(count)], dtype=np.int32),
+                                           np.full(count, -1, dtype=np.int32))
+        start, step, lap = rnd.randint(300, 400), rnd.randint(7, 30), rnd.randint(30, 90)
+        timetables[route_id] = RouteTimetable([
+            TimetableInfo(start=begin, lap=lap if fifo else rnd.randint(20, 120), day=None)
+            for begin in range(start, 1400, step)])
+    return NetworkSnapshot(seed, routes, sections, stops, {}, timetables)
+
+
+def earliest_arrival(network: NetworkSnapshot, stops_from: List[int], stops_to: List[int], fact_time: int,
+                     transfers: int) -> float:
+    """
+    Перебор всех рейсов: самое раннее прибытие не более чем с одной пересадкой
+    (на той же остановке или внутри ТПУ), как в прежнем поиске пересадок
+    """
+    targets = set(stops_to)
+
+    def group(stop_id: int) -> set:
+        tpu_id = network.stops[stop_id].tpu_id
+        return {stop_id} | set(network.tpus.get(tpu_id, ())) if tpu_id is not None else {stop_id}
+
+    def walk(stop_id: int, other_id: int) -> int:
+        return 0 if stop_id == other_id else WALK_TIME
+
+    def reach(stop_id: int, arrival: float) -> float:
+        return min((arrival + walk(stop_id, other_id) for other_id in group(stop_id) & targets), default=math.inf)
+
+    def rides(stop_id: int, ready: float, exclude: int):
+        for route_id, order in network.routes_at(stop_id, False):
+            schedule = RaptorService.route_schedule(network, route_id, None)
+            if route_id == exclude or schedule is None:
+                continue
+            route_sections = network.sections[route_id]
+            full = route_sections.full_time_coef()
+            orders = route_sections.orders.tolist()
+            position = route_sections.position(order)
+            fractions = [route_sections.before_time_coef(order) / full for order in orders]
+            for trip in range(len(schedule)):
+                if schedule.depart(trip, fractions[position]) < ready:
+                    continue
+                for i in range(position + 1, len(orders)):
+                    yield route_id, int(route_sections.stop_ids[i]), schedule.depart(trip, fractions[i])
+
+    best = math.inf
+    for stop_id in stops_from:
+        for route_id, change, arrival in rides(stop_id, fact_time, -1):
+            best = min(best, reach(change, arrival))
+            if transfers == 0 or arrival >= best:
+                continue
+            for board_stop in group(change):
+                ready = arrival + walk(change, board_stop) + TRANSFER_TIME
+                for _, alight_stop, final in rides(board_stop, ready, route_id):
+                    best = min(best, reach(alight_stop, final))
+    return best
+
+
+@pytest.mark.parametrize("fifo", [True, False])
+@pytest.mark.parametrize("transfers", [0, 1])
+def test_earliest_arrival_matches_exhaustive_search(fifo, transfers):
+    checked = 0
+    for seed in range(15):
+        network = random_network(seed, fifo)
+        rnd = random.Random(seed)
+        for _ in range(10):
+            stop_from, stop_to = rnd.sample(range(1, 31), 2)
+            fact_time = rnd.randint(300, 1300)
+            # Конечная остановка без соседей по ТПУ: до нее можно дойти пешком после высадки
+            stops_from, stops_to = [stop_from], [stop_to]
+            # До соседней по ТПУ остановки быстрее дойти пешком
+            if set(network.stop_group(stop_from)) & set(stops_to):
+                continue
+            expected = earliest_arrival(network, stops_from, stops_to, fact_time, transfers)
+            journeys = RaptorService.plan(network, stops_from, stops_to, fact_time, transfers, False)
+            found = min((journey.arrival for journey in journeys), default=math.inf)
+            assert found == pytest.approx(expected), (seed, stop_from, stop_to, fact_time)
+            checked += expected < math.inf
+    assert checked > 0
+
+
+def test_journeys_are_consistent(network):
+    journeys = RaptorService.plan(network, [1], network.stop_group(8), 400, 2, False)
+    assert journeys
+    for journey in journeys:
+        assert journey.arrival in (journey.legs[-1].arrive, journey.legs[-1].arrive + WALK_TIME)
+        assert journey.load == max(leg.load for leg in journey.legs)
+        for leg, following in zip(journey.legs, journey.legs[1:]):
+            walk = 0 if following.board_stop == leg.alight_stop else WALK_TIME
+            assert following.depart >= leg.arrive + walk + TRANSFER_TIME
+            assert following.route_id != leg.route_id
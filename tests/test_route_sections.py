@@ -0,0 +1,58 @@
+import random
+import sqlite3
+
+import pytest
+
+from tests.conftest import make_sections
+
+
+def random_sections(rnd: random.Random, gaps: bool):
+    count = rnd.randint(1, 40)
+    orders = sorted(rnd.sample(range(count * 3), count)) if gaps else list(range(count))
+    coefs = [round(rnd.uniform(0.1, 3.0), 3) for _ in range(count)]
+    loads = [rnd.randint(0, 5) for _ in range(count)]
+    return orders, coefs, loads
+
+
+@pytest.fixture
+def database():
+    """
+    Таблица участков в SQLite для запросов, которыми раньше считались промежутки маршрута
+    """
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE sections (route_id INTEGER, "order" INTEGER, coef REAL, load INTEGER)')
+    yield connection
+    connection.close()
+
+
+@pytest.mark.parametrize("gaps", [False, True])
+def test_ranges_match_sql(database, gaps):
+    rnd = random.Random(gaps)
+    for route_id in range(30):
+        orders, coefs, loads = random_sections(rnd, gaps)
+        database.executemany('INSERT INTO sections VALUES (?, ?, ?, ?)',
+                             [(route_id, order, coef, load) for order, coef, load in zip(orders, coefs, loads)])
+        sections = make_sections(list(range(len(orders))), coefs, loads, orders)
+
+        full, = database.execute('SELECT SUM(coef) FROM sections WHERE route_id = ?', (route_id,)).fetchone()
+        assert sections.full_time_coef() == pytest.approx(full)
+
+        bounds = range(-1, orders[-1] + 3)
+        for home in bounds:
+            before, = database.execute('SELECT SUM(coef) FROM sections WHERE route_id = ? AND "order" < ?',
+                                       (route_id, home)).fetchone()
+            assert sections.before_time_coef(home) == pytest.approx(before or 0.0)
+            # Пустой промежуток раньше давал NULL, новые методы возвращают 0 и None
+            for end in range(home, orders[-1] + 3):
+                time_coef, max_load = database.execute(
+                    'SELECT SUM(coef), MAX(load) FROM sections WHERE route_id = ? AND "order" >= ? AND "order" < ?',
+                    (route_id, home, end)).fetchone()
+                assert sections.time_coef(home, end) == pytest.approx(time_coef or 0.0, abs=1e-9)
+                assert sections.max_load(home, end) == max_load
+
+
+def test_position():
+    sections = make_sections([1, 2, 3, 4], orders=[2, 5, 6, 9])
+    assert [sections.position(order) for order in (0, 2, 3, 5, 9, 10)] == [0, 0, 1, 1, 3, 4]
+    contiguous = make_sections([1, 2, 3], orders=[4, 5, 6])
+    assert [contiguous.position(order) for order in (0, 4, 6, 7, 100)] == [0, 0, 2, 3, 3]
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import pytest
+
+from src.services import stop_catalogue
+from src.services.network import NetworkService
+from src.services.stop_catalogue import StopCatalogueService
+from src.services.stops import StopService
+from tests.conftest import make_network
+
+
+@pytest.fixture(autouse=True)
+def catalogue(monkeypatch):
+    monkeypatch.setitem(stop_catalogue._state, "catalogue", None)
+    monkeypatch.setattr(stop_catalogue, "_history", stop_catalogue.OrderedDict())
+    monkeypatch.setattr(stop_catalogue, "_etags", stop_catalogue.OrderedDict())
+
+
+def use(monkeypatch, snapshot):
+    monkeypatch.setattr(NetworkService, "get", staticmethod(lambda: snapshot))
+    return StopCatalogueService.current()
+
+
+def edited_network(version: int, renamed: int, removed: int, added: int):
+    snapshot = make_network(version)
+    snapshot.stops[renamed] = snapshot.stops[renamed]._replace(name='Новое имя')
+    snapshot.stops[added] = snapshot.stops[1]._replace(id=added, name=f'S{added}')
+    del snapshot.stops[removed]
+    return snapshot
+
+
+def test_full_catalogue(monkeypatch):
+    catalogue = use(monkeypatch, make_network(1))
+    stops = json.loads(catalogue.body)
+    assert [stop["id"] for stop in stops] == sorted(catalogue.stops)
+    assert all(stop["like"] is False for stop in stops)
+    assert catalogue.etag == f'"{catalogue.revision}"'
+
+
+def test_revision_depends_only_on_content(monkeypatch):
+    first = use(monkeypatch, make_network(1))
+    second = use(monkeypatch, make_network(2))
+    assert second.version == 2 and second.revision == first.revision
+
+
+def test_delta(monkeypatch):
+    first = use(monkeypatch, make_network(1))
+    second = use(monkeypatch, edited_network(2, renamed=2, removed=3, added=20))
+    third = use(monkeypatch, edited_network(3, renamed=4, removed=3, added=20))
+
+    delta = json.loads(StopCatalogueService.delta(first.revision))
+    assert delta["revision"] == third.revision and delta["full"] is False
+    assert [stop["id"] for stop in delta["stops"]] == [2, 4, 20]
+    # Остановка 2 переименована и возвращена обратно, но клиент видел только первую ревизию
+    assert [stop["name"] for stop in delta["stops"]] == ['S2', 'Новое имя', 'S20'] and delta["removed"] == [3]
+
+    delta = json.loads(StopCatalogueService.delta(second.revision))
+    assert [stop["id"] for stop in delta["stops"]] == [2, 4] and delta["removed"] == []
+
+    assert json.loads(StopCatalogueService.delta(third.revision)) == {
+        "revision": third.revision, "full": False, "stops": [], "removed": []}
+
+
+def test_unknown_revision_gets_full_catalogue(monkeypatch):
+    catalogue = use(monkeypatch, make_network(1))
+    delta = json.loads(StopCatalogueService.delta('unknown'))
+    assert delta["full"] is True and delta["removed"] == []
+    assert delta["stops"] == json.loads(catalogue.body)
+
+
+def test_personal_catalogue(monkeypatch):
+    catalogue = use(monkeypatch, make_network(1))
+    assert StopCatalogueService.personal([]) == (catalogue.etag, catalogue.body)
+    assert StopCatalogueService.personal([999]) == (catalogue.etag, catalogue.body)
+    etag, body = StopCatalogueService.personal([3, 5])
+    assert etag.startswith(f'"{catalogue.revision}-') and etag != catalogue.etag
+    assert etag == StopCatalogueService.personal([5, 3])[0]
+    assert {stop["id"] for stop in json.loads(body) if stop["like"]} == {3, 5}
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False), ('', False), ('"abc"', True), ('W/"abc"', True), ('"x", "abc"', True), ('*', True),
+    ('"abd"', False)])
+def test_matches(header, expected):
+    assert StopCatalogueService.matches(header, '"abc"') is expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False), ('"abc"', True), ('W/"abc-1234"', True), ('"x", "abc-1"', True), ('*', True),
+    ('"abd-1234"', False)])
+def test_revision_matches(header, expected):
+    assert StopCatalogueService.revision_matches(header, 'abc') is expected
+
+
+def test_all_stops_answers_304_without_loading_likes(monkeypatch):
+    catalogue = use(monkeypatch, make_network(1))
+    queries = []
+
+    async def user_likes(session, user_id):
+        queries.append(user_id)
+        return [3]
+
+    monkeypatch.setattr(StopService, "token_user", staticmethod(lambda token: token))
+    monkeypatch.setattr(StopService, "user_likes", staticmethod(user_likes))
+
+    # Без токена избранное не запрашивается
+    assert asyncio.run(StopService.get_all_stops(None, None, catalogue.etag)) == (catalogue.etag, None)
+    assert asyncio.run(StopService.get_all_stops(None, None, '"old"')) == (catalogue.etag, catalogue.body)
+
+    # Первый запрос пользователя читает избранное, повторная проверка ETag - нет
+    etag, body = asyncio.run(StopService.get_all_stops(None, 'user', None))
+    assert body is not None and queries == ['user']
+    assert asyncio.run(StopService.get_all_stops(None, 'user', etag)) == (etag, None)
+    assert queries == ['user']
+
+    # После изменения избранного ETag проверяется по БД
+    StopCatalogueService.forget('user')
+    assert asyncio.run(StopService.get_all_stops(None, 'user', etag)) == (etag, None)
+    assert queries == ['user', 'user']
+
+    # Ревизия каталога у клиента устарела: полный каталог
+    etag, body = asyncio.run(StopService.get_all_stops(None, 'user', '"old-1234"'))
+    assert body is not None
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+from geopy.distance import geodesic
+
+from src.services.tpu import cluster_stops
+
+RADIUS = 200
+
+
+def cluster_geodesic(ids, lats, lons, radius):
+    """
+    Прежний перебор всех пар: остановки по возрастанию айди, свободная остановка становится центром ТПУ
+    и забирает свободные остановки ближе radius метров
+    """
+    order = sorted(range(len(ids)), key=lambda i: ids[i])
+    assigned = {}
+    for position, i in enumerate(order):
+        if ids[i] in assigned:
+            continue
+        assigned[ids[i]] = ids[i]
+        for j in order[position + 1:]:
+            if ids[j] not in assigned and geodesic((lats[i], lons[i]), (lats[j], lons[j])).meters < radius:
+                assigned[ids[j]] = ids[i]
+    return assigned
+
+
+def random_stops(rnd: random.Random, count: int):
+    """
+    Остановки в квадрате около 1.5 км. Наборы с парами на расстоянии около радиуса отбрасываются:
+    сферическое расстояние отличается от эллипсоидального на доли процента
+    """
+    while True:
+        ids = rnd.sample(range(1, 10000), count)
+        lats = [55.75 + rnd.uniform(0, 0.0135) for _ in range(count)]
+        lons = [37.60 + rnd.uniform(0, 0.024) for _ in range(count)]
+        distances = [geodesic((lats[i], lons[i]), (lats[j], lons[j])).meters
+                     for i in range(count) for j in range(i + 1, count)]
+        if all(abs(distance - RADIUS) > 1.5 for distance in distances):
+            return ids, lats, lons
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_geodesic_loop(seed):
+    ids, lats, lons = random_stops(random.Random(seed), 40)
+    assert cluster_stops(ids, lats, lons, RADIUS) == cluster_geodesic(ids, lats, lons, RADIUS)
+
+
+def test_progress_and_empty():
+    shares = []
+    assert cluster_stops([], [], [], RADIUS) == {}
+    ids = list(range(1, 2001))
+    result = cluster_stops(ids, [55.0 + i * 0.01 for i in ids], [37.0] * len(ids), RADIUS, shares.append)
+    assert result == {stop_id: stop_id for stop_id in ids}
+    assert shares and shares == sorted(shares) and shares[-1] < 1